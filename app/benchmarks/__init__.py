@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+
+class DisableMigrations:
+    def __contains__(self, item):
+        return True
+
+    def __getitem__(self, item):
+        return None
+
+
+def setup_django(sqlite_database=False):
+    """sqlite_database sets up a throwaway in-memory database and media root, like tests do"""
+    os.environ.setdefault(
+        'DJANGO_SETTINGS_MODULE',
+        f'project_configuration.settings.{os.environ.get("ENVIRONMENT")}'
+    )
+    import django
+    from django.conf import settings
+    if sqlite_database:
+        settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}}
+        settings.MIGRATION_MODULES = DisableMigrations()
+        settings.DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
+        settings.MEDIA_ROOT = tempfile.mkdtemp(prefix='benchmark_media_')
+    django.setup()
+    if sqlite_database:
+        from django.core.management import call_command
+        call_command('migrate', run_syncdb=True, verbosity=0)
@@ -0,0 +1,43 @@
+"""Compare the dispatch overhead of a MessageBus built on every request, like the HTTP views
+used to do, with the frozen bus kept by the process registry.
+
+Usage: python -m benchmarks.message_bus_dispatch [--number 2000] [--repeat 5]
+"""
+import argparse
+import timeit
+
+from benchmarks import setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from message_bus.registry import buses, CHARGE_ORDER_BUS, FULFILL_SHOUTOUT_REQUEST_BUS
+    from message_bus.routes import build_charge_order_bus, build_fulfill_shoutout_request_bus
+    from request_shoutout.domain.messages import CapturePaymentFailedEvent
+
+    # A message nobody subscribes to, so only the bus overhead is measured
+    message = CapturePaymentFailedEvent(order_hash=None)
+    scenarios = (
+        ('charge order bus built per request', lambda: build_charge_order_bus().handle(message)),
+        ('charge order bus from registry', lambda: buses.get(CHARGE_ORDER_BUS).handle(message)),
+        (
+            'fulfill shoutout bus built per request',
+            lambda: build_fulfill_shoutout_request_bus().handle(message),
+        ),
+        (
+            'fulfill shoutout bus from registry',
+            lambda: buses.get(FULFILL_SHOUTOUT_REQUEST_BUS).handle(message),
+        ),
+    )
+    for name, scenario in scenarios:
+        best = min(timeit.repeat(scenario, number=args.number, repeat=args.repeat))
+        print(f'{name:<40} {best / args.number * 1e6:>10.2f} µs/message')
+
+
+if __name__ == '__main__':
+    main()
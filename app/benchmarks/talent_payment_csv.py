@@ -0,0 +1,162 @@
+"""Compare the talent payment CSV export built in memory with f-strings (the former
+write_talent_payment_csv) with the streaming export, on synthetic talents stored in an
+in-memory sqlite database and the local filesystem storage.
+
+Usage: python -m benchmarks.talent_payment_csv [--talents 100000]
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta, timezone
+
+from benchmarks import setup_django
+
+
+def create_talents_to_be_paid(number_of_talents, batch_size=500):
+    from django.contrib.auth import get_user_model
+    from orders.models import Order, TalentProfit
+    from talents.models import Talent, TalentBankAccount
+
+    User = get_user_model()
+    User.objects.bulk_create(
+        (
+            User(
+                email=f'talent{index}@viggio.com.br',
+                username=f'talent{index}@viggio.com.br',
+                first_name='Nome',
+                last_name=f'Sobrenome {index}',
+            )
+            for index in range(number_of_talents)
+        ),
+        batch_size=batch_size,
+    )
+    Talent.objects.bulk_create(
+        (
+            Talent(
+                user_id=user_id,
+                phone_number='1',
+                area_code='1',
+                main_social_media='',
+                social_media_username='',
+                number_of_followers=1,
+            )
+            for user_id in User.objects.values_list('id', flat=True).iterator()
+        ),
+        batch_size=batch_size,
+    )
+    talent_ids = list(Talent.objects.values_list('id', flat=True))
+    TalentBankAccount.objects.bulk_create(
+        (
+            TalentBankAccount(
+                talent_id=talent_id,
+                fullname=f'Sobrenome, Nome {talent_id}',
+                tax_document='12345678910',
+                bank='Banco do Brasil',
+                bank_transit_number='001',
+                bank_branch_number='1234',
+                account_number=str(talent_id),
+                account_control_digit='0',
+            )
+            for talent_id in talent_ids
+        ),
+        batch_size=batch_size,
+    )
+    expiration_datetime = datetime.now(timezone.utc) + timedelta(days=4)
+    Order.objects.bulk_create(
+        (
+            Order(
+                talent_id=talent_id,
+                video_is_for='someone_else',
+                is_from='MJ',
+                is_to='Peter',
+                email='mary.jane.watson@spiderman.com',
+                is_public=True,
+                expiration_datetime=expiration_datetime,
+            )
+            for talent_id in talent_ids
+        ),
+        batch_size=batch_size,
+    )
+    TalentProfit.objects.bulk_create(
+        (
+            TalentProfit(
+                talent_id=talent_id,
+                order_id=order_id,
+                shoutout_price='100.00',
+                profit_percentage='0.75',
+                profit='75.00',
+                paid=False,
+            )
+            for order_id, talent_id in Order.objects.values_list('id', 'talent_id').iterator()
+        ),
+        batch_size=batch_size,
+    )
+
+
+def in_memory_export(month, year):
+    """The former export: the whole CSV in a ContentFile, bank accounts and users lazy loaded"""
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from talents.management.services.payment import (
+        get_talents_to_be_paid_in_the_month,
+        TALENT_PAYMENT_CSV_HEADER,
+    )
+
+    talents = get_talents_to_be_paid_in_the_month(month, year).select_related(None)
+    content = ContentFile(b'')
+    content.write(bytes(','.join(TALENT_PAYMENT_CSV_HEADER), 'utf-8'))
+    for talent in talents.prefetch_related('bank_account'):
+        row = (
+            '\n'
+            f'{talent},{talent.num_profits},{talent.total_to_pay},'
+            f'{talent.bank_account.fullname},{talent.bank_account.account_number},'
+            f'{talent.bank_account.account_control_digit},'
+            f'{talent.bank_account.bank_branch_number},{talent.bank_account.tax_document},'
+            f'{talent.bank_account.bank_transit_number} - {talent.bank_account.bank},'
+        )
+        content.write(bytes(row, 'utf-8'))
+    return default_storage.save(f'benchmark/in_memory_{month}_{year}.csv', content)
+
+
+def streaming_export(month, year):
+    from talents.management.services.payment import (
+        get_talents_to_be_paid_in_the_month,
+        write_talent_payment_csv,
+    )
+
+    return write_talent_payment_csv(get_talents_to_be_paid_in_the_month(month, year), month, year)
+
+
+def measure(name, export, month, year):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    connection.queries_log.clear()
+    tracemalloc.start()
+    started_at = time.perf_counter()
+    with CaptureQueriesContext(connection) as context:
+        export(month, year)
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f'{name:<20} {elapsed:>8.2f} s {len(context.captured_queries):>8} queries '
+        f'{peak / 1024 / 1024:>8.1f} MB peak'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--talents', type=int, default=100000)
+    args = parser.parse_args()
+
+    setup_django(sqlite_database=True)
+    print(f'Creating {args.talents} talents to be paid...')
+    create_talents_to_be_paid(args.talents)
+    today = date.today()
+    measure('in memory export', in_memory_export, today.month, today.year)
+    measure('streaming export', streaming_export, today.month, today.year)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,410 @@
+"""Measure transcoder.transcoders.transcode on synthetic clips (ffmpeg testsrc2 video with
+a sine wave audio). Every mode runs the jobs in fresh processes, with the local filesystem
+storage.
+
+throughput: the whole transcode of a shoutout (every rendition and still) across
+durations, resolutions and source codecs. It reports the wall time, the CPU time and the
+peak RSS of the worker and of ffmpeg, and the size of the stored files. The results are
+written to a JSON file, so a change to the transcoder can be compared to a former run with
+--baseline.
+
+cpu: CPU time (user + sys of the ffmpeg/ffprobe processes) of the former encode followed
+by a full decode (validate) against the single pass encode checked by ffprobe, on 720p
+clips.
+
+memory: peak RSS of a job that reads the whole upload into memory (the former transcode)
+against the streaming pipeline, per upload size. ffmpeg is replaced by a plain file copy,
+so only the memory held by the Python worker is measured.
+
+The cpu and memory modes replace the former benchmarks/transcode_cpu.py and
+benchmarks/transcode_memory.py scripts.
+
+Needs ffmpeg, except the memory mode, so run it inside the app container.
+
+Usage: python -m benchmarks.transcode_throughput [--durations 15 60]
+    [--resolutions 640x360 1280x720 1920x1080] [--codecs libx264 mpeg4] [--runs 3]
+    [--output transcode_throughput.json] [--baseline former_run.json]
+       python -m benchmarks.transcode_throughput --mode cpu [--durations 15 60] [--runs 3]
+       python -m benchmarks.transcode_throughput --mode memory [--sizes 50 100 200]
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from benchmarks import setup_django
+
+
+SOURCE_EXTENSIONS = {
+    'libx264': 'mp4',
+    'libx265': 'mp4',
+    'mpeg4': 'mov',
+    'libvpx-vp9': 'webm',
+}
+AUDIO_CODECS = {
+    'webm': 'libopus',
+}
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+
+def create_clip(file_path, duration, resolution, codec):
+    """Phone like recording, 30 fps with audio, encoded fast as the phones do"""
+    extension = os.path.splitext(file_path)[1][1:]
+    subprocess.run(
+        (
+            'ffmpeg', '-v', 'error', '-y',
+            '-f', 'lavfi', '-i', f'testsrc2=duration={duration}:size={resolution}:rate=30',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}',
+            '-c:v', codec, '-pix_fmt', 'yuv420p',
+            '-c:a', AUDIO_CODECS.get(extension, 'aac'),
+            file_path,
+        ),
+        check=True,
+    )
+
+
+def create_talent():
+    from django.contrib.auth import get_user_model
+    from talents.models import Talent
+
+    user = get_user_model().objects.create(email='talent@viggio.com.br')
+    return Talent.objects.create(
+        user=user,
+        phone_number='1',
+        area_code='1',
+        main_social_media='',
+        social_media_username='',
+        number_of_followers=1,
+    )
+
+
+def create_shoutout(clip_path):
+    from django.core.files import File
+    from orders.models import Order
+    from shoutouts.models import ShoutoutVideo
+
+    talent = create_talent()
+    order = Order.objects.create(
+        talent=talent,
+        video_is_for='someone_else',
+        is_from='MJ',
+        is_to='Peter',
+        instruction="Go Get 'em, Tiger",
+        email='customer@viggio.com.br',
+        is_public=True,
+        expiration_datetime=datetime.now(timezone.utc) + timedelta(days=1),
+    )
+    shoutout = ShoutoutVideo(order=order, talent=talent)
+    with open(clip_path, 'rb') as clip:
+        shoutout.file.save(os.path.basename(clip_path), File(clip), save=True)
+    return shoutout
+
+
+def stored_size(shoutout):
+    field_files = (
+        shoutout.file,
+        shoutout.preview_file,
+        shoutout.poster_file,
+        shoutout.thumbnails_file,
+    )
+    return sum(field_file.size for field_file in field_files if field_file)
+
+
+def cpu_time(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss é em KB no Linux
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def run_case(clip_path):
+    """Transcode a single clip, printing the measures as JSON on the last line"""
+    setup_django(sqlite_database=True)
+    from django.conf import settings
+    from transcoder.transcoders import transcode
+
+    shoutout = create_shoutout(clip_path)
+    worker_cpu_before = cpu_time(resource.RUSAGE_SELF)
+    started_at = time.perf_counter()
+    try:
+        transcode(shoutout, 'mp4')
+        wall_time = time.perf_counter() - started_at
+        shoutout.refresh_from_db()
+        output_size = stored_size(shoutout)
+    finally:
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+    measures = {
+        'wall_time': wall_time,
+        'worker_cpu_time': cpu_time(resource.RUSAGE_SELF) - worker_cpu_before,
+        'ffmpeg_cpu_time': cpu_time(resource.RUSAGE_CHILDREN),
+        'worker_peak_rss_mb': peak_rss_mb(),
+        'ffmpeg_peak_rss_mb': peak_rss_mb(resource.RUSAGE_CHILDREN),
+        'output_size': output_size,
+    }
+    print(json.dumps(measures))
+
+
+def measure_throughput(clip_path, runs):
+    """Best wall time of the runs, along with the other measures of that run"""
+    results = []
+    for _ in range(runs):
+        completed_process = subprocess.run(
+            (sys.executable, '-m', 'benchmarks.transcode_throughput', '--run', clip_path),
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+        results.append(json.loads(completed_process.stdout.splitlines()[-1]))
+    return min(results, key=lambda result: result['wall_time'])
+
+
+def ffmpeg_version():
+    completed_process = subprocess.run(('ffmpeg', '-version'), stdout=subprocess.PIPE, check=True)
+    return completed_process.stdout.decode().splitlines()[0]
+
+
+def environment():
+    setup_django()
+    from django.conf import settings
+
+    return {
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'ffmpeg': ffmpeg_version(),
+        'cpu_count': os.cpu_count(),
+        'ffmpeg_threads': settings.TRANSCODING_FFMPEG_THREADS,
+        'download_profile': settings.TRANSCODING_DOWNLOAD_PROFILE,
+        'preview_profile': settings.TRANSCODING_PREVIEW_PROFILE,
+    }
+
+
+def case_key(case):
+    return case['codec'], case['resolution'], case['duration']
+
+
+def print_case(case, baseline):
+    case_cpu_time = case['worker_cpu_time'] + case['ffmpeg_cpu_time']
+    case_peak_rss = max(case['worker_peak_rss_mb'], case['ffmpeg_peak_rss_mb'])
+    line = (
+        f'{case["codec"]:<10} {case["resolution"]:>9} {case["duration"]:>4}s '
+        f'{case["wall_time"]:>8.2f} s wall {case_cpu_time:>8.2f} s CPU '
+        f'{case_peak_rss:>8.1f} MB peak RSS '
+        f'{case["output_size"] / 1024 / 1024:>8.2f} MB stored'
+    )
+    former_case = baseline.get(case_key(case))
+    if former_case:
+        line += f' {(case["wall_time"] / former_case["wall_time"] - 1) * 100:>+7.1f}% wall time'
+    print(line)
+
+
+def load_baseline(path):
+    if not path:
+        return {}
+    with open(path) as baseline_file:
+        return {case_key(case): case for case in json.load(baseline_file)['cases']}
+
+
+def compare_throughput(args):
+    baseline = load_baseline(args.baseline)
+    report = {'environment': environment(), 'cases': []}
+    with tempfile.TemporaryDirectory() as working_directory:
+        for codec in args.codecs:
+            for resolution in args.resolutions:
+                for duration in args.durations:
+                    clip_path = os.path.join(
+                        working_directory,
+                        f'{codec}-{resolution}-{duration}.{SOURCE_EXTENSIONS[codec]}',
+                    )
+                    create_clip(clip_path, duration, resolution, codec)
+                    case = {
+                        'codec': codec,
+                        'resolution': resolution,
+                        'duration': duration,
+                        'input_size': os.path.getsize(clip_path),
+                        'runs': args.runs,
+                    }
+                    case.update(measure_throughput(clip_path, args.runs))
+                    report['cases'].append(case)
+                    print_case(case, baseline)
+                    os.remove(clip_path)
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'Results written to {args.output}')
+
+
+def encode_and_decode(input_file, output_file):
+    from transcoder.profiles import get_download_profile
+    from transcoder.transcoders import convert, probe_video, validate
+
+    convert(input_file, [(get_download_profile(), output_file)], probe_video(input_file))
+    validate(output_file)
+
+
+def single_pass(input_file, output_file):
+    from transcoder.profiles import get_download_profile
+    from transcoder.transcoders import check_container, convert, probe_video
+
+    outputs = [(get_download_profile(), output_file)]
+    check_container(output_file, convert(input_file, outputs, probe_video(input_file)))
+
+
+CPU_PASSES = {
+    'encode + decode': encode_and_decode,
+    'single pass': single_pass,
+}
+
+
+def measure_cpu_time(name, encode_pass, input_file, working_directory, runs):
+    cpu_times = []
+    for run in range(runs):
+        output_file = os.path.join(working_directory, f'output-{run}.mp4')
+        started_at = cpu_time(resource.RUSAGE_CHILDREN)
+        encode_pass(input_file, output_file)
+        cpu_times.append(cpu_time(resource.RUSAGE_CHILDREN) - started_at)
+        os.remove(output_file)
+    print(f'{name:<16} {min(cpu_times):>8.2f} s CPU (best of {runs})')
+
+
+def compare_cpu_time(args):
+    setup_django()
+    with tempfile.TemporaryDirectory() as working_directory:
+        for duration in args.durations:
+            input_file = os.path.join(working_directory, f'input-{duration}.mp4')
+            create_clip(input_file, duration, '1280x720', 'libx264')
+            print(f'{duration}s video')
+            for name, encode_pass in CPU_PASSES.items():
+                measure_cpu_time(name, encode_pass, input_file, working_directory, args.runs)
+
+
+def fake_convert(input_file, outputs, video):
+    for _, output_file in outputs:
+        shutil.copyfile(input_file, output_file)
+
+
+def create_uploaded_video(size_mb):
+    from django.conf import settings
+    from talents.models import PresentationVideo
+
+    talent = create_talent()
+    name = 'presentation-video/uploaded.mov'
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, 'presentation-video'))
+    with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as uploaded_video:
+        for _ in range(size_mb):
+            uploaded_video.write(os.urandom(WRITE_CHUNK_SIZE))
+    return PresentationVideo.objects.create(talent=talent, file=name)
+
+
+def in_memory_transcode(video, extension):
+    """The former transcode: the upload read at once and written to a temporary file"""
+    from django.core.files import File
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        input_file_path = os.path.join(working_directory, 'input')
+        output_file_path = os.path.join(working_directory, f'tempoutput.{extension}')
+        with open(input_file_path, 'wb') as container_file:
+            container_file.write(video.file.file.read())
+        shutil.copyfile(input_file_path, output_file_path)
+        with open(output_file_path, 'rb') as transcoded_video:
+            video.file.save(f'transcoded_video.{extension}', File(transcoded_video), save=True)
+
+
+def streaming_transcode(video, extension):
+    from transcoder.transcoders import transcode, VideoInfo
+
+    probe_video = mock.Mock(return_value=VideoInfo(720, 1280, 15.0))
+    with mock.patch('transcoder.transcoders.convert', fake_convert), \
+            mock.patch('transcoder.transcoders.probe_video', probe_video), \
+            mock.patch('transcoder.transcoders.check_container', mock.Mock()):
+        transcode(video, extension)
+
+
+MEMORY_PIPELINES = {
+    'in memory': in_memory_transcode,
+    'streaming': streaming_transcode,
+}
+
+
+def run_pipeline(pipeline, size_mb):
+    """Run a single pipeline, printing the peak RSS before and after it on the last line"""
+    setup_django(sqlite_database=True)
+    from django.conf import settings
+
+    video = create_uploaded_video(size_mb)
+    rss_before = peak_rss_mb()
+    try:
+        MEMORY_PIPELINES[pipeline](video, 'mp4')
+    finally:
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+    print(f'{rss_before:.1f} {peak_rss_mb():.1f}')
+
+
+def measure_peak_rss(pipeline, size_mb):
+    completed_process = subprocess.run(
+        (
+            sys.executable, '-m', 'benchmarks.transcode_throughput',
+            '--run-pipeline', pipeline, str(size_mb),
+        ),
+        stdout=subprocess.PIPE,
+        check=True,
+    )
+    rss_before, rss_after = map(float, completed_process.stdout.split()[-2:])
+    print(
+        f'{pipeline:<12} {size_mb:>6} MB video {rss_after:>8.1f} MB peak RSS '
+        f'{rss_after - rss_before:>8.1f} MB held by the job'
+    )
+
+
+def compare_peak_rss(args):
+    for size_mb in args.sizes:
+        for pipeline in MEMORY_PIPELINES:
+            measure_peak_rss(pipeline, size_mb)
+
+
+MODES = {
+    'throughput': compare_throughput,
+    'cpu': compare_cpu_time,
+    'memory': compare_peak_rss,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', choices=list(MODES), default='throughput')
+    parser.add_argument('--durations', type=int, nargs='+', default=[15, 60])
+    parser.add_argument(
+        '--resolutions', nargs='+', default=['640x360', '1280x720', '1920x1080']
+    )
+    parser.add_argument(
+        '--codecs', nargs='+', default=['libx264', 'mpeg4'], choices=sorted(SOURCE_EXTENSIONS)
+    )
+    parser.add_argument('--sizes', type=int, nargs='+', default=[50, 100, 200])
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', default='transcode_throughput.json')
+    parser.add_argument('--baseline', help='JSON written by a former run, to compare with')
+    parser.add_argument('--run', metavar='CLIP', help=argparse.SUPPRESS)
+    parser.add_argument(
+        '--run-pipeline', nargs=2, metavar=('PIPELINE', 'SIZE_MB'), help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.run:
+        run_case(args.run)
+    elif args.run_pipeline:
+        pipeline, size_mb = args.run_pipeline
+        run_pipeline(pipeline, int(size_mb))
+    else:
+        MODES[args.mode](args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
 from django.utils.text import slugify
@@ -14,6 +16,11 @@ def upload_location(instance, filename):
     return f'avatar/user-{instance.user.id}/{name}.{extension}'
 
 
+def direct_upload_location(user_id, extension):
+    """Storage key of an avatar uploaded by the browser, before it's resized"""
+    return f'avatar/user-{user_id}/upload-{uuid.uuid4().hex}{extension}'
+
+
 class Customer(BaseModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     avatar = models.ImageField(upload_to=upload_location, max_length=100, null=True)
@@ -0,0 +1,5 @@
+from django.apps import AppConfig
+
+
+class DirectUploadsConfig(AppConfig):
+    name = 'direct_uploads'
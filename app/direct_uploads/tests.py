@@ -0,0 +1,121 @@
+import importlib
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings, RequestFactory, TestCase
+from rest_framework import status
+
+from . import urls
+from .uploaders import (
+    DirectUploadError,
+    finish_upload,
+    GoogleCloudUploader,
+    start_upload,
+)
+
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='direct_uploads_tests_')
+KEY = 'media/uploads/video.mp4'
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class LocalUploadTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='talent@viggio.com.br')
+        self.content = os.urandom(1000)
+        request = RequestFactory().post('/')
+        request.user = self.user
+        upload = start_upload(request, KEY, 'test', 'video/mp4', len(self.content))
+        self.upload_url = upload['upload_url']
+        self.upload_key = upload['upload_key']
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def put(self, content, content_range):
+        return self.client.put(
+            self.upload_url,
+            content,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=content_range,
+        )
+
+    def test_upload_should_resume_from_the_received_bytes(self):
+        self.put(self.content[:400], 'bytes 0-399/1000')
+
+        response = self.put(b'', 'bytes */1000')
+        self.assertEqual(response.status_code, status.HTTP_308_PERMANENT_REDIRECT)
+        self.assertEqual(response['Range'], 'bytes=0-399')
+        response = self.put(self.content[400:], 'bytes 400-999/1000')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(finish_upload(self.upload_key, 'test', self.user.id), KEY)
+        with open(os.path.join(MEDIA_ROOT, KEY), 'rb') as uploaded_file:
+            self.assertEqual(uploaded_file.read(), self.content)
+
+    def test_chunk_out_of_order_should_not_be_written(self):
+        response = self.put(self.content[400:], 'bytes 400-999/1000')
+
+        self.assertEqual(response.status_code, status.HTTP_308_PERMANENT_REDIRECT)
+        self.assertNotIn('Range', response)
+        with self.assertRaisesRegex(DirectUploadError, 'not uploaded'):
+            finish_upload(self.upload_key, 'test', self.user.id)
+
+    def test_upload_key_should_only_be_accepted_for_its_purpose_and_user(self):
+        self.put(self.content, 'bytes 0-999/1000')
+
+        with self.assertRaisesRegex(DirectUploadError, 'another upload'):
+            finish_upload(self.upload_key, 'other', self.user.id)
+        with self.assertRaisesRegex(DirectUploadError, 'another upload'):
+            finish_upload(self.upload_key, 'test', self.user.id + 1)
+        with self.assertRaisesRegex(DirectUploadError, 'Invalid'):
+            finish_upload(self.upload_key + 'x', 'test', self.user.id)
+
+    @override_settings(DIRECT_UPLOAD_MAX_AGE=-1)
+    def test_upload_url_should_expire(self):
+        response = self.put(self.content, 'bytes 0-999/1000')
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class GoogleCloudUploaderTest(TestCase):
+
+    @mock.patch('direct_uploads.uploaders.default_storage')
+    def test_upload_session_should_be_created_on_the_media_bucket(self, mocked_storage):
+        blob = mocked_storage.bucket.blob.return_value
+        blob.create_resumable_upload_session.return_value = 'https://storage.googleapis.com/s'
+        request = RequestFactory().post('/', HTTP_ORIGIN='https://viggio.com.br')
+
+        upload_url = GoogleCloudUploader().create_session(KEY, 'video/mp4', 1000, request)
+
+        self.assertEqual(upload_url, 'https://storage.googleapis.com/s')
+        mocked_storage.bucket.blob.assert_called_once_with(KEY)
+        blob.create_resumable_upload_session.assert_called_once_with(
+            content_type='video/mp4',
+            size=1000,
+            origin='https://viggio.com.br',
+        )
+
+
+class LocalUploadURLTest(TestCase):
+
+    def tearDown(self):
+        importlib.reload(urls)
+
+    @override_settings(DEBUG=False, DIRECT_UPLOADER='direct_uploads.uploaders.GoogleCloudUploader')
+    def test_local_upload_should_not_be_served_with_the_bucket_uploader(self):
+        importlib.reload(urls)
+
+        self.assertEqual(urls.urlpatterns, [])
+
+    @override_settings(DEBUG=True, DIRECT_UPLOADER='direct_uploads.uploaders.GoogleCloudUploader')
+    def test_local_upload_should_be_served_in_debug(self):
+        importlib.reload(urls)
+
+        self.assertEqual([pattern.name for pattern in urls.urlpatterns], ['upload'])
@@ -0,0 +1,75 @@
+"""Uploads sent by the browser straight to the media storage, so large files don't go
+through the API workers.
+
+The API reserves a storage key and gives the browser a resumable upload URL for it, along
+with an upload key: the signed storage key, bound to the user and to what it was reserved
+for. Once the upload ends, the browser sends the upload key to the API instead of the file.
+"""
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+
+UPLOAD_KEY_SALT = 'direct_uploads.upload_key'
+LOCAL_UPLOAD_SALT = 'direct_uploads.local_upload'
+
+
+class DirectUploadError(Exception):
+    pass
+
+
+class GoogleCloudUploader:
+    """Resumable upload session of the Google Cloud Storage bucket of the media storage"""
+
+    def create_session(self, key, content_type, size, request):
+        blob = default_storage.bucket.blob(key)
+        return blob.create_resumable_upload_session(
+            content_type=content_type,
+            size=size,
+            # Libera o CORS do upload para o site que iniciou a sessão
+            origin=request.META.get('HTTP_ORIGIN'),
+        )
+
+
+class FileSystemUploader:
+    """Stand-in of the bucket upload sessions for the filesystem storage, used in
+    development and tests. The session URL is served by direct_uploads.views"""
+
+    def create_session(self, key, content_type, size, request):
+        token = signing.dumps({'key': key, 'size': size}, salt=LOCAL_UPLOAD_SALT)
+        return request.build_absolute_uri(reverse('direct_uploads:upload', args=[token]))
+
+
+def get_uploader():
+    return import_string(settings.DIRECT_UPLOADER)()
+
+
+def start_upload(request, key, purpose, content_type, size):
+    """Upload URL of key and the upload key to be sent back once the upload ends"""
+    upload_url = get_uploader().create_session(key, content_type, size, request)
+    upload_key = signing.dumps(
+        {'key': key, 'purpose': purpose, 'user_id': request.user.id, 'size': size},
+        salt=UPLOAD_KEY_SALT,
+    )
+    return {'upload_url': upload_url, 'upload_key': upload_key}
+
+
+def finish_upload(upload_key, purpose, user_id):
+    """Storage key of a finished upload, which the user started for purpose"""
+    try:
+        upload = signing.loads(
+            upload_key,
+            salt=UPLOAD_KEY_SALT,
+            max_age=settings.DIRECT_UPLOAD_MAX_AGE,
+        )
+    except signing.BadSignature:
+        raise DirectUploadError('Invalid or expired upload key.')
+    if upload['purpose'] != purpose or upload['user_id'] != user_id:
+        raise DirectUploadError('Upload key was issued to another upload.')
+    if not default_storage.exists(upload['key']):
+        raise DirectUploadError('File was not uploaded.')
+    if default_storage.size(upload['key']) != upload['size']:
+        raise DirectUploadError('File upload is incomplete.')
+    return upload['key']
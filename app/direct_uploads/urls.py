@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.urls import path
+
+from . import views
+
+
+app_name = 'direct_uploads'
+
+LOCAL_UPLOADER = 'direct_uploads.uploaders.FileSystemUploader'
+
+urlpatterns = []
+
+# Os uploads locais só existem em desenvolvimento e testes, nos demais ambientes o browser
+# envia o arquivo direto para o bucket
+if settings.DEBUG or settings.DIRECT_UPLOADER == LOCAL_UPLOADER:
+    urlpatterns += [
+        path('<str:token>/', views.LocalUploadAPIView.as_view(), name='upload'),
+    ]
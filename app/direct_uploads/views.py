@@ -0,0 +1,70 @@
+import os
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from rest_framework import status
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .uploaders import LOCAL_UPLOAD_SALT
+
+
+CONTENT_RANGE = re.compile(r'^bytes (?:(?P<start>\d+)-\d+|\*)/(?:\d+|\*)$')
+
+
+def incomplete_upload(received):
+    """Same answer of the bucket to an unfinished resumable upload"""
+    response = Response(status=status.HTTP_308_PERMANENT_REDIRECT)
+    if received:
+        response['Range'] = f'bytes=0-{received - 1}'
+    return response
+
+
+class LocalUploadAPIView(APIView):
+    """Resumable upload to the filesystem storage, following the protocol of the bucket
+    upload sessions: chunks are PUT with a Content-Range header and a PUT of
+    "Content-Range: bytes */<size>" asks how much was received"""
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    http_method_names = ['put']
+
+    def put(self, request, token, *args, **kwargs):
+        try:
+            upload = signing.loads(
+                token,
+                salt=LOCAL_UPLOAD_SALT,
+                max_age=settings.DIRECT_UPLOAD_MAX_AGE,
+            )
+        except signing.BadSignature:
+            return Response({'error': 'Invalid or expired upload URL.'}, status.HTTP_404_NOT_FOUND)
+        path = default_storage.path(upload['key'])
+        partial_path = f'{path}.part'
+        if os.path.exists(path):
+            return Response(status=status.HTTP_201_CREATED)
+        received = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        start = 0
+        content_range = request.META.get('HTTP_CONTENT_RANGE')
+        if content_range:
+            match = CONTENT_RANGE.match(content_range)
+            if not match:
+                return Response({'error': 'Invalid Content-Range.'}, status.HTTP_400_BAD_REQUEST)
+            if match.group('start') is None:
+                return incomplete_upload(received)
+            start = int(match.group('start'))
+        if start != received:
+            # O cliente retoma a partir do que já foi recebido
+            return incomplete_upload(received)
+        chunk = request.body
+        if received + len(chunk) > upload['size']:
+            return Response({'error': 'Upload exceeds its size.'}, status.HTTP_400_BAD_REQUEST)
+        os.makedirs(os.path.dirname(partial_path), exist_ok=True)
+        with open(partial_path, 'ab') as partial_file:
+            partial_file.write(chunk)
+        received += len(chunk)
+        if received < upload['size']:
+            return incomplete_upload(received)
+        os.replace(partial_path, path)
+        return Response(status=status.HTTP_201_CREATED)
@@ -204,6 +204,9 @@ def when_ready(server):
 
 
 def worker_exit(server, worker):
+    # Os handlers adiados do message bus ficam em memória, roda os que já foram enfileirados
+    from message_bus.dispatchers import close_deferred_dispatcher
+    close_deferred_dispatcher()
     server.log.info("Worker exited (pid: %s)", worker.pid)
 
 
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class MessageBusConfig(AppConfig):
     name = 'message_bus'
+
+    def ready(self):
+        # Wire the buses once per process, before the first request or task arrives
+        from .registry import buses
+        from . import routes  # noqa: F401
+        buses.build_all()
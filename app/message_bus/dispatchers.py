@@ -0,0 +1,162 @@
+import atexit
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from sentry_sdk import capture_exception
+
+
+# Sinal para o worker sair depois de rodar os handlers que já estavam na fila
+STOP = object()
+
+
+class InlineDispatcher:
+    """Run deferred handlers right away, in the caller thread (dev and tests default)"""
+
+    def dispatch(self, partition_key, handler, message):
+        handler(message)
+
+    def join(self):
+        pass
+
+
+class WorkerPoolDispatcher:
+    """Send deferred handlers to a pool of in-process workers.
+
+    Every partition key (e.g. an order hash) is always sent to the same worker queue, so
+    the handlers of one order run in the order they were dispatched while different
+    orders are handled concurrently. Workers are started lazily by the process that
+    dispatches, because threads don't survive the fork of gunicorn/celery workers.
+
+    The queues live in memory, so the process drains them before exiting: close() runs at
+    exit and from the gunicorn and celery worker shutdown hooks, waiting up to drain_timeout
+    seconds for the handlers already dispatched. Handlers dispatched once the pool is closed
+    run inline in the caller, nobody would take them from the queues anymore.
+    """
+
+    def __init__(self, workers, drain_timeout=None):
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self._queues = ()
+        self._threads = ()
+        self._pid = None
+        self._closed = False
+        self._lock = threading.Lock()
+        # Registrado antes do fork, vale para todos os processos filhos
+        atexit.register(self.close)
+
+    def dispatch(self, partition_key, handler, message):
+        # O lock garante que nada entra na fila depois do STOP colocado pelo close
+        with self._lock:
+            queues = self._get_queues()
+            if queues:
+                index = zlib.crc32(str(partition_key).encode()) % self.workers
+                queues[index].put((handler, message))
+                return
+        try:
+            handler(message)
+        except Exception as exc:
+            capture_exception(exc)
+
+    def join(self):
+        for jobs in self._queues:
+            jobs.join()
+
+    def close(self):
+        """Run the handlers already dispatched and stop the workers of this process"""
+        with self._lock:
+            if self._pid != os.getpid() or self._closed:
+                return
+            self._closed = True
+            for jobs in self._queues:
+                jobs.put(STOP)
+        # Fora do lock, os handlers em execução ainda podem despachar (inline) sem travar
+        deadline = None if self.drain_timeout is None else time.monotonic() + self.drain_timeout
+        for worker in self._threads:
+            worker.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def _get_queues(self):
+        """Queues of the process, started on its first dispatch, or () once it's closed.
+        Called with the lock held"""
+        if self._pid != os.getpid():
+            self._queues = tuple(queue.Queue() for _ in range(self.workers))
+            self._threads = tuple(
+                threading.Thread(target=self._work, args=(jobs,), daemon=True)
+                for jobs in self._queues
+            )
+            for worker in self._threads:
+                worker.start()
+            self._pid = os.getpid()
+            self._closed = False
+        if self._closed:
+            return ()
+        return self._queues
+
+    def _work(self, jobs):
+        while True:
+            item = jobs.get()
+            if item is STOP:
+                jobs.task_done()
+                return
+            handler, message = item
+            try:
+                handler(message)
+            except Exception as exc:
+                capture_exception(exc)
+            finally:
+                close_old_connections()
+                jobs.task_done()
+
+
+class InMemoryBroker:
+    """Broker stand-in that keeps the deferred handlers until they are explicitly run.
+
+    It lets tests check what was deferred and run it offline, partition by partition,
+    in the same order a worker would.
+    """
+
+    def __init__(self):
+        self.partitions = OrderedDict()
+
+    def dispatch(self, partition_key, handler, message):
+        self.partitions.setdefault(partition_key, deque()).append((handler, message))
+
+    def pending(self):
+        return sum(len(jobs) for jobs in self.partitions.values())
+
+    def run_pending(self):
+        while self.partitions:
+            _, jobs = self.partitions.popitem(last=False)
+            while jobs:
+                handler, message = jobs.popleft()
+                handler(message)
+
+    join = run_pending
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_deferred_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                workers = getattr(settings, 'MESSAGE_BUS_DEFERRED_WORKERS', 0)
+                _dispatcher = WorkerPoolDispatcher(
+                    workers,
+                    drain_timeout=getattr(settings, 'MESSAGE_BUS_DEFERRED_DRAIN_TIMEOUT', None),
+                ) if workers else InlineDispatcher()
+    return _dispatcher
+
+
+def close_deferred_dispatcher(**kwargs):
+    """Drain the deferred handlers of the process, called by the worker shutdown hooks"""
+    if isinstance(_dispatcher, WorkerPoolDispatcher):
+        _dispatcher.close()
@@ -1,15 +1,52 @@
 from collections import defaultdict
+from contextlib import contextmanager
+from functools import partial
+
+from .dispatchers import InlineDispatcher
+
+
+class FrozenMessageBusError(Exception):
+    pass
+
+
+@contextmanager
+def no_scope():
+    yield
 
 
 class MessageBus:
 
-    def __init__(self):
+    def __init__(self, dispatcher=None, scope=no_scope):
+        """scope is a context manager factory wrapping every handled message, messages
+        handled inside another one (e.g. events raised by units of work) are nested in it.
+        """
         self.handlers = defaultdict(list)
+        self.frozen = False
+        self.dispatcher = dispatcher or InlineDispatcher()
+        self.scope = scope
 
     def handle(self, message):
-        subscribers = self.handlers[message.NAME]
-        for handle in subscribers:
-            handle(message)
+        subscribers = self.handlers.get(message.NAME, ())
+        with self.scope():
+            for handle in subscribers:
+                handle(message)
 
-    def register(self, message, handler, *args):
+    def register(self, message, handler, *args, deferred=False, partition_key=None):
+        """Deferred handlers are sent to the dispatcher instead of running in the caller,
+        the ones sharing a partition key (default: the message name) keep their order.
+        """
+        if self.frozen:
+            raise FrozenMessageBusError(f"Can't register a handler for {message.NAME} after freeze.")
+        if deferred:
+            handler = partial(self._defer, handler, partition_key)
         self.handlers[message.NAME].append(handler)
+
+    def freeze(self):
+        """Lock the handler wiring, buses shared by the whole process must not change"""
+        self.handlers = {name: tuple(subscribers) for name, subscribers in self.handlers.items()}
+        self.frozen = True
+        return self
+
+    def _defer(self, handler, partition_key, message):
+        key = partition_key(message) if partition_key else message.NAME
+        self.dispatcher.dispatch(key, handler, message)
@@ -0,0 +1,52 @@
+import threading
+
+
+class UnknownMessageBusError(Exception):
+    pass
+
+
+class MessageBusRegistry:
+    """Keep one frozen MessageBus per name for the whole process.
+
+    Buses are built by the registered builders only once (at app startup or, at the latest,
+    on the first message) so the handlers, unit of work factories and third party clients
+    aren't created again on every HTTP request or Celery task.
+    """
+
+    def __init__(self):
+        self._builders = {}
+        self._buses = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, builder):
+        self._builders[name] = builder
+
+    def get(self, name):
+        bus = self._buses.get(name)
+        if bus is None:
+            bus = self._build(name)
+        return bus
+
+    def build_all(self):
+        for name in self._builders:
+            self.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._buses = {}
+
+    def _build(self, name):
+        with self._lock:
+            if name not in self._buses:
+                try:
+                    builder = self._builders[name]
+                except KeyError:
+                    raise UnknownMessageBusError(f'There is no MessageBus registered as {name}.')
+                self._buses[name] = builder().freeze()
+            return self._buses[name]
+
+
+buses = MessageBusRegistry()
+
+CHARGE_ORDER_BUS = 'charge_order'
+FULFILL_SHOUTOUT_REQUEST_BUS = 'fulfill_shoutout_request'
@@ -1,6 +1,11 @@
 from functools import partial
 
 from post_office.mailgun import async_mailgun_carrier
+from request_shoutout.adapters.cache.profit_percentages import (
+    cached_view_agency_profit_percentage,
+    cached_view_customized_talent_profit_percentage,
+    cached_view_default_talent_profit_percentage,
+)
 from request_shoutout.adapters.db.orm import (
     CapturePaymentUnitOfWork,
     FulfillShoutoutRequestUnitOfWork,
@@ -8,16 +13,16 @@ from request_shoutout.adapters.db.orm import (
     PersistRequestShoutoutUnitOfWork,
 )
 from request_shoutout.adapters.db.db_views import (
-    view_agency_profit_percentage,
-    view_default_talent_profit_percentage,
-    view_customized_talent_profit_percentage,
     view_order,
     view_talent,
     view_transaction_data,
 )
+from request_shoutout.adapters.db.identity_map import identity_map_scope
 from request_shoutout.domain.emails.sender import EmailSender
 from request_shoutout.domain.factories import AgencyProfitFactory, TalentProfitFactory
 from request_shoutout.domain.messages import (
+    AcceptShoutoutRequestCommand,
+    ChargeShoutoutRequestCommand,
     FulfillShoutoutRequestCommand,
     RequestShoutoutCommand,
     ShoutoutUploadedEvent,
@@ -26,7 +31,9 @@ from request_shoutout.domain.messages import (
 )
 from request_shoutout.services.request_shoutout import (
     persist_request_shoutout,
+    process_accepted_payment,
     process_payment,
+    schedule_payment_processing,
     send_info_to_customer_about_his_shoutout_request,
     notify_talent_about_new_shoutout_request,
 )
@@ -37,33 +44,84 @@ from request_shoutout.services.fulfill_shoutout_request import (
     schedule_uploaded_shoutout_transcoding,
     validate_order_can_be_fulfilled,
 )
+from request_shoutout.tasks import charge_in_background
 from transcoder.tasks import to_mp4
+from wirecard.captures import CaptureQueue
+from wirecard.client import WirecardUnreachableError
+from wirecard.services import (
+    OrderApi,
+    PaymentApi,
+    WirecardOrderApi,
+)
+from wirecard.tasks import schedule_capture_drain
+from .dispatchers import get_deferred_dispatcher
 from .garage import MessageBus
+from .registry import buses, CHARGE_ORDER_BUS, FULFILL_SHOUTOUT_REQUEST_BUS
+
+
+def with_unit_of_work(handler, unit_of_work_factory, **dependencies):
+    """Units of work keep the state of the message being handled, so every message
+    gets a new one while the rest of the dependencies are shared by the process.
+    """
+    def handle(message):
+        return handler(message, unit_of_work=unit_of_work_factory(), **dependencies)
+    return handle
+
+
+def order_partition_key(event):
+    return event.order.hash_id
 
 
 # Request Shoutout and Payment Process
-def get_charge_order_bus():
-    bus = MessageBus()
+def build_charge_order_bus():
+    bus = MessageBus(dispatcher=get_deferred_dispatcher(), scope=identity_map_scope)
+    mail_sender = EmailSender(async_mailgun_carrier)
 
     # Step 1: Create an Order, Charge and CreditCard
     bus.register(
         RequestShoutoutCommand,
-        partial(
-            persist_request_shoutout,
-            **{'unit_of_work': PersistRequestShoutoutUnitOfWork()}
-        ),
+        with_unit_of_work(persist_request_shoutout, PersistRequestShoutoutUnitOfWork),
     )
 
     # Step 2: Send payment data to be processed by third party payment gateway
     # and create a WirecardTransctionData
     bus.register(
         RequestShoutoutCommand,
-        partial(
+        with_unit_of_work(
             process_payment,
-            **{
-                'unit_of_work': PaymentProcessUnitOfWork(bus),
-                'view_order': view_order,
-            }
+            partial(
+                PaymentProcessUnitOfWork,
+                bus,
+                WirecardOrderApi(OrderApi(), PaymentApi()),
+            ),
+            view_order=view_order,
+        ),
+    )
+
+    # Asynchronous checkout, steps 1 and 2 split between the request and a task:
+    # Step 1: Create an Order, Charge and CreditCard
+    bus.register(
+        AcceptShoutoutRequestCommand,
+        with_unit_of_work(persist_request_shoutout, PersistRequestShoutoutUnitOfWork),
+    )
+    bus.register(
+        AcceptShoutoutRequestCommand,
+        partial(schedule_payment_processing, **{'charger': charge_in_background}),
+    )
+
+    # Step 2: Send payment data in background, an unreachable Wirecard is tried again. Only
+    # the requests that never reached it, since a payment POST sent twice charges twice
+    bus.register(
+        ChargeShoutoutRequestCommand,
+        with_unit_of_work(
+            process_accepted_payment,
+            partial(
+                PaymentProcessUnitOfWork,
+                bus,
+                WirecardOrderApi(OrderApi(), PaymentApi()),
+                transient_errors=(WirecardUnreachableError,),
+            ),
+            view_order=view_order,
         ),
     )
 
@@ -73,10 +131,12 @@ def get_charge_order_bus():
         partial(
             send_info_to_customer_about_his_shoutout_request,
             **{
-                'mail_sender': EmailSender(async_mailgun_carrier),
+                'mail_sender': mail_sender,
                 'view_talent': view_talent,
             }
         ),
+        deferred=True,
+        partition_key=order_partition_key,
     )
 
     # Step 4: Send email to notify talent about a new shoutout request for him
@@ -85,17 +145,19 @@ def get_charge_order_bus():
         partial(
             notify_talent_about_new_shoutout_request,
             **{
-                'mail_sender': EmailSender(async_mailgun_carrier),
+                'mail_sender': mail_sender,
                 'view_talent': view_talent,
             }
         ),
+        deferred=True,
+        partition_key=order_partition_key,
     )
     return bus
 
 
 # Fullfil Shoutout Request
-def get_fulfill_shoutout_request_bus():
-    bus = MessageBus()
+def build_fulfill_shoutout_request_bus():
+    bus = MessageBus(scope=identity_map_scope)
 
     # Step 1: Validate order
     bus.register(
@@ -109,30 +171,26 @@ def get_fulfill_shoutout_request_bus():
     # Step 2: create a ShoutoutVideo and a TalentProfit
     bus.register(
         FulfillShoutoutRequestCommand,
-        partial(
+        with_unit_of_work(
             fulfill_shoutout_request,
-            **{
-                'unit_of_work': FulfillShoutoutRequestUnitOfWork(),
-                'view_order': view_order,
-                'view_talent': view_talent,
-                'talent_profit_factory': TalentProfitFactory(
-                    view_customized_talent_profit_percentage,
-                    view_default_talent_profit_percentage,
-                ),
-                'agency_profit_factory': AgencyProfitFactory(view_agency_profit_percentage),
-            }
+            FulfillShoutoutRequestUnitOfWork,
+            view_order=view_order,
+            view_talent=view_talent,
+            talent_profit_factory=TalentProfitFactory(
+                cached_view_customized_talent_profit_percentage,
+                cached_view_default_talent_profit_percentage,
+            ),
+            agency_profit_factory=AgencyProfitFactory(cached_view_agency_profit_percentage),
         ),
     )
 
-    # Step 3: Request third party payment processor to capture payment
+    # Step 3: Enqueue the capture of the payment, captured in batches by a worker
     bus.register(
         FulfillShoutoutRequestCommand,
-        partial(
+        with_unit_of_work(
             capture_payment,
-            **{
-                'unit_of_work': CapturePaymentUnitOfWork(bus),
-                'view_transaction_data': view_transaction_data,
-            }
+            partial(CapturePaymentUnitOfWork, bus, CaptureQueue(schedule_capture_drain)),
+            view_transaction_data=view_transaction_data,
         ),
     )
 
@@ -164,3 +222,15 @@ def get_fulfill_shoutout_request_bus():
         ),
     )
     return bus
+
+
+buses.register(CHARGE_ORDER_BUS, build_charge_order_bus)
+buses.register(FULFILL_SHOUTOUT_REQUEST_BUS, build_fulfill_shoutout_request_bus)
+
+
+def get_charge_order_bus():
+    return buses.get(CHARGE_ORDER_BUS)
+
+
+def get_fulfill_shoutout_request_bus():
+    return buses.get(FULFILL_SHOUTOUT_REQUEST_BUS)
@@ -0,0 +1,144 @@
+import threading
+import time
+from unittest import mock
+
+from message_bus.dispatchers import InMemoryBroker, WorkerPoolDispatcher
+from message_bus.garage import MessageBus
+
+
+class FakeEvent:
+    NAME = 'FakeEvent'
+
+    def __init__(self, order_hash, number):
+        self.order_hash = order_hash
+        self.number = number
+
+
+def order_hash_key(event):
+    return event.order_hash
+
+
+class TestDeferredHandlers:
+
+    def setup_method(self):
+        self.handled = []
+        self.broker = InMemoryBroker()
+        self.bus = MessageBus(dispatcher=self.broker)
+        self.bus.register(FakeEvent, lambda event: self.handled.append(('inline', event.number)))
+        self.bus.register(
+            FakeEvent,
+            lambda event: self.handled.append(('deferred', event.number)),
+            deferred=True,
+            partition_key=order_hash_key,
+        )
+
+    def test_it_should_not_run_deferred_handlers_on_handle(self):
+        self.bus.handle(FakeEvent('order-1', 1))
+        assert self.handled == [('inline', 1)]
+        assert self.broker.pending() == 1
+
+    def test_it_should_run_deferred_handlers_when_broker_runs_pending_jobs(self):
+        self.bus.handle(FakeEvent('order-1', 1))
+        self.broker.run_pending()
+        assert self.handled == [('inline', 1), ('deferred', 1)]
+        assert self.broker.pending() == 0
+
+    def test_it_should_keep_order_by_partition_key(self):
+        self.bus.handle(FakeEvent('order-1', 1))
+        self.bus.handle(FakeEvent('order-2', 2))
+        self.bus.handle(FakeEvent('order-1', 3))
+        self.handled.clear()
+        self.broker.run_pending()
+        assert self.handled == [('deferred', 1), ('deferred', 3), ('deferred', 2)]
+
+    def test_it_should_use_message_name_as_default_partition_key(self):
+        bus = MessageBus(dispatcher=self.broker)
+        bus.register(FakeEvent, print, deferred=True)
+        bus.handle(FakeEvent('order-1', 1))
+        assert list(self.broker.partitions) == ['FakeEvent']
+
+    def test_it_should_run_deferred_handlers_inline_by_default(self):
+        handled = []
+        bus = MessageBus()
+        bus.register(FakeEvent, lambda event: handled.append(event.number), deferred=True)
+        bus.handle(FakeEvent('order-1', 1))
+        assert handled == [1]
+
+
+@mock.patch('message_bus.dispatchers.close_old_connections', mock.Mock())
+class TestWorkerPoolDispatcher:
+
+    def test_it_should_keep_handlers_order_by_partition_key(self):
+        handled = []
+        dispatcher = WorkerPoolDispatcher(workers=3)
+        for number in range(50):
+            dispatcher.dispatch('order-1', lambda number: handled.append(number), number)
+        dispatcher.join()
+        assert handled == list(range(50))
+
+    def test_it_should_run_handlers_outside_caller_thread(self):
+        threads = []
+        dispatcher = WorkerPoolDispatcher(workers=2)
+        dispatcher.dispatch('order-1', lambda _: threads.append(threading.current_thread()), None)
+        dispatcher.join()
+        assert threads[0] is not threading.current_thread()
+
+    @mock.patch('message_bus.dispatchers.capture_exception')
+    def test_it_should_report_handler_errors_and_keep_working(self, capture_exception):
+        handled = []
+        dispatcher = WorkerPoolDispatcher(workers=1)
+        dispatcher.dispatch('order-1', mock.Mock(side_effect=ValueError), None)
+        dispatcher.dispatch('order-1', handled.append, 'ok')
+        dispatcher.join()
+        assert capture_exception.called
+        assert handled == ['ok']
+
+    def test_it_should_drain_dispatched_handlers_on_close(self):
+        handled = []
+        dispatcher = WorkerPoolDispatcher(workers=2)
+        for number in range(10):
+            dispatcher.dispatch(f'order-{number}', lambda number: handled.append(number), number)
+        dispatcher.close()
+        assert sorted(handled) == list(range(10))
+        assert not any(worker.is_alive() for worker in dispatcher._threads)
+
+    def test_it_should_wait_up_to_the_drain_timeout_on_close(self):
+        release = threading.Event()
+        dispatcher = WorkerPoolDispatcher(workers=1, drain_timeout=0.1)
+        dispatcher.dispatch('order-1', lambda _: release.wait(), None)
+        started_at = time.monotonic()
+        dispatcher.close()
+        assert time.monotonic() - started_at < 1
+        release.set()
+        dispatcher._threads[0].join()
+
+    def test_it_should_run_handlers_inline_after_close(self):
+        threads = []
+        dispatcher = WorkerPoolDispatcher(workers=1)
+        dispatcher.dispatch('order-1', lambda _: threads.append(threading.current_thread()), 1)
+        dispatcher.close()
+        dispatcher.dispatch('order-1', lambda _: threads.append(threading.current_thread()), 2)
+        assert threads[0] is not threading.current_thread()
+        assert threads[1] is threading.current_thread()
+
+    def test_handlers_dispatched_while_draining_should_not_be_lost(self):
+        handled = []
+        dispatcher = WorkerPoolDispatcher(workers=2)
+        started, release = threading.Event(), threading.Event()
+
+        def dispatch_more(number):
+            started.set()
+            release.wait()
+            dispatcher.dispatch('order-2', handled.append, number + 1)
+            handled.append(number)
+
+        dispatcher.dispatch('order-1', dispatch_more, 1)
+        started.wait()
+        closing = threading.Thread(target=dispatcher.close)
+        closing.start()
+        while not dispatcher._closed:
+            time.sleep(0.001)
+        release.set()
+        closing.join(1)
+        assert not closing.is_alive()
+        assert sorted(handled) == [1, 2]
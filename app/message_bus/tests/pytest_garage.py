@@ -0,0 +1,75 @@
+import pytest
+
+from message_bus.garage import FrozenMessageBusError, MessageBus
+from message_bus.registry import MessageBusRegistry, UnknownMessageBusError
+
+
+class FakeCommand:
+    NAME = 'FakeCommand'
+
+
+class FakeEvent:
+    NAME = 'FakeEvent'
+
+
+class TestWhenHandlingMessages:
+
+    def setup_method(self):
+        self.handled = []
+        self.bus = MessageBus()
+        self.bus.register(FakeCommand, lambda message: self.handled.append(('first', message)))
+        self.bus.register(FakeCommand, lambda message: self.handled.append(('second', message)))
+
+    def test_it_should_call_subscribers_in_registration_order(self):
+        command = FakeCommand()
+        self.bus.handle(command)
+        assert self.handled == [('first', command), ('second', command)]
+
+    def test_it_should_ignore_messages_without_subscribers(self):
+        self.bus.handle(FakeEvent())
+        assert self.handled == []
+
+    def test_frozen_bus_should_keep_handling_messages(self):
+        self.bus.freeze()
+        self.bus.handle(FakeCommand())
+        assert len(self.handled) == 2
+
+    def test_frozen_bus_should_refuse_new_subscribers(self):
+        self.bus.freeze()
+        with pytest.raises(FrozenMessageBusError):
+            self.bus.register(FakeEvent, print)
+
+
+class TestMessageBusRegistry:
+
+    def setup_method(self):
+        self.built = []
+        self.registry = MessageBusRegistry()
+        self.registry.register('fake', self._build_bus)
+
+    def _build_bus(self):
+        bus = MessageBus()
+        self.built.append(bus)
+        return bus
+
+    def test_it_should_build_the_bus_just_once(self):
+        first_bus = self.registry.get('fake')
+        second_bus = self.registry.get('fake')
+        assert first_bus is second_bus
+        assert len(self.built) == 1
+
+    def test_it_should_freeze_the_built_bus(self):
+        assert self.registry.get('fake').frozen is True
+
+    def test_build_all_should_build_every_registered_bus(self):
+        self.registry.build_all()
+        assert len(self.built) == 1
+
+    def test_reset_should_rebuild_buses_on_next_get(self):
+        first_bus = self.registry.get('fake')
+        self.registry.reset()
+        assert self.registry.get('fake') is not first_bus
+
+    def test_it_should_raise_exception_for_unknown_bus(self):
+        with pytest.raises(UnknownMessageBusError):
+            self.registry.get('unknown')
@@ -0,0 +1,74 @@
+from django.core.management import BaseCommand
+
+from orders.management.services.profits import get_orders_to_price, recompute_profits
+
+
+class Command(BaseCommand):
+    """Recompute the not paid TalentProfits and AgencyProfits of the fulfilled orders
+    with the current profit percentages, creating the missing ones.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only show what would change, nothing is written to the database',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of orders priced and written per query',
+        )
+        parser.add_argument(
+            '--talent',
+            type=int,
+            help='Recompute only the orders of this talent ID',
+        )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Recompute only the orders created since this date (YYYY-MM-DD)',
+        )
+
+    def _format_change(self, change):
+        new = change.new
+        if change.old is None:
+            return (
+                f'+ order {change.order_id} {change.kind} profit: '
+                f'{new.profit} ({new.profit_percentage} of {new.shoutout_price})'
+            )
+        old = change.old
+        return (
+            f'~ order {change.order_id} {change.kind} profit: '
+            f'{old.profit} ({old.profit_percentage} of {old.shoutout_price}) -> '
+            f'{new.profit} ({new.profit_percentage} of {new.shoutout_price})'
+        )
+
+    def handle(self, *args, **options):
+        orders = get_orders_to_price()
+        if options['talent']:
+            orders = orders.filter(talent_id=options['talent'])
+        if options['since']:
+            orders = orders.filter(created_at__date__gte=options['since'])
+        summary = recompute_profits(
+            orders,
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+        )
+        for change in summary.changes:
+            self.stdout.write(self._format_change(change))
+        for agency_id, orders_ids in summary.agencies_without_percentage.items():
+            self.stdout.write(self.style.ERROR(
+                f'! agency {agency_id} has no profit percentage, its profit was not computed '
+                f'for the orders {", ".join(str(order_id) for order_id in orders_ids)}'
+            ))
+        message = (
+            f'created: {len(summary.created)} | updated: {len(summary.updated)} | '
+            f'unchanged: {summary.unchanged} | paid (skipped): {summary.skipped_paid} | '
+            f'no agency percentage (skipped): {summary.skipped_without_agency_percentage}'
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run, nothing was written. {message}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Process finished. {message}'))
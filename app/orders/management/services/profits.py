@@ -0,0 +1,169 @@
+from collections import namedtuple
+from decimal import Decimal
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import (
+    AgencyProfit,
+    AgencyProfitPercentage,
+    CustomTalentProfitPercentage,
+    DefaultTalentProfitPercentage,
+    Order,
+    TalentProfit,
+)
+from request_shoutout.domain.factories import AgencyProfitFactory, TalentProfitFactory
+from request_shoutout.domain.models import (
+    AgencyProfitPercentage as DomainAgencyProfitPercentage,
+    TalentProfitPercentage,
+)
+
+
+PROFIT_FIELDS = ('shoutout_price', 'profit_percentage', 'profit', 'updated_at')
+
+# Only what the domain profit factories read from an order
+OrderToPrice = namedtuple('OrderToPrice', 'id talent_id agency_id charge')
+ChargeToPrice = namedtuple('ChargeToPrice', 'amount_paid')
+
+ProfitChange = namedtuple('ProfitChange', 'kind order_id old new')
+ProfitValues = namedtuple('ProfitValues', 'shoutout_price profit_percentage profit')
+
+
+class ProfitsSummary:
+
+    def __init__(self):
+        self.created = []
+        self.updated = []
+        self.unchanged = 0
+        self.skipped_paid = 0
+        # agency_id -> ids of the orders left without agency profit
+        self.agencies_without_percentage = {}
+
+    @property
+    def changes(self):
+        return self.created + self.updated
+
+    @property
+    def skipped_without_agency_percentage(self):
+        return sum(len(orders_ids) for orders_ids in self.agencies_without_percentage.values())
+
+
+def get_orders_to_price():
+    return Order.objects.filter(shoutout__isnull=False, charge__isnull=False).order_by('id')
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def _orders_to_price(orders):
+    rows = orders.values_list('id', 'talent_id', 'talent__agency_id', 'charge__amount_paid')
+    for order_id, talent_id, agency_id, amount_paid in rows.iterator():
+        amount_paid = Decimal(str(amount_paid)).quantize(Decimal('1.00'))
+        yield OrderToPrice(order_id, talent_id, agency_id, ChargeToPrice(amount_paid))
+
+
+def build_profit_factories():
+    """Resolve every profit percentage with one query per table, the factories are the
+    same used by the fulfill flow, so profits are calculated exactly the same way.
+
+    The ids of the agencies with a profit percentage are returned too, only those can be
+    priced by the agency factory.
+    """
+    customized_percentages = {
+        talent_id: TalentProfitPercentage(talent_id=talent_id, value=value)
+        for talent_id, value in CustomTalentProfitPercentage.objects.values_list('talent_id', 'value')
+    }
+    default_percentage = DefaultTalentProfitPercentage.objects.first()
+    default_percentage = TalentProfitPercentage(talent_id=None, value=default_percentage.value)
+    agency_percentages = {
+        agency_id: DomainAgencyProfitPercentage(agency_id=agency_id, value=value)
+        for agency_id, value in AgencyProfitPercentage.objects.values_list('agency_id', 'value')
+    }
+    talent_profit_factory = TalentProfitFactory(
+        customized_percentages.get,
+        lambda: default_percentage,
+    )
+    agency_profit_factory = AgencyProfitFactory(agency_percentages.__getitem__)
+    return talent_profit_factory, agency_profit_factory, set(agency_percentages)
+
+
+def _has_changed(django_profit, domain_profit):
+    return any(
+        getattr(django_profit, field) != getattr(domain_profit, field)
+        for field in ('shoutout_price', 'profit_percentage', 'profit')
+    )
+
+
+def _reconcile(kind, model, domain_profits, owner_field, summary):
+    """Return the rows to be created and updated so the table matches domain_profits"""
+    existing_profits = model.objects.in_bulk(
+        [profit.order_id for profit in domain_profits],
+        field_name='order_id',
+    )
+    to_create, to_update = [], []
+    now = timezone.now()
+    for domain_profit in domain_profits:
+        django_profit = existing_profits.get(domain_profit.order_id)
+        if django_profit is None:
+            to_create.append(model(
+                order_id=domain_profit.order_id,
+                shoutout_price=domain_profit.shoutout_price,
+                profit_percentage=domain_profit.profit_percentage,
+                profit=domain_profit.profit,
+                paid=domain_profit.paid,
+                **{owner_field: getattr(domain_profit, owner_field)}
+            ))
+            summary.created.append(ProfitChange(kind, domain_profit.order_id, None, domain_profit))
+        elif django_profit.paid:
+            # Profits already paid are history, re-pricing them would unbalance the payments
+            summary.skipped_paid += 1
+        elif _has_changed(django_profit, domain_profit):
+            old_values = ProfitValues(
+                django_profit.shoutout_price,
+                django_profit.profit_percentage,
+                django_profit.profit,
+            )
+            summary.updated.append(ProfitChange(kind, domain_profit.order_id, old_values, domain_profit))
+            django_profit.shoutout_price = domain_profit.shoutout_price
+            django_profit.profit_percentage = domain_profit.profit_percentage
+            django_profit.profit = domain_profit.profit
+            django_profit.updated_at = now
+            to_update.append(django_profit)
+        else:
+            summary.unchanged += 1
+    return to_create, to_update
+
+
+def recompute_profits(orders=None, chunk_size=500, dry_run=False):
+    """Recompute TalentProfits and AgencyProfits of orders (a queryset of fulfilled orders)
+    with the current profit percentages, writing them with bulk queries chunk by chunk.
+    """
+    if orders is None:
+        orders = get_orders_to_price()
+    talent_profit_factory, agency_profit_factory, priced_agencies = build_profit_factories()
+    summary = ProfitsSummary()
+    for chunk in _chunks(_orders_to_price(orders), chunk_size):
+        talent_profits = [talent_profit_factory(order) for order in chunk]
+        agency_profits = []
+        for order in chunk:
+            if not order.agency_id:
+                continue
+            if order.agency_id not in priced_agencies:
+                summary.agencies_without_percentage.setdefault(order.agency_id, []).append(order.id)
+                continue
+            agency_profits.append(agency_profit_factory(order, order.agency_id))
+        talent_rows = _reconcile('talent', TalentProfit, talent_profits, 'talent_id', summary)
+        agency_rows = _reconcile('agency', AgencyProfit, agency_profits, 'agency_id', summary)
+        if dry_run:
+            continue
+        with transaction.atomic():
+            for model, (to_create, to_update) in ((TalentProfit, talent_rows), (AgencyProfit, agency_rows)):
+                model.objects.bulk_create(to_create, batch_size=chunk_size)
+                model.objects.bulk_update(to_update, PROFIT_FIELDS, batch_size=chunk_size)
+    return summary
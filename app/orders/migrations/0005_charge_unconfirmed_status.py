@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_charge_charging_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='charge',
+            name='status',
+            field=models.CharField(choices=[('not_processed', 'not processed'), ('charging', 'charging'), ('unconfirmed', 'unconfirmed'), ('processing', 'processing'), ('pre_authorized', 'pre-authorized'), ('paid', 'paid'), ('failed', 'failed'), ('cancelled', 'cancelled')], max_length=100),
+        ),
+    ]
@@ -54,6 +54,8 @@ class Order(BaseModel):
 
 STATUS_CHOICES = (
     (DomainCharge.NOT_PROCESSED, 'not processed'),
+    (DomainCharge.CHARGING, 'charging'),
+    (DomainCharge.UNCONFIRMED, 'unconfirmed'),
     (DomainCharge.PROCESSING, 'processing'),
     (DomainCharge.PRE_AUTHORIZED, 'pre-authorized'),
     (DomainCharge.PAID, 'paid'),
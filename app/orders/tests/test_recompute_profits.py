@@ -0,0 +1,165 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from orders.models import (
+    AgencyProfit,
+    AgencyProfitPercentage,
+    Charge,
+    CustomTalentProfitPercentage,
+    DefaultTalentProfitPercentage,
+    Order,
+    TalentProfit,
+)
+from request_shoutout.domain.models import Charge as DomainCharge
+from shoutouts.models import ShoutoutVideo
+from talents.models import Agency, Talent
+
+User = get_user_model()
+
+
+class RecomputeProfitsTest(TestCase):
+
+    def _create_talent(self, email, agency=None):
+        user = User.objects.create(email=email, first_name='Nome', last_name='Sobrenome')
+        return Talent.objects.create(
+            user=user,
+            price=100,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+            agency=agency,
+        )
+
+    def _create_fulfilled_order(self, talent, amount_paid):
+        order = Order.objects.create(
+            hash_id=uuid.uuid4(),
+            talent_id=talent.id,
+            video_is_for='someone_else',
+            is_from='MJ',
+            is_to='Peter',
+            instruction="Go Get 'em, Tiger",
+            email='mary.jane.watson@spiderman.com',
+            is_public=True,
+            expiration_datetime=datetime.now(timezone.utc) + timedelta(days=4),
+        )
+        Charge.objects.create(
+            order=order,
+            amount_paid=amount_paid,
+            payment_date=datetime.now(timezone.utc),
+            status=DomainCharge.PAID,
+        )
+        ShoutoutVideo.objects.create(hash_id=uuid.uuid4(), order=order, talent=talent, file='file.mp4')
+        return order
+
+    def setUp(self):
+        DefaultTalentProfitPercentage.objects.create(value='0.75')
+        self.agency = Agency.objects.create(name='Agency')
+        AgencyProfitPercentage.objects.create(agency=self.agency, value='0.05')
+        self.talent = self._create_talent('talent1@viggio.com.br', agency=self.agency)
+        CustomTalentProfitPercentage.objects.create(talent=self.talent, value='0.80')
+        self.other_talent = self._create_talent('talent2@viggio.com.br')
+
+        self.missing_profit_order = self._create_fulfilled_order(self.other_talent, '333.33')
+        self.outdated_profit_order = self._create_fulfilled_order(self.talent, '100.00')
+        TalentProfit.objects.create(
+            talent=self.talent,
+            order=self.outdated_profit_order,
+            shoutout_price='100.00',
+            profit_percentage='0.70',
+            profit='70.00',
+            paid=False,
+        )
+        self.paid_profit_order = self._create_fulfilled_order(self.other_talent, '100.00')
+        TalentProfit.objects.create(
+            talent=self.other_talent,
+            order=self.paid_profit_order,
+            shoutout_price='100.00',
+            profit_percentage='0.70',
+            profit='70.00',
+            paid=True,
+        )
+
+    def test_it_should_create_missing_and_update_outdated_profits(self):
+        out = StringIO()
+        call_command('recompute_profits', '--chunk-size', '2', stdout=out)
+
+        created_profit = TalentProfit.objects.get(order=self.missing_profit_order)
+        self.assertEqual(created_profit.profit_percentage, Decimal('0.75'))
+        self.assertEqual(created_profit.profit, Decimal('250.00'))
+        self.assertFalse(created_profit.paid)
+
+        updated_profit = TalentProfit.objects.get(order=self.outdated_profit_order)
+        self.assertEqual(updated_profit.profit_percentage, Decimal('0.80'))
+        self.assertEqual(updated_profit.profit, Decimal('80.00'))
+
+        agency_profit = AgencyProfit.objects.get(order=self.outdated_profit_order)
+        self.assertEqual(agency_profit.agency, self.agency)
+        self.assertEqual(agency_profit.profit, Decimal('5.00'))
+
+        paid_profit = TalentProfit.objects.get(order=self.paid_profit_order)
+        self.assertEqual(paid_profit.profit, Decimal('70.00'))
+        self.assertIn('created: 2 | updated: 1 | unchanged: 0 | paid (skipped): 1', out.getvalue())
+
+    def test_second_run_should_not_change_anything(self):
+        call_command('recompute_profits', stdout=StringIO())
+        out = StringIO()
+        call_command('recompute_profits', stdout=out)
+        self.assertIn('created: 0 | updated: 0 | unchanged: 3 | paid (skipped): 1', out.getvalue())
+
+    def test_dry_run_should_show_the_diff_without_writing(self):
+        out = StringIO()
+        call_command('recompute_profits', '--dry-run', stdout=out)
+        self.assertEqual(TalentProfit.objects.count(), 2)
+        self.assertEqual(AgencyProfit.objects.count(), 0)
+        self.assertEqual(
+            TalentProfit.objects.get(order=self.outdated_profit_order).profit,
+            Decimal('70.00'),
+        )
+        output = out.getvalue()
+        self.assertIn(
+            f'+ order {self.missing_profit_order.id} talent profit: 250.00 (0.75 of 333.33)',
+            output,
+        )
+        self.assertIn(
+            f'~ order {self.outdated_profit_order.id} talent profit: '
+            '70.00 (0.70 of 100.00) -> 80.00 (0.80 of 100.00)',
+            output,
+        )
+        self.assertIn(f'+ order {self.outdated_profit_order.id} agency profit: 5.00', output)
+        self.assertIn('Dry run, nothing was written.', output)
+
+    def test_profit_percentages_should_be_resolved_with_one_query_per_table(self):
+        # 3 percentage tables + orders + existing talent and agency profits
+        # + savepoint, 2 inserts and 1 update, whatever the number of orders
+        with self.assertNumQueries(11):
+            call_command('recompute_profits', stdout=StringIO())
+
+    def test_agency_without_profit_percentage_should_be_skipped_and_reported(self):
+        agency = Agency.objects.create(name='Agency without percentage')
+        talent = self._create_talent('talent3@viggio.com.br', agency=agency)
+        order = self._create_fulfilled_order(talent, '100.00')
+        out = StringIO()
+        call_command('recompute_profits', stdout=out)
+
+        self.assertEqual(TalentProfit.objects.get(order=order).profit, Decimal('75.00'))
+        self.assertFalse(AgencyProfit.objects.filter(order=order).exists())
+        self.assertTrue(AgencyProfit.objects.filter(order=self.outdated_profit_order).exists())
+        output = out.getvalue()
+        self.assertIn(
+            f'! agency {agency.id} has no profit percentage, its profit was not computed '
+            f'for the orders {order.id}',
+            output,
+        )
+        self.assertIn(
+            'created: 3 | updated: 1 | unchanged: 0 | paid (skipped): 1 | '
+            'no agency percentage (skipped): 1',
+            output,
+        )
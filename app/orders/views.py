@@ -1,5 +1,6 @@
 from datetime import datetime, timezone
 
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.generics import ListAPIView
@@ -13,6 +14,14 @@ from talents.permissions import TalentAccessPermission
 from .serializers import OrderSerializer
 
 
+# Pedido aceito pelo checkout assíncrono e ainda não cobrado
+CHARGE_PENDING_STATUSES = (
+    DomainCharge.NOT_PROCESSED,
+    DomainCharge.CHARGING,
+    DomainCharge.UNCONFIRMED,
+)
+
+
 class TalentOrdersAPIView(ListAPIView):
     permission_classes = (IsAuthenticated, TalentAccessPermission)
     serializer_class = OrderSerializer
@@ -35,4 +44,7 @@ class OrderDetailAPIView(APIView):
         order_hash = kwargs['order_hash']
         order = get_object_or_404(Order, hash_id=order_hash)
         serialized = OrderSerializer(order)
-        return Response(serialized.data, status.HTTP_200_OK)
+        response = Response(serialized.data, status.HTTP_200_OK)
+        if order.charge.status in CHARGE_PENDING_STATUSES:
+            response['Retry-After'] = settings.CHECKOUT_POLL_INTERVAL
+        return response
@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown, worker_shutdown
 
 
 ENVIRONMENT = os.environ['ENVIRONMENT']
@@ -10,6 +11,14 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def drain_deferred_handlers(**kwargs):
+    # Os handlers adiados do message bus ficam em memória, roda os que já foram enfileirados
+    from message_bus.dispatchers import close_deferred_dispatcher
+    close_deferred_dispatcher()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
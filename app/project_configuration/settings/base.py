@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 
 
@@ -35,6 +36,7 @@ PROJECT_APPS = [
     'accounts',
     'categories',
     'customers',
+    'direct_uploads',
     'message_bus',
     'orders',
     'post_office',
@@ -148,3 +150,162 @@ CELERY_RESULT_BACKEND = f'redis://{REDIS_HOST}:{REDIS_PORT}'
 CELERY_ACCEPT_CONTENT = ['application/json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# Videos are transcoded by their own worker (see supervisord.conf), so a peak of uploads
+# doesn't hold the emails and the other tasks of the default queue
+CELERY_TASK_ROUTES = {
+    'transcoder.tasks.schedule_transcode_to_mp4': {'queue': 'transcoding'},
+    'talents.tasks.finalize_presentation_video': {'queue': 'transcoding'},
+}
+# Workers only reserve a task when they have a free process, the rest waits in the broker
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BEAT_SCHEDULE = {
+    'apply-payment-notifications': {
+        'task': 'wirecard.tasks.apply_payment_notifications',
+        'schedule': 60,
+    },
+    'drain-capture-queue': {
+        'task': 'wirecard.tasks.drain_capture_queue',
+        'schedule': 60,
+    },
+    'reconcile-stuck-charges': {
+        'task': 'wirecard.tasks.reconcile_stuck_charges',
+        'schedule': 10 * 60,
+    },
+}
+
+# Each transcode runs ffmpeg with TRANSCODING_FFMPEG_THREADS threads and the transcoding
+# worker runs as many transcodes at once as the CPU cores fit. It's the default worker
+# concurrency, the default queue worker sets its own on the command line
+TRANSCODING_FFMPEG_THREADS = int(os.environ.get('TRANSCODING_FFMPEG_THREADS', 2))
+TRANSCODING_CONCURRENCY = int(os.environ.get(
+    'TRANSCODING_CONCURRENCY',
+    max(1, (os.cpu_count() or 1) // TRANSCODING_FFMPEG_THREADS),
+))
+CELERY_WORKER_CONCURRENCY = TRANSCODING_CONCURRENCY
+# Profiles from transcoder.profiles, customizable by TRANSCODING_PROFILES. An empty
+# TRANSCODING_PREVIEW_PROFILE disables the light preview rendition of the shoutouts
+TRANSCODING_DOWNLOAD_PROFILE = os.environ.get('TRANSCODING_DOWNLOAD_PROFILE', 'download')
+TRANSCODING_PREVIEW_PROFILE = os.environ.get('TRANSCODING_PREVIEW_PROFILE', 'preview')
+TRANSCODING_PROFILES = {}
+# Poster frame (in seconds) and thumbnails strip extracted from the shoutouts
+TRANSCODING_POSTER_TIME = float(os.environ.get('TRANSCODING_POSTER_TIME', 1))
+TRANSCODING_THUMBNAILS_COUNT = int(os.environ.get('TRANSCODING_THUMBNAILS_COUNT', 10))
+TRANSCODING_THUMBNAIL_HEIGHT = int(os.environ.get('TRANSCODING_THUMBNAIL_HEIGHT', 90))
+# Watermark overlaid on the videos, pre-rendered to the resolutions below when the
+# worker starts and to any other resolution on its first transcode
+TRANSCODING_WATERMARK_PATH = os.path.join(BASE_DIR, 'transcoder', 'media', 'logo-white.png')
+TRANSCODING_WATERMARK_CACHE_DIR = os.environ.get(
+    'TRANSCODING_WATERMARK_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'viggio-watermarks'),
+)
+TRANSCODING_WATERMARK_PRERENDER_SIZES = (
+    (720, 1280),
+    (1080, 1920),
+    (2160, 3840),
+    (1280, 720),
+    (1920, 1080),
+    (3840, 2160),
+)
+# Share of the transcoded videos decoded again from start to end to check their integrity
+TRANSCODING_FULL_VALIDATION_SAMPLE_RATE = float(
+    os.environ.get('TRANSCODING_FULL_VALIDATION_SAMPLE_RATE', 0)
+)
+# Downloads and encodes kept between the retries of a transcode job
+TRANSCODING_WORK_DIR = os.environ.get(
+    'TRANSCODING_WORK_DIR',
+    os.path.join(tempfile.gettempdir(), 'viggio-transcodes'),
+)
+# Seconds a delivery of the transcode task holds its job, other deliveries wait for it
+TRANSCODING_JOB_LEASE = int(os.environ.get('TRANSCODING_JOB_LEASE', 15 * 60))
+
+# Workers running the deferred message bus handlers in each process, 0 runs them inline.
+# A process exiting waits up to MESSAGE_BUS_DEFERRED_DRAIN_TIMEOUT seconds for the handlers
+# already deferred, under the graceful timeout of gunicorn (30s)
+MESSAGE_BUS_DEFERRED_WORKERS = int(os.environ.get('MESSAGE_BUS_DEFERRED_WORKERS', 0))
+MESSAGE_BUS_DEFERRED_DRAIN_TIMEOUT = int(
+    os.environ.get('MESSAGE_BUS_DEFERRED_DRAIN_TIMEOUT', 25)
+)
+
+# Profit percentages are edited in the admin and rarely change. Without a redis url each
+# process keeps its own copy, so changes made from other processes show up after the TTL
+PROFIT_PERCENTAGE_CACHE_TTL = int(os.environ.get('PROFIT_PERCENTAGE_CACHE_TTL', 300))
+PROFIT_PERCENTAGE_CACHE_REDIS_URL = os.environ.get('PROFIT_PERCENTAGE_CACHE_REDIS_URL')
+
+# The talents catalogue is reshuffled every CATALOGUE_SHUFFLE_PERIOD seconds, by the
+# reshuffle-catalogue task that writes the positions of the talents ahead, and its pages
+# are cached in the redis of celery until a talent changes or the TTL expires, so every
+# process sees the invalidations. Without a redis url (tests) each process keeps at most
+# CATALOGUE_CACHE_MAX_ENTRIES pages
+CATALOGUE_SHUFFLE_PERIOD = int(os.environ.get('CATALOGUE_SHUFFLE_PERIOD', 3600))
+CELERY_BEAT_SCHEDULE['reshuffle-catalogue'] = {
+    'task': 'talents.tasks.reshuffle_catalogue',
+    'schedule': CATALOGUE_SHUFFLE_PERIOD,
+}
+CATALOGUE_CACHE_TTL = int(os.environ.get('CATALOGUE_CACHE_TTL', 60))
+CATALOGUE_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOGUE_CACHE_MAX_ENTRIES', 1024))
+CATALOGUE_CACHE_REDIS_URL = os.environ.get(
+    'CATALOGUE_CACHE_REDIS_URL',
+    f'redis://{REDIS_HOST}:{REDIS_PORT}',
+)
+
+# Large files are uploaded by the browser straight to the media storage. The filesystem
+# uploader serves the upload sessions from the API itself, for development and tests
+DIRECT_UPLOADER = 'direct_uploads.uploaders.FileSystemUploader'
+# Seconds to finish an upload and send its upload key to the API
+DIRECT_UPLOAD_MAX_AGE = int(os.environ.get('DIRECT_UPLOAD_MAX_AGE', 24 * 60 * 60))
+SHOUTOUT_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+PRESENTATION_VIDEO_UPLOAD_MAX_SIZE = 200 * 1024 * 1024
+AVATAR_UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+# Uploaded avatars are resized to fit in a square of this side
+AVATAR_MAX_SIZE = 512
+
+# Connections to Wirecard are kept alive and shared by the requests of each process
+WIRECARD_POOL_SIZE = int(os.environ.get('WIRECARD_POOL_SIZE', 10))
+WIRECARD_CONNECT_TIMEOUT = float(os.environ.get('WIRECARD_CONNECT_TIMEOUT', 3.05))
+WIRECARD_READ_TIMEOUT = float(os.environ.get('WIRECARD_READ_TIMEOUT', 30))
+# The latency histogram of a Wirecard endpoint is logged every N requests to it
+WIRECARD_LATENCY_REPORT_INTERVAL = int(os.environ.get('WIRECARD_LATENCY_REPORT_INTERVAL', 100))
+
+# Orders accepted by the asynchronous checkout are charged by a task, which tries again with
+# exponential backoff while Wirecard can't be reached. Clients poll the order detail every
+# CHECKOUT_POLL_INTERVAL seconds until the charge is processed. A charge is claimed by one
+# task at a time, the claim is taken over after CHECKOUT_CHARGE_LEASE seconds
+CHECKOUT_CHARGE_MAX_RETRIES = int(os.environ.get('CHECKOUT_CHARGE_MAX_RETRIES', 5))
+CHECKOUT_CHARGE_RETRY_DELAY = int(os.environ.get('CHECKOUT_CHARGE_RETRY_DELAY', 10))
+CHECKOUT_CHARGE_LEASE = int(os.environ.get('CHECKOUT_CHARGE_LEASE', 120))
+CHECKOUT_POLL_INTERVAL = int(os.environ.get('CHECKOUT_POLL_INTERVAL', 2))
+
+# Payment notifications are applied in batches: the first of a burst schedules the batch
+# WIRECARD_NOTIFICATION_BATCH_DELAY seconds later, so the retries and the following events
+# of Wirecard are collapsed into it. The scheduled batch is marked in the redis of celery
+# for every process to see. The beat applies any left pending every minute
+WIRECARD_NOTIFICATION_BATCH_DELAY = int(os.environ.get('WIRECARD_NOTIFICATION_BATCH_DELAY', 5))
+WIRECARD_NOTIFICATION_BATCH_SIZE = 250
+WIRECARD_NOTIFICATION_BATCH_REDIS_URL = os.environ.get(
+    'WIRECARD_NOTIFICATION_BATCH_REDIS_URL',
+    f'redis://{REDIS_HOST}:{REDIS_PORT}',
+)
+
+# Background jobs (captures and status queries) send at most WIRECARD_BACKGROUND_CONCURRENCY
+# requests at once and WIRECARD_BACKGROUND_RATE_LIMIT requests per second by process
+WIRECARD_BACKGROUND_CONCURRENCY = int(os.environ.get('WIRECARD_BACKGROUND_CONCURRENCY', 5))
+WIRECARD_BACKGROUND_RATE_LIMIT = float(os.environ.get('WIRECARD_BACKGROUND_RATE_LIMIT', 10))
+
+# Payments of fulfilled orders are captured by the drain of the capture queue, scheduled
+# WIRECARD_CAPTURE_BATCH_DELAY seconds after a capture is enqueued and run every minute by the
+# beat. Failed captures are tried again after 1, 2, 4... minutes, up to the max attempts
+WIRECARD_CAPTURE_BATCH_DELAY = int(os.environ.get('WIRECARD_CAPTURE_BATCH_DELAY', 5))
+WIRECARD_CAPTURE_BATCH_SIZE = 50
+WIRECARD_CAPTURE_RETRY_DELAY = 60
+WIRECARD_CAPTURE_MAX_ATTEMPTS = int(os.environ.get('WIRECARD_CAPTURE_MAX_ATTEMPTS', 6))
+WIRECARD_CAPTURE_LEASE = 300
+
+# Charges processing for longer than WIRECARD_RECONCILIATION_THRESHOLD seconds probably lost
+# their notification, every 10 minutes the beat queries the payments of up to
+# WIRECARD_RECONCILIATION_MAX_PAYMENTS of them on Wirecard
+WIRECARD_RECONCILIATION_THRESHOLD = int(
+    os.environ.get('WIRECARD_RECONCILIATION_THRESHOLD', 30 * 60)
+)
+WIRECARD_RECONCILIATION_MAX_PAYMENTS = int(
+    os.environ.get('WIRECARD_RECONCILIATION_MAX_PAYMENTS', 200)
+)
@@ -1,5 +1,8 @@
+import atexit
 import os
+import shutil
 import sys
+import tempfile
 
 
 from .base import *
@@ -35,6 +38,15 @@ if 'test' in sys.argv:
 
     MIGRATION_MODULES = DisableMigrations()
 
+    # Os arquivos salvos pelos testes não vão para o mediafiles do repositório
+    MEDIA_ROOT = tempfile.mkdtemp(prefix='viggio_tests_media_')
+    atexit.register(shutil.rmtree, MEDIA_ROOT, True)
+
+    PROFIT_PERCENTAGE_CACHE_TTL = 0
+    CATALOGUE_CACHE_TTL = 0
+    CATALOGUE_CACHE_REDIS_URL = None
+    WIRECARD_NOTIFICATION_BATCH_REDIS_URL = None
+
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
@@ -20,6 +20,12 @@ DEFAULT_FILE_STORAGE = 'project_configuration.storage_backends.GoogleCloudMediaS
 STATICFILES_STORAGE = 'project_configuration.storage_backends.GoogleCloudStaticStorage'
 
 GS_FILE_STORAGE_NAME = os.environ['STORAGE_NAME']
+# Upload big files (CSV exports, videos) to the bucket in resumable chunks of 5MB
+GS_BLOB_CHUNK_SIZE = 5 * 1024 * 1024
+# Files opened from the bucket roll over to disk instead of being held whole in memory
+GS_MAX_MEMORY_SIZE = 5 * 1024 * 1024
+# Browsers upload the videos straight to the bucket with resumable upload sessions
+DIRECT_UPLOADER = 'direct_uploads.uploaders.GoogleCloudUploader'
 MEDIA_DIRECTORY = os.environ['MEDIA_DIRECTORY']
 STATIC_DIRECTORY = os.environ['STATIC_DIRECTORY']
 
@@ -27,4 +33,18 @@ STATIC_DIRECTORY = os.environ['STATIC_DIRECTORY']
 STATIC_URL = os.environ['STORAGE_URL']
 MEDIA_URL = os.environ['STORAGE_URL']
 
+MESSAGE_BUS_DEFERRED_WORKERS = int(os.environ.get('MESSAGE_BUS_DEFERRED_WORKERS', 4))
+
+# Latências do Wirecard e resultados das varreduras de reconciliação
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'wirecard': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 sentry_sdk.init(dsn=os.environ.get('SENTRY_DSN'), integrations=[DjangoIntegration()])
@@ -16,5 +16,6 @@ urlpatterns = [
     path('api/v/', include('shoutouts.urls')),
     path('api/request-shoutout/', include('request_shoutout.adapters.http.urls')),
     path('api/talents/', include('talents.urls')),
+    path('api/uploads/', include('direct_uploads.urls')),
     path('api/wirecard/', include('wirecard.urls')),
 ]
@@ -0,0 +1 @@
+default_app_config = 'request_shoutout.apps.RequestShoutoutConfig'
@@ -0,0 +1,72 @@
+from decimal import Decimal
+
+from django.conf import settings
+
+from request_shoutout.adapters.db.db_views import (
+    view_agency_profit_percentage,
+    view_customized_talent_profit_percentage,
+    view_default_talent_profit_percentage,
+)
+from request_shoutout.domain.models import AgencyProfitPercentage, TalentProfitPercentage
+from utils.caches import LocalMemoryBackend, RedisBackend, TTLCache
+
+
+def _get_backend():
+    redis_url = getattr(settings, 'PROFIT_PERCENTAGE_CACHE_REDIS_URL', None)
+    if redis_url:
+        return RedisBackend(redis_url, prefix='profit_percentage:')
+    return LocalMemoryBackend()
+
+
+def _get_ttl():
+    return getattr(settings, 'PROFIT_PERCENTAGE_CACHE_TTL', 0)
+
+
+profit_percentage_cache = TTLCache(backend=_get_backend, ttl=_get_ttl)
+
+
+def talent_profit_percentage_key(talent_id):
+    return f'talent:{talent_id}'
+
+
+DEFAULT_TALENT_PROFIT_PERCENTAGE_KEY = 'talent:default'
+
+
+def agency_profit_percentage_key(agency_id):
+    return f'agency:{agency_id}'
+
+
+def _dump_talent_profit_percentage(profit_percentage):
+    if profit_percentage is None:
+        return None
+    return {'talent_id': profit_percentage.talent_id, 'value': str(profit_percentage.value)}
+
+
+def _load_talent_profit_percentage(data):
+    if data is None:
+        return None
+    return TalentProfitPercentage(talent_id=data['talent_id'], value=Decimal(data['value']))
+
+
+def cached_view_customized_talent_profit_percentage(talent_id):
+    data = profit_percentage_cache.get_or_load(
+        talent_profit_percentage_key(talent_id),
+        lambda: _dump_talent_profit_percentage(view_customized_talent_profit_percentage(talent_id)),
+    )
+    return _load_talent_profit_percentage(data)
+
+
+def cached_view_default_talent_profit_percentage():
+    data = profit_percentage_cache.get_or_load(
+        DEFAULT_TALENT_PROFIT_PERCENTAGE_KEY,
+        lambda: _dump_talent_profit_percentage(view_default_talent_profit_percentage()),
+    )
+    return _load_talent_profit_percentage(data)
+
+
+def cached_view_agency_profit_percentage(agency_id):
+    data = profit_percentage_cache.get_or_load(
+        agency_profit_percentage_key(agency_id),
+        lambda: str(view_agency_profit_percentage(agency_id).value),
+    )
+    return AgencyProfitPercentage(agency_id=agency_id, value=Decimal(data))
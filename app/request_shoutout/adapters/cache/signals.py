@@ -0,0 +1,37 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from orders.models import (
+    AgencyProfitPercentage,
+    CustomTalentProfitPercentage,
+    DefaultTalentProfitPercentage,
+)
+from .profit_percentages import (
+    agency_profit_percentage_key,
+    DEFAULT_TALENT_PROFIT_PERCENTAGE_KEY,
+    profit_percentage_cache,
+    talent_profit_percentage_key,
+)
+
+
+def invalidate_on_commit(key):
+    # Invalidado antes do commit, outro processo poderia recarregar o valor antigo do banco
+    transaction.on_commit(partial(profit_percentage_cache.invalidate, key))
+
+
+@receiver([post_save, post_delete], sender=CustomTalentProfitPercentage)
+def invalidate_talent_profit_percentage(sender, instance, **kwargs):
+    invalidate_on_commit(talent_profit_percentage_key(instance.talent_id))
+
+
+@receiver([post_save, post_delete], sender=DefaultTalentProfitPercentage)
+def invalidate_default_talent_profit_percentage(sender, instance, **kwargs):
+    invalidate_on_commit(DEFAULT_TALENT_PROFIT_PERCENTAGE_KEY)
+
+
+@receiver([post_save, post_delete], sender=AgencyProfitPercentage)
+def invalidate_agency_profit_percentage(sender, instance, **kwargs):
+    invalidate_on_commit(agency_profit_percentage_key(instance.agency_id))
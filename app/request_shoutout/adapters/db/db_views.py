@@ -1,3 +1,4 @@
+import uuid
 from numbers import Number
 
 from orders.models import (
@@ -10,81 +11,136 @@ from orders.models import (
 )
 from request_shoutout.domain.models import Buyer, Charge, CreditCard, Order, Shoutout
 from request_shoutout.domain.models import AgencyProfitPercentage, TalentProfitPercentage
+from shoutouts.models import ShoutoutVideo as DjangoShoutoutVideo
 from talents.models import Talent
 from wirecard.models import WirecardTransactionData
+from .identity_map import get_identity_map, identity_mapped
 
 
-def view_order(unique_identifier):
+ORDER_AGGREGATE_FIELDS = (
+    'id',
+    'hash_id',
+    'talent_id',
+    'video_is_for',
+    'is_from',
+    'is_to',
+    'instruction',
+    'email',
+    'is_public',
+    'created_at',
+    'expiration_datetime',
+    'charge__amount_paid',
+    'charge__payment_date',
+    'charge__status',
+    'charge__payment_method',
+    'charge__funding_instrument__fullname',
+    'charge__funding_instrument__birthdate',
+    'charge__funding_instrument__tax_document',
+    'charge__funding_instrument__credit_card_hash',
+    'charge__funding_instrument__phone_number',
+    'charge__funding_instrument__area_code',
+    'charge__buyer__fullname',
+    'charge__buyer__birthdate',
+    'charge__buyer__tax_document',
+    'charge__buyer__phone_number',
+    'charge__buyer__area_code',
+    'shoutout__hash_id',
+    'shoutout__talent_id',
+    'shoutout__file',
+)
+
+
+def _order_identity(unique_identifier):
     if isinstance(unique_identifier, Number):
-        django_orders_queryset = DjangoOrder.objects.filter(id=unique_identifier)
-    else:
-        django_orders_queryset = DjangoOrder.objects.filter(hash_id=unique_identifier)
-    django_orders_queryset = django_orders_queryset.prefetch_related(
-        'charge',
-        'charge__funding_instrument',
-        'charge__buyer',
-        'shoutout',
-    )
-    django_order = django_orders_queryset.first()
+        return ('order', unique_identifier)
+    try:
+        return ('order', uuid.UUID(str(unique_identifier)))
+    except ValueError:
+        return ('order', unique_identifier)
+
 
+def _hydrate_order(row):
     credit_card = CreditCard(
-        fullname=django_order.charge.funding_instrument.fullname,
-        birthdate=django_order.charge.funding_instrument.birthdate,
-        tax_document=django_order.charge.funding_instrument.tax_document,
-        credit_card_hash=django_order.charge.funding_instrument.credit_card_hash,
-        phone_number=django_order.charge.funding_instrument.phone_number,
-        area_code=django_order.charge.funding_instrument.area_code,
+        fullname=row['charge__funding_instrument__fullname'],
+        birthdate=row['charge__funding_instrument__birthdate'],
+        tax_document=row['charge__funding_instrument__tax_document'],
+        credit_card_hash=row['charge__funding_instrument__credit_card_hash'],
+        phone_number=row['charge__funding_instrument__phone_number'],
+        area_code=row['charge__funding_instrument__area_code'],
     )
     buyer = Buyer(
-        fullname=django_order.charge.buyer.fullname,
-        birthdate=django_order.charge.buyer.birthdate,
-        tax_document=django_order.charge.buyer.tax_document,
-        phone_number=django_order.charge.buyer.phone_number,
-        area_code=django_order.charge.buyer.area_code,
+        fullname=row['charge__buyer__fullname'],
+        birthdate=row['charge__buyer__birthdate'],
+        tax_document=row['charge__buyer__tax_document'],
+        phone_number=row['charge__buyer__phone_number'],
+        area_code=row['charge__buyer__area_code'],
     )
     charge = Charge(
-        order_id=django_order.id,
-        amount_paid=django_order.charge.amount_paid,
-        payment_date=django_order.charge.payment_date,
-        status=django_order.charge.amount_paid,
-        payment_method=django_order.charge.payment_method,
+        order_id=row['id'],
+        amount_paid=row['charge__amount_paid'],
+        payment_date=row['charge__payment_date'],
+        status=row['charge__status'],
+        payment_method=row['charge__payment_method'],
         funding_instrument=credit_card,
         buyer=buyer,
     )
     order = Order(
-        id=django_order.id,
-        hash_id=django_order.hash_id,
-        talent_id=django_order.talent_id,
-        video_is_for=django_order.video_is_for,
-        is_from=django_order.is_from,
-        is_to=django_order.is_to,
-        instruction=django_order.instruction,
-        email=django_order.email,
-        is_public=django_order.is_public,
+        id=row['id'],
+        hash_id=row['hash_id'],
+        talent_id=row['talent_id'],
+        video_is_for=row['video_is_for'],
+        is_from=row['is_from'],
+        is_to=row['is_to'],
+        instruction=row['instruction'],
+        email=row['email'],
+        is_public=row['is_public'],
         charge=charge,
     )
-    order.created_at = django_order.created_at  # TODO: saporra não deveria estar aqui pq não tem na domain model
-    order.expiration_datetime = django_order.expiration_datetime
-    if hasattr(django_order, 'shoutout'):
+    order.created_at = row['created_at']  # TODO: saporra não deveria estar aqui pq não tem na domain model
+    order.expiration_datetime = row['expiration_datetime']
+    if row['shoutout__hash_id']:
+        file_field = DjangoShoutoutVideo._meta.get_field('file')
         order.shoutout = Shoutout(
-            hash_id=django_order.shoutout.hash_id,
-            order_id=django_order.shoutout.order_id,
-            talent_id=django_order.shoutout.talent_id,
-            video_file=django_order.shoutout.file,
+            hash_id=row['shoutout__hash_id'],
+            order_id=row['id'],
+            talent_id=row['shoutout__talent_id'],
+            video_file=file_field.attr_class(None, file_field, row['shoutout__file']),
         )
     return order
 
 
+def view_order(unique_identifier):
+    identity_map = get_identity_map()
+    identity = _order_identity(unique_identifier)
+    if identity_map is not None:
+        order = identity_map.get(identity)
+        if order is not None:
+            return order
+
+    if isinstance(unique_identifier, Number):
+        django_orders_queryset = DjangoOrder.objects.filter(id=unique_identifier)
+    else:
+        django_orders_queryset = DjangoOrder.objects.filter(hash_id=unique_identifier)
+    order = _hydrate_order(django_orders_queryset.values(*ORDER_AGGREGATE_FIELDS).get())
+
+    if identity_map is not None:
+        identity_map.add(order, _order_identity(order.id), _order_identity(order.hash_id))
+    return order
+
+
+@identity_mapped('transaction_data')
 def view_transaction_data(order_hash):
     # TODO: Criar domain_model TransactionData para retornar nesse db_view???
-    return WirecardTransactionData.objects.get(order__hash_id=order_hash)
+    return WirecardTransactionData.objects.select_related('order').get(order__hash_id=order_hash)
 
 
+@identity_mapped('talent')
 def view_talent(talent_id):
     # TODO: Criar domain_model Talent para retornar nesse db_view
-    return Talent.objects.get(id=talent_id)
+    return Talent.objects.select_related('user').get(id=talent_id)
 
 
+@identity_mapped('customized_talent_profit_percentage')
 def view_customized_talent_profit_percentage(talent_id):
     try:
         profit_percentage = CustomTalentProfitPercentage.objects.get(talent_id=talent_id)
@@ -98,6 +154,7 @@ def view_customized_talent_profit_percentage(talent_id):
     return profit_percentage
 
 
+@identity_mapped('default_talent_profit_percentage')
 def view_default_talent_profit_percentage():
     profit_percentage = DefaultTalentProfitPercentage.objects.first()
     domain_profit_percentage = TalentProfitPercentage(
@@ -107,8 +164,9 @@ def view_default_talent_profit_percentage():
     return domain_profit_percentage
 
 
+@identity_mapped('agency_profit_percentage')
 def view_agency_profit_percentage(agency_id):
-    profit_percentage = DjangoAgencyProfitPercentage.objects.get(id=agency_id)
+    profit_percentage = DjangoAgencyProfitPercentage.objects.get(agency_id=agency_id)
     domain_profit_percentage = AgencyProfitPercentage(
         agency_id=agency_id,
         value=profit_percentage.value,
@@ -0,0 +1,69 @@
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+
+_local = threading.local()
+
+MISSING = object()
+
+
+class IdentityMap:
+    """Keep the aggregates already loaded while a message is handled, so every db view
+    hits the database once per aggregate and handlers share the same domain objects.
+    """
+
+    def __init__(self):
+        self._aggregates = {}
+
+    def get(self, identity, default=None):
+        return self._aggregates.get(identity, default)
+
+    def add(self, aggregate, *identities):
+        for identity in identities:
+            self._aggregates[identity] = aggregate
+
+    def clear(self):
+        self._aggregates.clear()
+
+
+def get_identity_map():
+    return getattr(_local, 'identity_map', None)
+
+
+def invalidate_identity_map():
+    """Units of work call it when they commit, what was loaded before may be stale now"""
+    identity_map = get_identity_map()
+    if identity_map is not None:
+        identity_map.clear()
+
+
+def identity_mapped(kind):
+    """Cache what a db view returns (None included) by its arguments while the scope is open"""
+    def decorator(db_view):
+        @wraps(db_view)
+        def wrapper(*args):
+            identity_map = get_identity_map()
+            if identity_map is None:
+                return db_view(*args)
+            identity = (kind,) + args
+            result = identity_map.get(identity, MISSING)
+            if result is MISSING:
+                result = db_view(*args)
+                identity_map.add(result, identity)
+            return result
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def identity_map_scope():
+    """Open an identity map for the outermost message, nested messages share it"""
+    if get_identity_map() is not None:
+        yield get_identity_map()
+        return
+    _local.identity_map = IdentityMap()
+    try:
+        yield _local.identity_map
+    finally:
+        _local.identity_map = None
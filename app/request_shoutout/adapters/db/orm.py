@@ -1,6 +1,11 @@
 import sys
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from sentry_sdk import capture_exception
 
 from orders.models import (
@@ -15,15 +20,17 @@ from request_shoutout.domain.messages import (
     ShoutoutUploadedEvent,
     ShoutoutSuccessfullyRequestedEvent,
 )
+from request_shoutout.domain.models import Charge
 from request_shoutout.domain.ports import DataBaseUnitOfWork, ProcessPaymentUnitOfWork
 from shoutouts.models import ShoutoutVideo as DjangoShoutoutVideo
 from utils.telegram import send_high_priority_notification
+from .identity_map import invalidate_identity_map
+from wirecard.captures import CaptureQueue
 from wirecard.services import (
-    CapturePaymentApi,
     OrderApi,
     PaymentApi,
     WirecardOrderApi,
-    WirecardPaymentApi,
+    WirecardPaymentUnconfirmedError,
 )
 User = get_user_model()
 
@@ -59,17 +66,54 @@ class PersistRequestShoutoutUnitOfWork(DataBaseUnitOfWork):
         except Exception:
             capture_exception()
             raise PersistingShoutoutRequestError()
+        finally:
+            invalidate_identity_map()
 
 
 class ChargingShoutoutRequestError(Exception):
     pass
 
 
+class PaymentGatewayUnavailableError(Exception):
+    pass
+
+
+class ChargeClaimedError(Exception):
+    pass
+
+
 class PaymentProcessUnitOfWork(ProcessPaymentUnitOfWork):
 
-    def __init__(self, bus):
+    def __init__(self, bus, payment_gateway=None, transient_errors=()):
+        """transient_errors leave the charge not processed, to be tried again later, instead
+        of failing it
+        """
         self.bus = bus
-        self.payment_gateway = WirecardOrderApi(OrderApi(), PaymentApi())
+        self.payment_gateway = payment_gateway or WirecardOrderApi(OrderApi(), PaymentApi())
+        self.transient_errors = transient_errors
+
+    def claim(self, order):
+        """Take the charge from not processed to charging in a single conditional UPDATE, so
+        concurrent deliveries of the same order don't both reach Wirecard. A claim older than
+        CHECKOUT_CHARGE_LEASE was left by a worker killed mid-charge and is taken over. An
+        unconfirmed charge is claimed too, its payment is looked up before a new one is sent"""
+        now = timezone.now()
+        expired = now - timedelta(seconds=settings.CHECKOUT_CHARGE_LEASE)
+        claimable = (
+            Q(status__in=[Charge.NOT_PROCESSED, Charge.UNCONFIRMED])
+            | Q(status=Charge.CHARGING, updated_at__lt=expired)
+        )
+        claimed = (
+            DjangoCharge.objects
+            .filter(claimable, order_id=order.id)
+            .update(status=Charge.CHARGING, updated_at=now)
+        )
+        if claimed:
+            order.charge.set_charging_status()
+            return True
+        if DjangoCharge.objects.filter(order_id=order.id, status=Charge.CHARGING).exists():
+            raise ChargeClaimedError(order.hash_id)
+        return False
 
     def charge(self, order):
         try:
@@ -84,6 +128,17 @@ class PaymentProcessUnitOfWork(ProcessPaymentUnitOfWork):
                 wirecard_order_hash=wirecard_order.id,
                 wirecard_payment_hash=wirecard_payment.id,
             )
+        except WirecardPaymentUnconfirmedError as e:
+            # O pagamento pode existir no Wirecard, então a cobrança não é falhada
+            order.charge.set_unconfirmed_status()
+            traceback = sys.exc_info()[2]
+            raise PaymentGatewayUnavailableError(e).with_traceback(traceback)
+        except self.transient_errors as e:
+            # A cobrança é liberada para a próxima tentativa
+            if order.charge.status == Charge.CHARGING:
+                order.charge.set_not_processed_status()
+            traceback = sys.exc_info()[2]
+            raise PaymentGatewayUnavailableError(e).with_traceback(traceback)
         except Exception as e:
             order.charge.set_failed_status()
             capture_exception()
@@ -95,6 +150,7 @@ class PaymentProcessUnitOfWork(ProcessPaymentUnitOfWork):
             self.bus.handle(event)
         finally:
             DjangoCharge.persist(order.charge)
+            invalidate_identity_map()
 
 
 class PersistingShoutoutVideoError(Exception):
@@ -126,6 +182,8 @@ class FulfillShoutoutRequestUnitOfWork(DataBaseUnitOfWork):
             capture_exception()
             traceback = sys.exc_info()[2]
             raise PersistingShoutoutVideoError(e).with_traceback(traceback)
+        finally:
+            invalidate_identity_map()
 
 
 class CapturingPaymentError(Exception):
@@ -134,18 +192,19 @@ class CapturingPaymentError(Exception):
 
 class CapturePaymentUnitOfWork:
 
-    def __init__(self, bus):
+    def __init__(self, bus, capture_queue=None):
         self.bus = bus
-        self.payment_gateway = WirecardPaymentApi(CapturePaymentApi())
+        self.capture_queue = capture_queue or CaptureQueue()
 
     def capture(self, transaction_data):
+        """The payment is captured by the worker draining the queue, so a slow Wirecard
+        doesn't hold the upload of the shoutout"""
         try:
-            wirecard_payment_hash = transaction_data.wirecard_payment_hash
-            self.payment_gateway.capture_payment(wirecard_payment_hash)
+            self.capture_queue.enqueue(transaction_data)
         except Exception as e:
             capture_exception(e)
             message = (
-                'OCORREU UM ERRO AO CAPTURAR UM PAGAMENTO. '
+                'OCORREU UM ERRO AO ENFILEIRAR A CAPTURA DE UM PAGAMENTO. '
                 'Verifique o Sentry: '
                 'https://sentry.io/organizations/viggio-sandbox/issues/?project=1770932'
             )
@@ -7,5 +7,7 @@ app_name = 'request_shoutout'
 
 urlpatterns = [
     path('charge/', views.ChargeOrderAPIView.as_view(), name='charge'),
+    path('accept/', views.AcceptOrderAPIView.as_view(), name='accept'),
     path('fulfill/', views.FulfillShoutoutRequestAPIView.as_view(), name='fulfill'),
+    path('fulfill/upload/', views.ShoutoutUploadAPIView.as_view(), name='fulfill_upload'),
 ]
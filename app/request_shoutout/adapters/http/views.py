@@ -1,33 +1,48 @@
+import mimetypes
+import os
 import uuid
 from distutils.util import strtobool
 
+from django.conf import settings
+
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import JSONParser, FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from direct_uploads.uploaders import DirectUploadError, finish_upload, start_upload
 from message_bus.routes import (
     get_charge_order_bus,
     get_fulfill_shoutout_request_bus,
 )
 from request_shoutout.adapters.db.orm import (
+    PaymentGatewayUnavailableError,
     PersistingShoutoutRequestError,
     PersistingShoutoutVideoError,
     ChargingShoutoutRequestError,
 )
-from request_shoutout.domain.messages import FulfillShoutoutRequestCommand, RequestShoutoutCommand
+from request_shoutout.domain.messages import (
+    AcceptShoutoutRequestCommand,
+    FulfillShoutoutRequestCommand,
+    RequestShoutoutCommand,
+)
 from request_shoutout.domain.models import (
     OrderHasShoutoutError,
     OrderExpiredError,
     TalentPermissionError,
 )
+from request_shoutout.tasks import charge_in_background
+from orders.models import Order
+from shoutouts.models import direct_upload_location
 from talents.models import Talent
 from talents.permissions import TalentAccessPermission
 
 
 class ChargeOrderAPIView(APIView):
     http_method_names = ['post']
+    command_class = RequestShoutoutCommand
+    success_status = status.HTTP_201_CREATED
 
     def _set_is_public_field(self, request):
         request.data['order_is_public'] = not request.data['order_is_not_public']
@@ -46,7 +61,7 @@ class ChargeOrderAPIView(APIView):
         if is_buyer_credit_card_owner:
             self._replicate_buyer_data(request)
         request.data.pop('not_my_cc')
-        command = RequestShoutoutCommand(order_hash_id=hash_id, **request.data)
+        command = self.command_class(order_hash_id=hash_id, **request.data)
         bus = get_charge_order_bus()
         try:
             bus.handle(command)
@@ -55,12 +70,66 @@ class ChargeOrderAPIView(APIView):
                 {'error': 'An issue happened while processing payment.'},
                 status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
+        except PaymentGatewayUnavailableError:
+            # A resposta do pagamento se perdeu e ele pode ter sido criado no Wirecard. A task
+            # procura o pagamento no pedido do Wirecard e o cliente acompanha a cobrança no
+            # detalhe do pedido, como no checkout assíncrono
+            charge_in_background(hash_id)
+            return Response({'order_hash': hash_id}, status.HTTP_202_ACCEPTED)
         except PersistingShoutoutRequestError:
             return Response(
                 {'error': 'An issue happened while persisting data.'},
                 status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
-        return Response({'order_hash': hash_id}, status.HTTP_201_CREATED)
+        return Response({'order_hash': hash_id}, self.success_status)
+
+
+class AcceptOrderAPIView(ChargeOrderAPIView):
+    """Persist the order and charge it in background, without waiting on Wirecard. The
+    client follows the charge status on the order detail"""
+    command_class = AcceptShoutoutRequestCommand
+    success_status = status.HTTP_202_ACCEPTED
+
+
+def shoutout_upload_purpose(order_hash):
+    return f'shoutout:{order_hash}'
+
+
+class ShoutoutUploadAPIView(APIView):
+    """Start the upload of the shoutout video straight to the storage. The upload_key
+    returned is sent to the fulfill endpoint in place of the video"""
+    permission_classes = (IsAuthenticated, TalentAccessPermission)
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        talent = Talent.objects.get(user_id=request.user.id)
+        order_hash = request.data.get('order_hash')
+        content_type = request.data.get('content_type') or ''
+        try:
+            size = int(request.data['size'])
+        except (KeyError, TypeError, ValueError):
+            size = 0
+        try:
+            uuid.UUID(str(order_hash))
+        except ValueError:
+            return Response({'error': 'Invalid order_hash.'}, status.HTTP_400_BAD_REQUEST)
+        if not Order.objects.filter(hash_id=order_hash, talent_id=talent.id).exists():
+            return Response(
+                {'error': 'Order belongs to another Talent.'},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        if not content_type.startswith('video/'):
+            return Response({'error': 'File must be a video.'}, status.HTTP_400_BAD_REQUEST)
+        if not 0 < size <= settings.SHOUTOUT_UPLOAD_MAX_SIZE:
+            return Response({'error': 'Invalid video size.'}, status.HTTP_400_BAD_REQUEST)
+        extension = (
+            os.path.splitext(request.data.get('filename', ''))[1]
+            or mimetypes.guess_extension(content_type)
+            or ''
+        )
+        key = direct_upload_location(talent.id, order_hash, extension.lower())
+        upload = start_upload(request, key, shoutout_upload_purpose(order_hash), content_type, size)
+        return Response(upload, status.HTTP_201_CREATED)
 
 
 class FulfillShoutoutRequestAPIView(APIView):
@@ -68,13 +137,28 @@ class FulfillShoutoutRequestAPIView(APIView):
     http_method_names = ['post']
     parser_classes = [JSONParser, FormParser, MultiPartParser]
 
+    def get_video_file(self, request):
+        """Storage key of the video uploaded straight to the storage, or the video sent
+        along with the request by the former clients"""
+        if 'upload_key' not in request.data:
+            return request.data['order_video']
+        return finish_upload(
+            request.data['upload_key'],
+            shoutout_upload_purpose(request.data['order_hash']),
+            request.user.id,
+        )
+
     def post(self, request, *args, **kwargs):
         hash_id = uuid.uuid4()
         talent = Talent.objects.get(user_id=request.user.id)
+        try:
+            video_file = self.get_video_file(request)
+        except DirectUploadError as error:
+            return Response({'error': str(error)}, status.HTTP_400_BAD_REQUEST)
         command = FulfillShoutoutRequestCommand(
             shoutout_hash=hash_id,
             order_hash=request.data['order_hash'],
-            video_file=request.data['order_video'],
+            video_file=video_file,
             talent_id=talent.id,
         )
         bus = get_fulfill_shoutout_request_bus()
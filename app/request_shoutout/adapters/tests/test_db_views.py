@@ -0,0 +1,157 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from message_bus.routes import get_fulfill_shoutout_request_bus
+from orders.models import Buyer, Charge, CreditCard, DefaultTalentProfitPercentage, Order
+from request_shoutout.adapters.db.db_views import (
+    view_customized_talent_profit_percentage,
+    view_order,
+    view_talent,
+)
+from request_shoutout.adapters.db.identity_map import identity_map_scope, invalidate_identity_map
+from request_shoutout.domain.messages import FulfillShoutoutRequestCommand
+from request_shoutout.domain.models import Charge as DomainCharge
+from shoutouts.models import ShoutoutVideo
+from talents.models import Talent
+from wirecard.models import WirecardTransactionData
+
+User = get_user_model()
+
+
+class ViewOrderTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(email='talent1@viggio.com.br', first_name='Nome', last_name='Sobrenome')
+        self.talent = Talent.objects.create(
+            user=user,
+            price=1000,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        self.order = Order.objects.create(
+            hash_id=uuid.uuid4(),
+            talent_id=self.talent.id,
+            video_is_for='someone_else',
+            is_from='MJ',
+            is_to='Peter',
+            instruction="Go Get 'em, Tiger",
+            email='mary.jane.watson@spiderman.com',
+            is_public=True,
+            expiration_datetime=datetime.now(timezone.utc) + timedelta(days=4),
+        )
+        charge = Charge.objects.create(
+            order=self.order,
+            amount_paid=1000,
+            payment_date=datetime.now(timezone.utc) - timedelta(days=3),
+            status=DomainCharge.PRE_AUTHORIZED,
+        )
+        CreditCard.objects.create(
+            charge=charge,
+            fullname='Peter Parker',
+            birthdate='2019-12-31',
+            tax_document='12346578910',
+            credit_card_hash='<encrypted-credit-card-hash>',
+        )
+        Buyer.objects.create(
+            charge=charge,
+            fullname='Mary Jane Watson',
+            birthdate='2019-12-31',
+            tax_document='09876543210',
+        )
+
+    def test_it_should_hydrate_the_order_aggregate_in_a_single_query(self):
+        with self.assertNumQueries(1):
+            order = view_order(self.order.hash_id)
+        self.assertEqual(order.id, self.order.id)
+        self.assertEqual(order.is_from, 'MJ')
+        self.assertEqual(order.expiration_datetime, self.order.expiration_datetime)
+        self.assertEqual(order.charge.status, DomainCharge.PRE_AUTHORIZED)
+        self.assertEqual(order.charge.amount_paid, 1000)
+        self.assertEqual(order.charge.funding_instrument.fullname, 'Peter Parker')
+        self.assertEqual(order.charge.buyer.fullname, 'Mary Jane Watson')
+        self.assertIsNone(order.shoutout)
+
+    def test_it_should_hydrate_the_order_shoutout_in_the_same_query(self):
+        shoutout = ShoutoutVideo.objects.create(
+            hash_id=uuid.uuid4(),
+            order=self.order,
+            talent=self.talent,
+            file=SimpleUploadedFile('file.mp4', b'filecontentstring'),
+        )
+        with self.assertNumQueries(1):
+            order = view_order(self.order.id)
+        self.assertEqual(order.shoutout.hash_id, shoutout.hash_id)
+        self.assertEqual(order.shoutout.order_id, self.order.id)
+        self.assertEqual(order.shoutout.video_file.name, shoutout.file.name)
+
+    def test_identity_map_should_load_the_aggregate_once_per_scope(self):
+        with identity_map_scope(), self.assertNumQueries(1):
+            order = view_order(self.order.hash_id)
+            self.assertIs(view_order(str(self.order.hash_id)), order)
+            self.assertIs(view_order(self.order.id), order)
+
+    def test_identity_map_should_cache_talents_and_missing_profit_percentages(self):
+        with identity_map_scope(), self.assertNumQueries(2):
+            talent = view_talent(self.talent.id)
+            self.assertIs(view_talent(self.talent.id), talent)
+            self.assertEqual(talent.user.email, 'talent1@viggio.com.br')
+            self.assertIsNone(view_customized_talent_profit_percentage(self.talent.id))
+            self.assertIsNone(view_customized_talent_profit_percentage(self.talent.id))
+
+    def test_invalidated_identity_map_should_load_the_aggregate_again(self):
+        with identity_map_scope(), self.assertNumQueries(2):
+            order = view_order(self.order.hash_id)
+            invalidate_identity_map()
+            self.assertIsNot(view_order(self.order.hash_id), order)
+
+    def test_without_identity_map_every_call_should_hit_the_database(self):
+        with self.assertNumQueries(2):
+            view_order(self.order.hash_id)
+            view_order(self.order.hash_id)
+
+    @override_settings(
+        task_eager_propagates=True,
+        task_always_eager=True,
+        broker_url='memory://',
+        backend='memory'
+    )
+    @mock.patch('transcoder.tasks.transcode', mock.Mock())
+    @mock.patch('post_office.mailgun.requests', mock.Mock())
+    @mock.patch('wirecard.client.WirecardClient.post')
+    def test_fulfilling_a_shoutout_request_should_load_the_order_once_per_commit(self, wirecard_post):  # noqa: E501
+        wirecard_post.return_value.status_code = 200
+        wirecard_post.return_value.json.return_value = {'id': 'PAY-HL7QRKFEQNHV', 'status': 'AUTHORIZED'}
+        WirecardTransactionData.objects.create(
+            order=self.order,
+            wirecard_order_hash='ORD-O5DLMAJZPTHV',
+            wirecard_payment_hash='PAY-HL7QRKFEQNHV',
+        )
+        DefaultTalentProfitPercentage.objects.create(value='0.75')
+        command = FulfillShoutoutRequestCommand(
+            shoutout_hash=uuid.uuid4(),
+            order_hash=str(self.order.hash_id),
+            talent_id=self.talent.id,
+            video_file=SimpleUploadedFile('file.mp4', b'filecontentstring'),
+        )
+        with CaptureQueriesContext(connection) as context:
+            get_fulfill_shoutout_request_bus().handle(command)
+        order_aggregate_queries = [
+            query for query in context.captured_queries if '"orders_creditcard"' in query['sql']
+        ]
+        talent_queries = [
+            query for query in context.captured_queries
+            if 'FROM "talents_talent" INNER JOIN "accounts_user"' in query['sql']
+        ]
+        # before and after FulfillShoutoutRequestUnitOfWork commit
+        self.assertEqual(len(order_aggregate_queries), 2)
+        self.assertEqual(len(talent_queries), 2)
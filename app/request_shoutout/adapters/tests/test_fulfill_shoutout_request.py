@@ -27,7 +27,7 @@ from orders.models import (
 from request_shoutout.domain.models import Charge as DomainCharge
 from shoutouts.models import ShoutoutVideo
 from utils.telegram import TELEGRAM_BOT_API_URL
-from wirecard.models import WirecardTransactionData
+from wirecard.models import PaymentCapture, WirecardTransactionData
 
 User = get_user_model()
 
@@ -52,7 +52,7 @@ def get_wirecard_mocked_abriged_response():
     broker_url='memory://',
     backend='memory'
 )
-@mock.patch('wirecard.services.requests.post', return_value=get_wirecard_mocked_abriged_response())
+@mock.patch('wirecard.client.WirecardClient.post', return_value=get_wirecard_mocked_abriged_response())
 class FulfillShoutoutRequestTest(APITestCase):
 
     def do_login(self, user, password):
@@ -279,6 +279,92 @@ class FulfillShoutoutRequestTest(APITestCase):
         )
         self.assertTrue(talent_profit_qs.exists())
 
+    def start_direct_upload(self, content):
+        response = self.client.post(
+            reverse('request_shoutout:fulfill_upload'),
+            {
+                'order_hash': self.order.hash_id,
+                'content_type': 'video/quicktime',
+                'size': len(content),
+                'filename': 'IMG_0042.MOV',
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['upload_url'], response.data['upload_key']
+
+    def upload_chunk(self, upload_url, content, start, size):
+        return self.client.put(
+            upload_url,
+            content,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(content) - 1}/{size}',
+        )
+
+    @mock.patch('transcoder.tasks.transcode', mock.Mock())
+    @mock.patch('post_office.mailgun.requests', mock.Mock())
+    def test_fulfilling_with_a_video_uploaded_straight_to_the_storage(self, mock1):
+        content = os.urandom(1024)
+        upload_url, upload_key = self.start_direct_upload(content)
+        response = self.upload_chunk(upload_url, content[:600], 0, len(content))
+        self.assertEqual(response.status_code, status.HTTP_308_PERMANENT_REDIRECT)
+        self.assertEqual(response['Range'], 'bytes=0-599')
+        response = self.upload_chunk(upload_url, content[600:], 600, len(content))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.post(
+            reverse('request_shoutout:fulfill'),
+            {'order_hash': self.order.hash_id, 'upload_key': upload_key},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        shoutout = ShoutoutVideo.objects.get()
+        expected_directory = f'orders/talent-{self.talent.id}/order-{self.order.hash_id}/upload-'
+        self.assertIn(expected_directory, shoutout.file.name)
+        self.assertTrue(shoutout.file.name.endswith('.mov'))
+        with shoutout.file.open('rb') as uploaded_video:
+            self.assertEqual(uploaded_video.read(), content)
+
+    def test_cant_fulfill_with_an_unfinished_upload(self, mock1):
+        content = os.urandom(1024)
+        upload_url, upload_key = self.start_direct_upload(content)
+        self.upload_chunk(upload_url, content[:600], 0, len(content))
+
+        response = self.client.post(
+            reverse('request_shoutout:fulfill'),
+            {'order_hash': self.order.hash_id, 'upload_key': upload_key},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'File was not uploaded.'})
+        self.assertEqual(ShoutoutVideo.objects.count(), 0)
+
+    def test_cant_upload_a_video_bigger_than_the_limit(self, mock1):
+        response = self.client.post(
+            reverse('request_shoutout:fulfill_upload'),
+            {
+                'order_hash': self.order.hash_id,
+                'content_type': 'video/mp4',
+                'size': 200 * 1024 * 1024 + 1,
+            },
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Invalid video size.'})
+
+    def test_cant_upload_a_video_to_a_malformed_order_hash(self, mock1):
+        response = self.client.post(
+            reverse('request_shoutout:fulfill_upload'),
+            {'order_hash': 'not-an-uuid', 'content_type': 'video/mp4', 'size': 1024},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Invalid order_hash.'})
+
     def test_cant_fulfill_same_order_twice(self, mock1):
         ShoutoutVideo.objects.create(
             hash_id=uuid.uuid4(),
@@ -326,23 +412,39 @@ class FulfillShoutoutRequestTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data, {'error': 'Order belongs to another Talent.'})
 
+    @mock.patch('transcoder.tasks.transcode', mock.Mock())
+    @mock.patch('post_office.mailgun.requests', mock.Mock())
+    def test_fulfilling_a_shoutout_request_should_capture_its_payment(self, mock1):
+        response = self.client.post(
+            reverse('request_shoutout:fulfill'),
+            self.request_data,
+            format='multipart'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        capture = PaymentCapture.objects.get()
+        self.assertEqual(capture.transaction.order, self.order)
+        self.assertEqual(capture.status, PaymentCapture.CAPTURED)
+
+    @override_settings(WIRECARD_CAPTURE_MAX_ATTEMPTS=1)
     @mock.patch('transcoder.tasks.transcode', mock.Mock())
     @mock.patch('post_office.mailgun.requests', mock.Mock())
     @mock.patch('utils.telegram.requests.post')
-    def test_when_capture_payment_fails_it_should_send_alert_message_to_staff(self, mock1, telegram_request_post):  # noqa: E501
+    def test_when_capture_payment_fails_it_should_send_alert_message_to_staff(self, telegram_request_post, mock1):  # noqa: E501
+        telegram_request_post.return_value.status_code = 200
         expected_call = mock.call(
             url=f'{TELEGRAM_BOT_API_URL}/sendMessage',
             data=json.dumps({
                 'chat_id': os.environ['TELEGRAM_GROUP_ID'],
                 'text': (
-                    'OCORREU UM ERRO AO CAPTURAR UM PAGAMENTO. '
+                    f'1 PAGAMENTO(S) NÃO FORAM CAPTURADOS APÓS 1 TENTATIVAS: '
+                    f'{FAKE_WIRECARD_PAYMENT_HASH}. '
                     'Verifique o Sentry: '
                     'https://sentry.io/organizations/viggio-sandbox/issues/?project=1770932'
                 )
             }),
             headers={'Content-Type': 'application/json'}
         )
-        method_path = 'request_shoutout.adapters.db.orm.WirecardPaymentApi.capture_payment'
+        method_path = 'wirecard.services.CapturePaymentApi.capture'
         with mock.patch(method_path, side_effect=Exception):
             response = self.client.post(
                 reverse('request_shoutout:fulfill'),
@@ -351,3 +453,4 @@ class FulfillShoutoutRequestTest(APITestCase):
             )
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(telegram_request_post.mock_calls, [expected_call])
+        self.assertEqual(PaymentCapture.objects.get().status, PaymentCapture.FAILED)
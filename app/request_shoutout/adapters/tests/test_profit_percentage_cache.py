@@ -0,0 +1,128 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from orders.models import (
+    AgencyProfitPercentage,
+    CustomTalentProfitPercentage,
+    DefaultTalentProfitPercentage,
+)
+from request_shoutout.adapters.cache.profit_percentages import (
+    cached_view_agency_profit_percentage,
+    cached_view_customized_talent_profit_percentage,
+    cached_view_default_talent_profit_percentage,
+    profit_percentage_cache,
+)
+from request_shoutout.domain.models import TalentProfitPercentage
+from talents.models import Agency, Talent
+from utils.caches import LocalMemoryBackend, MISSING, TTLCache
+
+User = get_user_model()
+
+
+@override_settings(PROFIT_PERCENTAGE_CACHE_TTL=60)
+class ProfitPercentageCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        user = User.objects.create(email='talent1@viggio.com.br', first_name='Nome', last_name='Sobrenome')
+        self.agency = Agency.objects.create(name='Agency')
+        self.talent = Talent.objects.create(
+            user=user,
+            price=1000,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+            agency=self.agency,
+        )
+        self.default_profit_percentage = DefaultTalentProfitPercentage.objects.create(value='0.75')
+        self.agency_profit_percentage = AgencyProfitPercentage.objects.create(
+            agency=self.agency,
+            value='0.05',
+        )
+        profit_percentage_cache.clear()
+
+    def test_default_talent_profit_percentage_should_be_queried_once(self):
+        with self.assertNumQueries(1):
+            first = cached_view_default_talent_profit_percentage()
+            second = cached_view_default_talent_profit_percentage()
+        self.assertEqual(first, TalentProfitPercentage(talent_id=None, value=Decimal('0.75')))
+        self.assertEqual(second, first)
+
+    def test_missing_customized_talent_profit_percentage_should_be_cached_too(self):
+        with self.assertNumQueries(1):
+            self.assertIsNone(cached_view_customized_talent_profit_percentage(self.talent.id))
+            self.assertIsNone(cached_view_customized_talent_profit_percentage(self.talent.id))
+
+    def test_saving_a_customized_talent_profit_percentage_should_invalidate_it(self):
+        cached_view_customized_talent_profit_percentage(self.talent.id)
+        CustomTalentProfitPercentage.objects.create(talent=self.talent, value='0.80')
+        with self.assertNumQueries(1):
+            profit_percentage = cached_view_customized_talent_profit_percentage(self.talent.id)
+        self.assertEqual(profit_percentage.value, Decimal('0.80'))
+
+    def test_saving_default_talent_profit_percentage_should_invalidate_it(self):
+        cached_view_default_talent_profit_percentage()
+        self.default_profit_percentage.value = '0.70'
+        self.default_profit_percentage.save()
+        self.assertEqual(cached_view_default_talent_profit_percentage().value, Decimal('0.70'))
+
+    def test_saving_agency_profit_percentage_should_invalidate_it(self):
+        self.assertEqual(cached_view_agency_profit_percentage(self.agency.id).value, Decimal('0.05'))
+        self.agency_profit_percentage.value = '0.10'
+        self.agency_profit_percentage.save()
+        self.assertEqual(cached_view_agency_profit_percentage(self.agency.id).value, Decimal('0.10'))
+
+    def test_cache_should_be_invalidated_only_after_the_commit(self):
+        cached_view_default_talent_profit_percentage()
+        with transaction.atomic():
+            self.default_profit_percentage.value = '0.70'
+            self.default_profit_percentage.save()
+            self.assertEqual(cached_view_default_talent_profit_percentage().value, Decimal('0.75'))
+        self.assertEqual(cached_view_default_talent_profit_percentage().value, Decimal('0.70'))
+
+    @override_settings(PROFIT_PERCENTAGE_CACHE_TTL=0)
+    def test_zero_ttl_should_disable_the_cache(self):
+        with self.assertNumQueries(2):
+            cached_view_default_talent_profit_percentage()
+            cached_view_default_talent_profit_percentage()
+
+
+class TTLCacheTest(TestCase):
+
+    @mock.patch('utils.caches.time.monotonic')
+    def test_entries_should_expire_after_ttl(self, monotonic):
+        monotonic.return_value = 100
+        cache = TTLCache(backend=LocalMemoryBackend(), ttl=10)
+        loader = mock.Mock(return_value={'value': '0.75'})
+        cache.get_or_load('key', loader)
+        monotonic.return_value = 109
+        cache.get_or_load('key', loader)
+        monotonic.return_value = 111
+        self.assertEqual(cache.get_or_load('key', loader), {'value': '0.75'})
+        self.assertEqual(loader.call_count, 2)
+
+    def test_local_backend_should_drop_the_least_recently_used_entry_when_full(self):
+        backend = LocalMemoryBackend(max_entries=2)
+        backend.set('a', '1', ttl=60)
+        backend.set('b', '2', ttl=60)
+        backend.get('a')
+        backend.set('c', '3', ttl=60)
+        self.assertEqual(len(backend), 2)
+        self.assertEqual(backend.get('a'), '1')
+        self.assertIs(backend.get('b'), MISSING)
+
+    @mock.patch('utils.caches.time.monotonic')
+    def test_local_backend_should_sweep_expired_entries_before_dropping_live_ones(self, monotonic):
+        monotonic.return_value = 100
+        backend = LocalMemoryBackend(max_entries=2)
+        backend.set('live', '1', ttl=60)
+        backend.set('expiring', '2', ttl=5)
+        monotonic.return_value = 110
+        backend.set('new', '3', ttl=60)
+        self.assertEqual(backend.get('live'), '1')
+        self.assertEqual(backend.get('new'), '3')
@@ -4,12 +4,17 @@ from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 from unittest import mock
 
+import requests
+from celery.exceptions import Retry
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from message_bus.dispatchers import InMemoryBroker
+from message_bus.routes import get_charge_order_bus
 from talents.models import Talent
 from request_shoutout.domain.models import (
     Charge as DomainCharge,
@@ -18,8 +23,10 @@ from request_shoutout.domain.models import (
     SP_TZ,
 )
 from orders.models import Buyer, Charge, CreditCard, Order
+from request_shoutout.tasks import charge_shoutout_request
+from wirecard.fake_server import DECLINED_CREDIT_CARD_HASH, FakeWirecardServer, unreachable_url
 from wirecard.models import WirecardTransactionData
-from wirecard.services import _get_headers
+from wirecard.services import _get_headers, PaymentApi
 
 User = get_user_model()
 
@@ -53,7 +60,7 @@ def get_wirecard_mocked_abriged_responses():
     backend='memory'
 )
 @mock.patch('post_office.mailgun.requests')
-@mock.patch('wirecard.services.requests.post', side_effect=get_wirecard_mocked_abriged_responses())
+@mock.patch('wirecard.client.WirecardClient.post', side_effect=get_wirecard_mocked_abriged_responses())
 class ChargeShoutoutRequestTest(APITestCase):
 
     def setUp(self):
@@ -450,3 +457,263 @@ class ChargeShoutoutRequestTest(APITestCase):
         self.assertEqual(Charge.objects.count(), 1)
         charge = Charge.objects.first()
         self.assertEqual(charge.status, DomainCharge.FAILED)
+
+    def test_customer_and_talent_emails_should_be_deferred_by_order(self, mock1, mailgun_mocked_requests):  # noqa: E501
+        bus = get_charge_order_bus()
+        broker = InMemoryBroker()
+        with mock.patch.object(bus, 'dispatcher', broker):
+            response = self.client.post(
+                reverse('request_shoutout:charge'),
+                self.request_data,
+                format='json',
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(mailgun_mocked_requests.post.call_count, 0)
+            self.assertEqual(list(broker.partitions), [response.data['order_hash']])
+            self.assertEqual(broker.pending(), 2)
+            broker.run_pending()
+        self.assertEqual(mailgun_mocked_requests.post.call_count, 2)
+
+
+@override_settings(
+    task_eager_propagates=True,
+    task_always_eager=True,
+    broker_url='memory://',
+    backend='memory'
+)
+@mock.patch('post_office.mailgun.requests')
+class AcceptShoutoutRequestTest(APITestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.wirecard = FakeWirecardServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.wirecard.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.wirecard.orders.clear()
+        self.wirecard.payments.clear()
+        self.wirecard.failures.clear()
+        del self.wirecard.requests[:]
+        environ = mock.patch.dict(os.environ, self.wirecard.environ())
+        environ.start()
+        self.addCleanup(environ.stop)
+        talent = Talent.objects.create(
+            user=User.objects.create(email='talento@youtube.com'),
+            price=150,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        self.request_data = {
+            'order_video_is_for': 'someone_else',
+            'order_is_from': 'MJ',
+            'order_is_to': 'Peter',
+            'order_instruction': "Go Get 'em, Tiger",
+            'order_email': 'mary.jane.watson@spiderman.com',
+            'order_talent_id': talent.id,
+            'order_amount_paid': 150,
+            'order_is_not_public': False,
+            'customer_fullname': 'Mary Jane Watson',
+            'customer_birthdate': '31/12/2019',
+            'customer_phone_number': '987654321',
+            'customer_area_code': '11',
+            'customer_tax_document': '01234567890',
+            'credit_card_owner_fullname': 'Mary Jane Watson',
+            'credit_card_hash': '<encrypted-credit-card-hash>',
+            'not_my_cc': 'false',
+        }
+
+    def accept(self):
+        with mock.patch.object(charge_shoutout_request, 'delay') as mocked_delay:
+            response = self.client.post(
+                reverse('request_shoutout:accept'),
+                self.request_data,
+                format='json',
+            )
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        mocked_delay.assert_called_once_with(str(response.data['order_hash']))
+        return str(response.data['order_hash'])
+
+    def test_order_should_be_accepted_before_being_charged(self, mailgun_mocked_requests):
+        order_hash = self.accept()
+
+        self.assertEqual(self.wirecard.orders, {})
+        self.assertEqual(Charge.objects.get().status, DomainCharge.NOT_PROCESSED)
+        response = self.client.get(reverse('orders:detail', args=[order_hash]))
+        self.assertEqual(response.data['charge']['status'], DomainCharge.NOT_PROCESSED)
+        self.assertIn('Retry-After', response)
+
+        charge_shoutout_request.apply(args=[order_hash])
+
+        response = self.client.get(reverse('orders:detail', args=[order_hash]))
+        self.assertEqual(response.data['charge']['status'], DomainCharge.PROCESSING)
+        self.assertNotIn('Retry-After', response)
+        transaction_data = WirecardTransactionData.objects.get()
+        self.assertIn(transaction_data.wirecard_order_hash, self.wirecard.orders)
+        self.assertIn(transaction_data.wirecard_payment_hash, self.wirecard.payments)
+        self.assertEqual(mailgun_mocked_requests.post.call_count, 2)
+
+    def test_charge_should_resume_from_the_wirecard_order_already_created(self, mock1):
+        order_hash = self.accept()
+        create_payment = PaymentApi.create
+        attempts = []
+
+        def unreachable_on_the_first_attempt(payment_api, *args, **kwargs):
+            url = unreachable_url('/v2/orders/{}/payments')
+            environ = {} if attempts else {'WIRECARD_CREATE_PAYMENT_URL': url}
+            attempts.append(args)
+            with mock.patch.dict(os.environ, environ):
+                return create_payment(payment_api, *args, **kwargs)
+
+        with mock.patch.object(PaymentApi, 'create', unreachable_on_the_first_attempt):
+            # throw=False: a retry runs again eagerly instead of being raised
+            charge_shoutout_request.apply(args=[order_hash], throw=False)
+
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(Charge.objects.get().status, DomainCharge.PROCESSING)
+        self.assertEqual(len(self.wirecard.orders), 1)
+        self.assertEqual(len(self.wirecard.payments), 1)
+
+    def _routes_requested(self, route):
+        return [requested for requested, _ in self.wirecard.requests if requested == route]
+
+    def test_payment_that_reached_wirecard_should_not_be_sent_again(self, mock1):
+        order_hash = self.accept()
+        self.wirecard.fail('payments')
+
+        charge_shoutout_request.apply(args=[order_hash], throw=False)
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.PROCESSING)
+        self.assertEqual(len(self.wirecard.payments), 1)
+        self.assertEqual(len(self._routes_requested('payments')), 1)
+        self.assertEqual(len(self._routes_requested('order')), 1)
+        self.assertIn(
+            WirecardTransactionData.objects.get().wirecard_payment_hash,
+            self.wirecard.payments,
+        )
+
+    def test_payment_lost_before_reaching_wirecard_should_be_sent_again(self, mock1):
+        order_hash = self.accept()
+        create_payment = PaymentApi.create
+        attempts = []
+
+        def timeout_on_the_first_attempt(payment_api, *args, **kwargs):
+            attempts.append(args)
+            if len(attempts) == 1:
+                raise requests.ReadTimeout()
+            return create_payment(payment_api, *args, **kwargs)
+
+        with mock.patch.object(PaymentApi, 'create', timeout_on_the_first_attempt):
+            charge_shoutout_request.apply(args=[order_hash], throw=False)
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.PROCESSING)
+        self.assertEqual(len(self.wirecard.payments), 1)
+        self.assertEqual(len(self._routes_requested('order')), 1)
+
+    @mock.patch('request_shoutout.tasks.send_high_priority_notification')
+    def test_unconfirmed_payment_should_not_fail_the_charge(self, notification, mock1):
+        order_hash = self.accept()
+        self.wirecard.fail('payments')
+
+        charge_shoutout_request.apply(
+            args=[order_hash],
+            retries=charge_shoutout_request.max_retries,
+        )
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.UNCONFIRMED)
+        self.assertIn(order_hash, notification.call_args[0][0])
+        response = self.client.get(reverse('orders:detail', args=[order_hash]))
+        self.assertIn('Retry-After', response)
+
+    def test_payment_timed_out_on_the_charge_endpoint_should_be_confirmed_in_background(
+        self, mock1
+    ):
+        create_payment = PaymentApi.create
+
+        def answer_lost(payment_api, *args, **kwargs):
+            create_payment(payment_api, *args, **kwargs)
+            raise requests.ReadTimeout()
+
+        with mock.patch.object(PaymentApi, 'create', answer_lost):
+            with mock.patch.object(charge_shoutout_request, 'delay') as mocked_delay:
+                response = self.client.post(
+                    reverse('request_shoutout:charge'),
+                    self.request_data,
+                    format='json',
+                )
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        order_hash = str(response.data['order_hash'])
+        mocked_delay.assert_called_once_with(order_hash)
+        self.assertEqual(Charge.objects.get().status, DomainCharge.UNCONFIRMED)
+
+        charge_shoutout_request.apply(args=[order_hash])
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.PROCESSING)
+        self.assertEqual(len(self.wirecard.payments), 1)
+        self.assertIn(
+            WirecardTransactionData.objects.get().wirecard_payment_hash,
+            self.wirecard.payments,
+        )
+
+    def test_duplicated_delivery_should_not_charge_again(self, mock1):
+        order_hash = self.accept()
+
+        charge_shoutout_request.apply(args=[order_hash])
+        charge_shoutout_request.apply(args=[order_hash])
+
+        self.assertEqual(len(self.wirecard.orders), 1)
+        self.assertEqual(len(self.wirecard.payments), 1)
+
+    def test_charge_claimed_by_another_delivery_should_not_be_charged_again(self, mock1):
+        order_hash = self.accept()
+        # Outra entrega reservou a cobrança e ainda está falando com o Wirecard
+        Charge.objects.update(status=DomainCharge.CHARGING, updated_at=datetime.now(timezone.utc))
+
+        with mock.patch.object(charge_shoutout_request, 'retry', side_effect=Retry) as retry:
+            charge_shoutout_request.apply(args=[order_hash], throw=False)
+
+        self.assertEqual(retry.call_args[1]['countdown'], settings.CHECKOUT_CHARGE_LEASE)
+        self.assertEqual(Charge.objects.get().status, DomainCharge.CHARGING)
+        self.assertEqual(self.wirecard.orders, {})
+        self.assertFalse(WirecardTransactionData.objects.exists())
+
+    @override_settings(CHECKOUT_CHARGE_LEASE=60)
+    def test_claim_left_by_a_killed_worker_should_be_taken_over(self, mock1):
+        order_hash = self.accept()
+        Charge.objects.update(
+            status=DomainCharge.CHARGING,
+            updated_at=datetime.now(timezone.utc) - timedelta(seconds=61),
+        )
+
+        charge_shoutout_request.apply(args=[order_hash])
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.PROCESSING)
+        self.assertEqual(len(self.wirecard.payments), 1)
+
+    def test_declined_credit_card_should_fail_the_charge(self, mock1):
+        self.request_data['credit_card_hash'] = DECLINED_CREDIT_CARD_HASH
+        order_hash = self.accept()
+
+        charge_shoutout_request.apply(args=[order_hash])
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.FAILED)
+
+    def test_charge_should_fail_when_wirecard_stays_unreachable(self, mock1):
+        order_hash = self.accept()
+
+        with mock.patch.dict(os.environ, {'WIRECARD_CREATE_ORDER_URL': unreachable_url()}):
+            charge_shoutout_request.apply(
+                args=[order_hash],
+                retries=charge_shoutout_request.max_retries,
+            )
+
+        self.assertEqual(Charge.objects.get().status, DomainCharge.FAILED)
+        self.assertEqual(self.wirecard.orders, {})
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class RequestShoutoutConfig(AppConfig):
     name = 'request_shoutout'
+
+    def ready(self):
+        from .adapters.cache import signals  # noqa: F401
@@ -47,6 +47,18 @@ class RequestShoutoutCommand:
         self.credit_card_hash = credit_card_hash
 
 
+class AcceptShoutoutRequestCommand(RequestShoutoutCommand):
+    """Same request, but charged in background after the order is persisted"""
+    NAME = 'AcceptShoutoutRequest'
+
+
+class ChargeShoutoutRequestCommand:
+    NAME = 'ChargeShoutoutRequest'
+
+    def __init__(self, order_hash_id):
+        self.order_hash_id = order_hash_id
+
+
 class ShoutoutSuccessfullyRequestedEvent:
     NAME = 'ShoutoutSuccessfullyRequested'
 
@@ -128,6 +128,9 @@ class CreditCard:
 class Charge:
 
     NOT_PROCESSED = 'not_processed'
+    CHARGING = 'charging'
+    # A resposta do Wirecard se perdeu e o pagamento pode ter sido criado
+    UNCONFIRMED = 'unconfirmed'
     PROCESSING = 'processing'
     PRE_AUTHORIZED = 'pre_authorized'
     PAID = 'paid'
@@ -152,6 +155,15 @@ class Charge:
         self.funding_instrument = funding_instrument
         self.buyer = buyer
 
+    def set_not_processed_status(self):
+        self.status = Charge.NOT_PROCESSED
+
+    def set_charging_status(self):
+        self.status = Charge.CHARGING
+
+    def set_unconfirmed_status(self):
+        self.status = Charge.UNCONFIRMED
+
     def set_failed_status(self):
         self.status = Charge.FAILED
 
@@ -3,6 +3,10 @@ import abc
 
 class ProcessPaymentUnitOfWork(abc.ABC):
 
+    @abc.abstractmethod
+    def claim(self, order):
+        pass
+
     @abc.abstractmethod
     def charge(self, order):
         pass
@@ -55,6 +55,18 @@ def process_payment(command, unit_of_work, view_order):
     unit_of_work.charge(order)
 
 
+def schedule_payment_processing(command, charger):
+    charger(command.order_hash_id)
+
+
+def process_accepted_payment(command, unit_of_work, view_order):
+    order = view_order(command.order_hash_id)
+    if not unit_of_work.claim(order):
+        # Entrega duplicada de uma cobrança já processada
+        return
+    unit_of_work.charge(order)
+
+
 def send_info_to_customer_about_his_shoutout_request(event, mail_sender, view_talent):
     talent = view_talent(event.order.talent_id)
     to_customer = MailRequest(
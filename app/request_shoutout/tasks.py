@@ -0,0 +1,60 @@
+from django.conf import settings
+from sentry_sdk import capture_exception
+
+from message_bus.registry import buses, CHARGE_ORDER_BUS
+from orders.models import Charge
+from project_configuration.celery import app
+from request_shoutout.adapters.db.orm import (
+    ChargeClaimedError,
+    ChargingShoutoutRequestError,
+    PaymentGatewayUnavailableError,
+)
+from request_shoutout.domain.messages import ChargeShoutoutRequestCommand
+from request_shoutout.domain.models import Charge as DomainCharge
+from utils.telegram import send_high_priority_notification
+
+
+def charge_in_background(order_hash_id):
+    charge_shoutout_request.delay(str(order_hash_id))
+
+
+# acks_late: a cobrança volta para a fila se o worker morrer no meio das chamadas ao Wirecard
+@app.task(bind=True, max_retries=settings.CHECKOUT_CHARGE_MAX_RETRIES, acks_late=True)
+def charge_shoutout_request(self, order_hash_id):
+    """Charge an accepted order, the customer follows the charge status on the order detail.
+    The Wirecard ids are checkpointed by the order, so the retries resume from them"""
+    bus = buses.get(CHARGE_ORDER_BUS)
+    try:
+        bus.handle(ChargeShoutoutRequestCommand(order_hash_id))
+    except ChargingShoutoutRequestError:
+        # A cobrança já foi marcada como falha e a exceção enviada ao sentry
+        return
+    except ChargeClaimedError as exc:
+        # Outra entrega está cobrando o pedido, se o worker dela morrer a cobrança é retomada
+        # depois que o prazo da reserva expirar
+        if self.request.retries >= self.max_retries:
+            capture_exception()
+            return
+        raise self.retry(exc=exc, countdown=settings.CHECKOUT_CHARGE_LEASE)
+    except PaymentGatewayUnavailableError as exc:
+        if self.request.retries >= self.max_retries:
+            capture_exception()
+            (
+                Charge.objects
+                .filter(order__hash_id=order_hash_id, status=DomainCharge.NOT_PROCESSED)
+                .update(status=DomainCharge.FAILED)
+            )
+            # Sem a resposta do Wirecard a cobrança não pode ser falhada, o pagamento pode
+            # ter sido pré-autorizado
+            unconfirmed = Charge.objects.filter(
+                order__hash_id=order_hash_id,
+                status=DomainCharge.UNCONFIRMED,
+            )
+            if unconfirmed.exists():
+                send_high_priority_notification(
+                    f'A COBRANÇA DO PEDIDO {order_hash_id} NÃO FOI CONFIRMADA PELO WIRECARD. '
+                    'Confira o pagamento no Wirecard antes de atualizar a cobrança.'
+                )
+            return
+        countdown = settings.CHECKOUT_CHARGE_RETRY_DELAY * 2 ** self.request.retries
+        raise self.retry(exc=exc, countdown=countdown)
@@ -1,5 +1,6 @@
 from collections import namedtuple
 
+from request_shoutout.domain.models import Charge
 from request_shoutout.domain.ports import DataBaseUnitOfWork, ProcessPaymentUnitOfWork
 
 
@@ -23,6 +24,12 @@ class RequestShoutoutFakeUnitOfWork(DataBaseUnitOfWork):
 
 class PaymentProcessFakeUnitOfWork(ProcessPaymentUnitOfWork):
 
+    def claim(self, order):
+        if not order.charge.status == Charge.NOT_PROCESSED:
+            return False
+        order.charge.set_charging_status()
+        return True
+
     def charge(self, order):
         order.charge.set_processing_status()
         if order.charge.amount_paid > 10000:
@@ -8,6 +8,8 @@ import pytest
 
 from request_shoutout.domain.emails.sender import EmailSender
 from request_shoutout.domain.messages import (
+    AcceptShoutoutRequestCommand,
+    ChargeShoutoutRequestCommand,
     RequestShoutoutCommand,
     ShoutoutSuccessfullyRequestedEvent,
 )
@@ -15,7 +17,9 @@ from request_shoutout.domain.models import Charge, Order, RequiredFieldError
 from request_shoutout.services.request_shoutout import (
     notify_talent_about_new_shoutout_request,
     persist_request_shoutout,
+    process_accepted_payment,
     process_payment,
+    schedule_payment_processing,
     send_info_to_customer_about_his_shoutout_request,
 )
 from request_shoutout.tests.fakes.adapters import (
@@ -205,6 +209,44 @@ class TestWhenChargeProcessingFails:
         assert self.charge.status == Charge.FAILED
 
 
+class TestWhenAShoutoutRequestIsAccepted:
+
+    def setup_method(self):
+        self.charged = []
+        self.charge = Charge(
+            order_id=1,
+            amount_paid=150,
+            payment_date=datetime.now(timezone.utc).date(),
+            status=Charge.NOT_PROCESSED,
+            funding_instrument=None,
+            buyer=None,
+        )
+        self.order = Order(
+            hash_id=DATA['order_hash_id'],
+            talent_id=1,
+            video_is_for='someone_else',
+            is_from='Customer',
+            is_to='Someone',
+            instruction="Go Get 'em, Tiger",
+            email='customer@viggio.com.br',
+            is_public=True,
+            charge=self.charge,
+        )
+
+    def test_it_should_schedule_the_payment_processing(self):
+        command = AcceptShoutoutRequestCommand(**DATA)
+        schedule_payment_processing(command, self.charged.append)
+        assert self.charged == [DATA['order_hash_id']]
+
+    def test_it_should_process_the_payment_once(self):
+        command = ChargeShoutoutRequestCommand(DATA['order_hash_id'])
+        unit_of_work = mock.Mock(wraps=PaymentProcessFakeUnitOfWork())
+        process_accepted_payment(command, unit_of_work, FakeDBView(self.order))
+        process_accepted_payment(command, unit_of_work, FakeDBView(self.order))
+        assert self.charge.status == Charge.PROCESSING
+        assert unit_of_work.charge.call_count == 1
+
+
 class TestWhenAShoutoutIsSuccessfullyRequested:
 
     def setup_method(self):
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.7 on 2026-10-18 11:14
+
+from django.db import migrations, models
+import shoutouts.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoutouts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoutoutvideo',
+            name='preview_file',
+            field=models.FileField(blank=True, max_length=140, upload_to=shoutouts.models.upload_location),
+        ),
+    ]
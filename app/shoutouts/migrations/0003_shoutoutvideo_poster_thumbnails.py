@@ -0,0 +1,24 @@
+# Generated by Django 2.2.7 on 2026-10-18 11:17
+
+from django.db import migrations, models
+import shoutouts.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shoutouts', '0002_shoutoutvideo_preview_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoutoutvideo',
+            name='poster_file',
+            field=models.FileField(blank=True, max_length=140, upload_to=shoutouts.models.upload_location),
+        ),
+        migrations.AddField(
+            model_name='shoutoutvideo',
+            name='thumbnails_file',
+            field=models.FileField(blank=True, max_length=140, upload_to=shoutouts.models.upload_location),
+        ),
+    ]
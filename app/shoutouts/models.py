@@ -5,7 +5,12 @@ from django.utils.text import slugify
 from orders.models import Order
 from talents.models import Talent
 from utils.base_models import BaseModel
-from transcoder.transcoders import TRANSCODED_VIDEO_GENERIC_NAME
+from transcoder.transcoders import (
+    POSTER_GENERIC_NAME,
+    PREVIEW_VIDEO_GENERIC_NAME,
+    THUMBNAILS_GENERIC_NAME,
+    TRANSCODED_VIDEO_GENERIC_NAME,
+)
 
 
 def upload_location(instance, filename):
@@ -17,9 +22,22 @@ def upload_location(instance, filename):
     new_filename = f'viggio-para-{is_to_slug}.{extension}'
     if TRANSCODED_VIDEO_GENERIC_NAME in filename:
         new_filename = f'{extension}/viggio-para-{is_to_slug}.{extension}'
+    if PREVIEW_VIDEO_GENERIC_NAME in filename:
+        new_filename = f'preview/viggio-para-{is_to_slug}.{extension}'
+    if POSTER_GENERIC_NAME in filename:
+        new_filename = f'poster/viggio-para-{is_to_slug}.{extension}'
+    if THUMBNAILS_GENERIC_NAME in filename:
+        new_filename = f'thumbnails/viggio-para-{is_to_slug}.{extension}'
     return orders_directory + order_unique_identifier + new_filename
 
 
+def direct_upload_location(talent_id, order_hash, extension):
+    """Storage key of a video uploaded by the browser, before it's attached to a shoutout"""
+    orders_directory = f'{settings.MEDIA_DIRECTORY}/orders/'
+    order_unique_identifier = f'talent-{talent_id}/order-{order_hash}/'
+    return f'{orders_directory}{order_unique_identifier}upload-{uuid.uuid4().hex}{extension}'
+
+
 class ShoutoutVideo(BaseModel):
     hash_id = models.UUIDField(unique=True, default=uuid.uuid4)
     order = models.OneToOneField(
@@ -30,6 +48,11 @@ class ShoutoutVideo(BaseModel):
     )
     talent = models.ForeignKey(Talent, on_delete=models.CASCADE)
     file = models.FileField(upload_to=upload_location, max_length=140)
+    # Versão leve do vídeo transcodado, para assistir antes de baixar
+    preview_file = models.FileField(upload_to=upload_location, max_length=140, blank=True)
+    # Frame de capa e tira de miniaturas, para as páginas não carregarem o vídeo
+    poster_file = models.FileField(upload_to=upload_location, max_length=140, blank=True)
+    thumbnails_file = models.FileField(upload_to=upload_location, max_length=140, blank=True)
 
     def __str__(self):
         return f'customer: {self.order.email} - talent: {self.order.talent}'
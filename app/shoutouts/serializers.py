@@ -15,6 +15,9 @@ class ShoutoutSerializer(serializers.ModelSerializer):
             'shoutout_hash',
             'talent_id',
             'file',
+            'preview_file',
+            'poster_file',
+            'thumbnails_file',
             'order',
         ]
 
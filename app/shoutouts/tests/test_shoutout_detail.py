@@ -68,6 +68,9 @@ class ShoutoutDetailTest(APITestCase):
             'shoutout_hash': str(SHOUTOUT_HASH),
             'talent_id': self.talent.id,
             'file': self.shoutout.file.url,
+            'preview_file': None,
+            'poster_file': None,
+            'thumbnails_file': None,
             'order': {
                 'order_hash': str(ORDER_HASH),
                 'talent_id': self.talent.id,
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TalentConfig(AppConfig):
     name = 'talents'
+
+    def ready(self):
+        from . import signals  # noqa: F401
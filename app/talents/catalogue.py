@@ -0,0 +1,152 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.db.models import F
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+from utils.caches import LocalMemoryBackend, RedisBackend, TTLCache
+from .models import CatalogueEntry, Talent
+
+
+# Primo de Mersenne maior que qualquer id, então (id * a + b) % PRIME é uma permutação dos ids
+CATALOGUE_SHUFFLE_PRIME = 2147483647
+
+CATALOGUE_WRITE_BATCH_SIZE = 1000
+
+
+def get_current_shuffle_seed():
+    period = getattr(settings, 'CATALOGUE_SHUFFLE_PERIOD', 3600)
+    return int(time.time() // period)
+
+
+def get_stored_shuffle_seeds():
+    """The former shuffle is kept for the clients still paging it and the next one is
+    written ahead, so it's ready when the period turns"""
+    current_seed = get_current_shuffle_seed()
+    return [current_seed - 1, current_seed, current_seed + 1]
+
+
+def shuffle_position(seed, talent_id):
+    """Position of the talent in the shuffle of the seed, computed from its id.
+
+    Unlike ORDER BY RANDOM() it's stable for the whole shuffle period, so the cursor
+    pagination never repeats or skips talents between pages.
+    """
+    rng = random.Random(seed)
+    multiplier = rng.randrange(1, CATALOGUE_SHUFFLE_PRIME)
+    increment = rng.randrange(CATALOGUE_SHUFFLE_PRIME)
+    return (talent_id * multiplier + increment) % CATALOGUE_SHUFFLE_PRIME
+
+
+def write_shuffle(seed, talents_ids):
+    # Linhas já gravadas são ignoradas, então escrever o mesmo embaralhamento de novo é seguro
+    CatalogueEntry.objects.bulk_create(
+        [
+            CatalogueEntry(
+                shuffle=seed,
+                talent_id=talent_id,
+                position=shuffle_position(seed, talent_id),
+            )
+            for talent_id in talents_ids
+        ],
+        batch_size=CATALOGUE_WRITE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def store_catalogue_shuffles():
+    """Write the stored shuffles of every talent and drop the expired ones. The available
+    flag is filtered when the pages are read, so it doesn't need a new shuffle"""
+    seeds = get_stored_shuffle_seeds()
+    CatalogueEntry.objects.exclude(shuffle__in=seeds).delete()
+    talents_ids = list(Talent.objects.values_list('id', flat=True))
+    for seed in seeds:
+        write_shuffle(seed, talents_ids)
+
+
+def add_to_stored_shuffles(talent_id):
+    """A new talent gets into the shuffles already stored, instead of waiting for the next
+    reshuffle"""
+    seeds = (
+        CatalogueEntry.objects
+        .filter(shuffle__in=get_stored_shuffle_seeds())
+        .values_list('shuffle', flat=True)
+        .distinct()
+    )
+    for seed in seeds:
+        write_shuffle(seed, [talent_id])
+
+
+def store_missing_shuffle(seed):
+    """Write the shuffle when the task didn't yet (a deploy before the first reshuffle),
+    True when it was missing"""
+    if CatalogueEntry.objects.filter(shuffle=seed).exists():
+        return False
+    write_shuffle(seed, Talent.objects.values_list('id', flat=True))
+    return True
+
+
+def catalogue_queryset(seed):
+    """Available talents in the order of the stored shuffle, the cursor pages are ranges of
+    the (shuffle, position) index"""
+    return (
+        Talent.objects
+        .filter(available=True, catalogue_entries__shuffle=seed)
+        .annotate(catalogue_position=F('catalogue_entries__position'))
+        .select_related('user', 'user__customer', 'presentation_video')
+        .prefetch_related('categories')
+    )
+
+
+class CataloguePagination(CursorPagination):
+    """Cursor pagination that keeps the shuffle seed of the first page in the links"""
+    page_size = 20
+    ordering = 'catalogue_position'
+    seed_query_param = 'seed'
+
+    def get_seed(self, request):
+        """Seed of the link while its shuffle is stored, the current one otherwise"""
+        try:
+            seed = int(request.query_params[self.seed_query_param])
+        except (KeyError, ValueError):
+            return get_current_shuffle_seed()
+        if seed not in get_stored_shuffle_seeds():
+            return get_current_shuffle_seed()
+        return seed
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.seed = self.get_seed(request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def encode_cursor(self, cursor):
+        url = super().encode_cursor(cursor)
+        return replace_query_param(url, self.seed_query_param, self.seed)
+
+
+def _get_backend():
+    redis_url = getattr(settings, 'CATALOGUE_CACHE_REDIS_URL', None)
+    if redis_url:
+        return RedisBackend(redis_url, prefix='catalogue:')
+    return LocalMemoryBackend(getattr(settings, 'CATALOGUE_CACHE_MAX_ENTRIES', 1024))
+
+
+def _get_ttl():
+    return getattr(settings, 'CATALOGUE_CACHE_TTL', 0)
+
+
+catalogue_cache = TTLCache(backend=_get_backend, ttl=_get_ttl)
+
+CATALOGUE_VERSION_KEY = 'version'
+
+
+def catalogue_page_key(host, seed, cursor):
+    # As páginas antigas ficam inacessíveis quando a versão muda e expiram pelo TTL
+    version = catalogue_cache.get_or_load(CATALOGUE_VERSION_KEY, lambda: uuid.uuid4().hex)
+    return f'page:{version}:{host}:{seed}:{cursor or ""}'
+
+
+def invalidate_catalogue_cache():
+    catalogue_cache.invalidate(CATALOGUE_VERSION_KEY)
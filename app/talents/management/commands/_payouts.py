@@ -0,0 +1,140 @@
+import io
+import json
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+
+from talents.management.services.payouts import (
+    apply_payouts,
+    get_payees_to_be_paid_in_the_month,
+    PaidProfitsMismatchError,
+    reconcile_payouts,
+    write_payout_csv,
+)
+from utils.csv_reader import CSVReader
+
+
+class WritePayoutCSVCommand(BaseCommand):
+    payout = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--month',
+            type=int,
+            help=''
+        )
+        parser.add_argument(
+            '--year',
+            type=int,
+            help=''
+        )
+
+    def handle(self, *args, **options):
+        month = options['month']
+        year = options['year']
+        payees_to_be_paid = get_payees_to_be_paid_in_the_month(self.payout, month, year)
+        write_payout_csv(self.payout, payees_to_be_paid, month, year)
+        self.stdout.write(self.style.SUCCESS('CSV created.'))
+
+
+class UpdatePaidPayoutsFromCSVCommand(BaseCommand):
+    payout = None
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv',
+            type=str,
+            help=''
+        )
+        parser.add_argument(
+            '--month',
+            type=int,
+            help=''
+        )
+        parser.add_argument(
+            '--year',
+            type=int,
+            help=''
+        )
+        parser.add_argument(
+            '--report',
+            type=str,
+            help='Path to write a JSON report with the paid payees and the mismatches'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only check the CSV, nothing is written to the database'
+        )
+
+    def _warn_mismatch(self, mismatch):
+        database = mismatch['database'] or {}
+        message = (
+            f'There is an issue with {mismatch["payee"]} ({mismatch["reason"]})\n'
+            '-------------- CSV | DATABASE\n'
+            f'paid --------- {mismatch["csv"]["paid"]} |\n'
+            f'total_paid --- {mismatch["csv"]["total_paid"]} | {database.get("total_to_pay")}\n'
+            f'num_profits ---- {mismatch["csv"]["num_profits"]} | {database.get("num_profits")}\n'
+        )
+        self.stdout.write(self.style.WARNING(message))
+
+    def _process_csv(self, csv_file, month, year):
+        csv_reader = CSVReader(
+            file_object=csv_file,
+            header=self.payout.csv_header,
+            columns_mapper=self.payout.csv_columns_mapper,
+            delimiter=','
+        )
+        reconciliation = reconcile_payouts(self.payout, csv_reader.get_data(), month, year)
+        if not self.dry_run:
+            try:
+                apply_payouts(self.payout, reconciliation)
+            except PaidProfitsMismatchError as e:
+                self.stdout.write(self.style.ERROR(f'Nothing was paid: {e}'))
+                return
+        for mismatch in reconciliation.mismatches:
+            self._warn_mismatch(mismatch)
+        action = 'would be processed' if self.dry_run else 'processed'
+        for payment in reconciliation.payments:
+            self.stdout.write(f'{payment["payee"]} {action}...')
+        total_paid = sum(payment['total_paid'] for payment in reconciliation.payments)
+        self.stdout.write(
+            f'{len(reconciliation.payments)} payments {action} ({total_paid}), '
+            f'{len(reconciliation.mismatches)} issues'
+        )
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('Dry run, nothing was written to the database'))
+        if self.report_path:
+            with open(self.report_path, 'w') as report_file:
+                json.dump(reconciliation.report(), report_file, indent=2)
+
+    def _decode_from_bytes(self, csv_file):
+        stream_text = io.StringIO()
+        for row in csv_file:
+            if isinstance(row, bytes):
+                row = row.decode('utf-8')
+            stream_text.write(row)
+        return stream_text
+
+    def _get_csv_from_storage(self, csv_storage_path):
+        with default_storage.open(csv_storage_path, 'r') as csv_file:
+            return self._decode_from_bytes(csv_file)
+
+    def handle(self, *args, **options):
+        month = options['month']
+        year = options['year']
+        csv_path = options['csv']
+        self.report_path = options['report']
+        self.dry_run = options['dry_run']
+        if csv_path:
+            with open(csv_path, 'r') as csv_file:
+                self._process_csv(csv_file, month, year)
+        else:
+            csv_storage_path = self.payout.csv_path(month, year)
+            if default_storage.exists(csv_storage_path):
+                stream_text = self._get_csv_from_storage(csv_storage_path)
+                self._process_csv(stream_text, month, year)
+            else:
+                message = 'There are no CSV on the storage or the provided CSV path is not valid.'
+                self.stdout.write(self.style.ERROR(message))
+        self.stdout.write(self.style.SUCCESS('Process finished'))
@@ -0,0 +1,9 @@
+from talents.management.services.payment import AGENCY_PAYOUT
+from ._payouts import UpdatePaidPayoutsFromCSVCommand
+
+
+class Command(UpdatePaidPayoutsFromCSVCommand):
+    """Read a CSV in the storage or a provided local CSV path
+    to update AgencyProfits status on the reference's month.
+    """
+    payout = AGENCY_PAYOUT
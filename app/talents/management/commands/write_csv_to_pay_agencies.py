@@ -0,0 +1,9 @@
+from talents.management.services.payment import AGENCY_PAYOUT
+from ._payouts import WritePayoutCSVCommand
+
+
+class Command(WritePayoutCSVCommand):
+    """Write in the storage a CSV file with data to pay our debts
+    with Agencies in reference's month.
+    """
+    payout = AGENCY_PAYOUT
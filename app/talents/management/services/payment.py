@@ -1,10 +1,6 @@
-from decimal import Decimal
-
-from django.db.models import Count, Sum
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
-
-from talents.models import Talent
+from orders.models import AgencyProfit, TalentProfit
+from talents.models import Agency, AgencyProfitsPaymentLog, Talent, TalentProfitsPaymentLog
+from .payouts import get_payees_to_be_paid_in_the_month, Payout, write_payout_csv
 
 
 TALENT_PAYMENT_CSV_HEADER = [
@@ -24,49 +20,81 @@ TALENT_PAYMENT_CSV_PATH_TEMPLATE = (
     'talents/payments/{year}/{month}/payment_control_{month}_{year}.csv'
 )
 
+AGENCY_PAYMENT_CSV_HEADER = [
+    'ID',
+    'Agência de talentos',
+    'Nº de viggios',
+    'Total',
+    'Nome',
+    'Conta Corrente',
+    'Dígito',
+    'Agência',
+    'CPF/CNPJ',
+    'Banco',
+    'Pago?',
+]
 
-def get_talents_to_be_paid_in_the_month(month, year):
-    talents_to_be_paid_in_the_month = (
-        Talent.objects
-        .filter(
-            profits__paid=False,
-            profits__created_at__date__month=month,
-            profits__created_at__date__year=year,
-        )
-        .prefetch_related('bank_account')
-        .annotate(
-            total_to_pay=Sum('profits__profit'),
-            num_profits=Count('profits')
-        )
+AGENCY_PAYMENT_CSV_PATH_TEMPLATE = (
+    'agencies/payments/{year}/{month}/payment_control_{month}_{year}.csv'
+)
+
+
+def _bank_account_columns(bank_account):
+    return (
+        bank_account.fullname,
+        bank_account.account_number,
+        bank_account.account_control_digit,
+        bank_account.bank_branch_number,
+        bank_account.tax_document,
+        f'{bank_account.bank_transit_number} - {bank_account.bank}',
+    )
+
+
+def talent_payment_csv_row(talent):
+    return (
+        (str(talent), talent.num_profits, talent.total_to_pay)
+        + _bank_account_columns(talent.bank_account)
+        + ('',)  # Pago?
     )
-    return talents_to_be_paid_in_the_month
+
+
+def agency_payment_csv_row(agency):
+    return (
+        (agency.id, agency.name, agency.num_profits, agency.total_to_pay)
+        + _bank_account_columns(agency.bank_account)
+        + ('',)  # Pago?
+    )
+
+
+TALENT_PAYOUT = Payout(
+    payee_model=Talent,
+    profit_model=TalentProfit,
+    payment_log_model=TalentProfitsPaymentLog,
+    payee_field='talent',
+    payee_lookup='talent__user__email',
+    payee_column='Email',
+    csv_header=TALENT_PAYMENT_CSV_HEADER,
+    csv_path_template=TALENT_PAYMENT_CSV_PATH_TEMPLATE,
+    csv_row_builder=talent_payment_csv_row,
+    select_related=('bank_account', 'user'),
+)
+
+AGENCY_PAYOUT = Payout(
+    payee_model=Agency,
+    profit_model=AgencyProfit,
+    payment_log_model=AgencyProfitsPaymentLog,
+    payee_field='agency',
+    payee_lookup='agency_id',
+    payee_column='ID',
+    csv_header=AGENCY_PAYMENT_CSV_HEADER,
+    csv_path_template=AGENCY_PAYMENT_CSV_PATH_TEMPLATE,
+    csv_row_builder=agency_payment_csv_row,
+)
+
+
+def get_talents_to_be_paid_in_the_month(month, year):
+    return get_payees_to_be_paid_in_the_month(TALENT_PAYOUT, month, year)
 
 
 def write_talent_payment_csv(talents, month, year):
-    content = ContentFile(b'')
-    header = ','.join(TALENT_PAYMENT_CSV_HEADER)
-    content.write(bytes(header, 'utf-8'))
-    for talent in talents:
-        row = (
-            '\n'
-            f'{talent},{talent.num_profits},{talent.total_to_pay},'
-            f'{talent.bank_account.fullname},{talent.bank_account.account_number},'
-            f'{talent.bank_account.account_control_digit},'
-            f'{talent.bank_account.bank_branch_number},{talent.bank_account.tax_document},'
-            f'{talent.bank_account.bank_transit_number} - {talent.bank_account.bank},'
-        )
-        content.write(bytes(row, 'utf-8'))
-    path_to_save = TALENT_PAYMENT_CSV_PATH_TEMPLATE.format(month=month, year=year)
-    default_storage.save(path_to_save, content)
-
-
-def talent_payment_csv_columns_mapper(rows):
-    return [
-        {
-            'talent_email': row['Email'],
-            'num_profits': int(row['Nº de viggios']),
-            'total_paid': Decimal(row['Total']),
-            'paid': row['Pago?'] == 'sim',
-        }
-        for row in rows
-    ]
+    return write_payout_csv(TALENT_PAYOUT, talents, month, year)
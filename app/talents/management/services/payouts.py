@@ -0,0 +1,240 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from utils.csv_writer import write_csv_to_storage
+
+
+PAYEES_ITERATOR_CHUNK_SIZE = 2000
+
+# Keep the IN clauses of the bulk updates below the database parameters limits
+PAID_PROFITS_UPDATE_BATCH_SIZE = 900
+
+
+class PaidProfitsMismatchError(Exception):
+    pass
+
+
+class Payout:
+    """Describe how the profits of a kind of payee (talents, agencies) are paid.
+
+    payee_model has the profits under the related name 'profits' and a bank_account.
+    payee_lookup is the profit field, relative to profit_model, which identifies
+    the payee in the CSV column payee_column.
+    """
+
+    def __init__(
+        self,
+        payee_model,
+        profit_model,
+        payment_log_model,
+        payee_field,
+        payee_lookup,
+        payee_column,
+        csv_header,
+        csv_path_template,
+        csv_row_builder,
+        select_related=('bank_account',),
+    ):
+        self.payee_model = payee_model
+        self.profit_model = profit_model
+        self.payment_log_model = payment_log_model
+        self.payee_field = payee_field
+        self.payee_lookup = payee_lookup
+        self.payee_column = payee_column
+        self.csv_header = csv_header
+        self.csv_path_template = csv_path_template
+        self.csv_row_builder = csv_row_builder
+        self.select_related = select_related
+
+    def csv_path(self, month, year):
+        return self.csv_path_template.format(month=month, year=year)
+
+    def csv_columns_mapper(self, rows):
+        return [
+            {
+                'payee': row[self.payee_column],
+                'num_profits': int(row['Nº de viggios']),
+                'total_paid': Decimal(row['Total']),
+                'paid': row['Pago?'] == 'sim',
+            }
+            for row in rows
+        ]
+
+
+def get_payees_to_be_paid_in_the_month(payout, month, year):
+    """One GROUP BY query with the total and number of not paid profits per payee"""
+    return (
+        payout.payee_model.objects
+        .filter(
+            profits__paid=False,
+            profits__created_at__date__month=month,
+            profits__created_at__date__year=year,
+        )
+        .select_related(*payout.select_related)
+        .annotate(
+            total_to_pay=Sum('profits__profit'),
+            num_profits=Count('profits')
+        )
+    )
+
+
+def write_payout_csv(payout, payees, month, year):
+    rows = (
+        payout.csv_row_builder(payee)
+        for payee in payees.iterator(chunk_size=PAYEES_ITERATOR_CHUNK_SIZE)
+    )
+    return write_csv_to_storage(payout.csv_path(month, year), payout.csv_header, rows)
+
+
+class PayoutsReconciliation:
+    """What a payment CSV says was paid, checked against the profits in the database"""
+
+    def __init__(self, month, year):
+        self.month = month
+        self.year = year
+        self.payments = []
+        self.mismatches = []
+        self.missing_from_csv = []
+
+    def add_payment(self, data, payee_profits):
+        self.payments.append({
+            'payee': data['payee'],
+            'payee_id': payee_profits['payee_id'],
+            'num_profits': data['num_profits'],
+            'total_paid': data['total_paid'],
+            'profits_ids': payee_profits['profits_ids'],
+        })
+
+    def add_mismatch(self, data, reason, payee_profits=None):
+        self.mismatches.append({
+            'payee': data['payee'],
+            'reason': reason,
+            'csv': {
+                'paid': data['paid'],
+                'num_profits': data['num_profits'],
+                'total_paid': str(data['total_paid']),
+            },
+            'database': payee_profits and {
+                'num_profits': len(payee_profits['profits_ids']),
+                'total_to_pay': str(payee_profits['total_to_pay']),
+            },
+        })
+
+    def reject_payment(self, payment, reason):
+        """The payment passed the reconciliation but its profits changed before being paid"""
+        self.payments.remove(payment)
+        self.add_mismatch(dict(payment, paid=True), reason)
+
+    def report(self):
+        return {
+            'reference_month': f'{self.year}-{self.month:02}',
+            'paid': [
+                {
+                    'payee': payment['payee'],
+                    'num_profits': payment['num_profits'],
+                    'total_paid': str(payment['total_paid']),
+                }
+                for payment in self.payments
+            ],
+            'mismatches': self.mismatches,
+            'missing_from_csv': self.missing_from_csv,
+        }
+
+
+def get_profits_to_be_paid_in_the_month(payout, month, year):
+    """Group by payee, with a single query, the not paid profits of the month"""
+    profits = (
+        payout.profit_model.objects
+        .filter(paid=False, created_at__date__month=month, created_at__date__year=year)
+        .values_list('id', f'{payout.payee_field}_id', payout.payee_lookup, 'profit')
+    )
+    profits_by_payee = {}
+    for profit_id, payee_id, payee, profit in profits.iterator():
+        payee_profits = profits_by_payee.setdefault(
+            str(payee),
+            {'payee_id': payee_id, 'profits_ids': [], 'total_to_pay': Decimal('0')},
+        )
+        payee_profits['profits_ids'].append(profit_id)
+        payee_profits['total_to_pay'] += profit
+    return profits_by_payee
+
+
+def reconcile_payouts(payout, csv_data, month, year):
+    profits_by_payee = get_profits_to_be_paid_in_the_month(payout, month, year)
+    reconciliation = PayoutsReconciliation(month, year)
+    for data in csv_data:
+        payee_profits = profits_by_payee.pop(data['payee'], None)
+        if not payee_profits:
+            reconciliation.add_mismatch(data, 'no_profits_to_be_paid')
+        elif not data['paid']:
+            reconciliation.add_mismatch(data, 'not_paid', payee_profits)
+        elif data['total_paid'] != payee_profits['total_to_pay']:
+            reconciliation.add_mismatch(data, 'total_paid', payee_profits)
+        elif data['num_profits'] != len(payee_profits['profits_ids']):
+            reconciliation.add_mismatch(data, 'num_profits', payee_profits)
+        else:
+            reconciliation.add_payment(data, payee_profits)
+    reconciliation.missing_from_csv = sorted(profits_by_payee)
+    return reconciliation
+
+
+def _batches(profits_ids):
+    for start in range(0, len(profits_ids), PAID_PROFITS_UPDATE_BATCH_SIZE):
+        yield profits_ids[start:start + PAID_PROFITS_UPDATE_BATCH_SIZE]
+
+
+def _payments_profits_ids(reconciliation):
+    return [
+        profit_id
+        for payment in reconciliation.payments
+        for profit_id in payment['profits_ids']
+    ]
+
+
+def _lock_not_paid_profits(payout, profits_ids):
+    """Ids of the profits still not paid, locked until the end of the transaction"""
+    not_paid = set()
+    for batch in _batches(profits_ids):
+        not_paid.update(
+            payout.profit_model.objects
+            .select_for_update()
+            .filter(id__in=batch, paid=False)
+            .values_list('id', flat=True)
+        )
+    return not_paid
+
+
+def apply_payouts(payout, reconciliation):
+    """Mark the profits of the reconciled payments as paid. A payment whose profits were
+    paid or removed since the reconciliation is moved to the mismatches, so neither its
+    profits nor its log are written"""
+    reference_month = date(reconciliation.year, reconciliation.month, 1)
+    with transaction.atomic():
+        not_paid = _lock_not_paid_profits(payout, _payments_profits_ids(reconciliation))
+        for payment in list(reconciliation.payments):
+            if not not_paid.issuperset(payment['profits_ids']):
+                reconciliation.reject_payment(payment, 'already_paid')
+        for batch in _batches(_payments_profits_ids(reconciliation)):
+            updated = (
+                payout.profit_model.objects
+                .filter(id__in=batch, paid=False)
+                .update(paid=True)
+            )
+            if updated != len(batch):
+                # Os lucros estão travados, então nada é gravado se isso acontecer
+                raise PaidProfitsMismatchError(
+                    f'{updated} of the profits {batch} were marked as paid'
+                )
+        payout.payment_log_model.objects.bulk_create(
+            payout.payment_log_model(
+                num_viggios=payment['num_profits'],
+                amount_paid=payment['total_paid'],
+                reference_month=reference_month,
+                paid_profits_ids_array=payment['profits_ids'],
+                **{f'{payout.payee_field}_id': payment['payee_id']}
+            )
+            for payment in reconciliation.payments
+        )
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('talents', '0003_auto_20191208_2241'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('shuffle', models.PositiveIntegerField()),
+                ('position', models.BigIntegerField()),
+                ('talent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='catalogue_entries', to='talents.Talent')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='catalogueentry',
+            constraint=models.UniqueConstraint(fields=('shuffle', 'position'), name='unique_catalogue_position'),
+        ),
+        migrations.AddConstraint(
+            model_name='catalogueentry',
+            constraint=models.UniqueConstraint(fields=('shuffle', 'talent'), name='unique_catalogue_talent'),
+        ),
+    ]
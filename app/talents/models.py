@@ -1,4 +1,5 @@
 import os
+import uuid
 
 from django.contrib.auth import get_user_model
 from django.contrib.postgres import fields
@@ -89,6 +90,11 @@ def upload_location(instance, filename):
     return f'presentation-video/talent-{instance.talent_id}/{name}.{extension}'
 
 
+def direct_upload_location(talent_id, extension):
+    """Storage key of a presentation video uploaded by the browser, before it's finalized"""
+    return f'presentation-video/talent-{talent_id}/upload-{uuid.uuid4().hex}{extension}'
+
+
 class PresentationVideo(BaseModel):
     talent = models.OneToOneField(
         Talent,
@@ -101,6 +107,29 @@ class PresentationVideo(BaseModel):
         return f'ID:{self.id} - {self.talent}'
 
 
+class CatalogueEntry(BaseModel):
+    """Position of the talent in a shuffle of the catalogue. The shuffles are written ahead
+    by the reshuffle_catalogue task, so the pages are read in the order of an index"""
+    shuffle = models.PositiveIntegerField()
+    talent = models.ForeignKey(Talent, on_delete=models.CASCADE, related_name='catalogue_entries')
+    position = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shuffle', 'position'],
+                name='unique_catalogue_position',
+            ),
+            models.UniqueConstraint(
+                fields=['shuffle', 'talent'],
+                name='unique_catalogue_talent',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.shuffle}:{self.position} - {self.talent}'
+
+
 class TalentBankAccount(BaseModel):
     talent = models.OneToOneField(Talent, on_delete=models.CASCADE, related_name='bank_account')
     fullname = models.CharField(max_length=100)
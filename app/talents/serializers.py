@@ -1,12 +1,23 @@
+import mimetypes
+import os
+
+from django.conf import settings
 from django.db import transaction
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 
 from categories.models import Category
 from categories.serializers import CategorySerializer
-from customers.models import Customer
+from customers.models import Customer, direct_upload_location as avatar_upload_location
+from direct_uploads.uploaders import DirectUploadError, finish_upload
 from shoutouts.models import ShoutoutVideo
-from .models import Talent, PresentationVideo
+from .catalogue import invalidate_catalogue_cache
+from .models import (
+    direct_upload_location as presentation_video_upload_location,
+    Talent,
+    PresentationVideo,
+)
+from .tasks import finalize_avatar, finalize_presentation_video
 
 
 User = get_user_model()
@@ -58,6 +69,42 @@ class EnrollSerializer(serializers.ModelSerializer):
         return validated_data
 
 
+PRESENTATION_VIDEO_UPLOAD = 'presentation_video'
+AVATAR_UPLOAD = 'avatar'
+
+
+class DirectUploadSerializer(serializers.Serializer):
+    """Presentation video or avatar to be uploaded by the browser straight to the storage"""
+    kind = serializers.ChoiceField(choices=[PRESENTATION_VIDEO_UPLOAD, AVATAR_UPLOAD])
+    content_type = serializers.CharField(max_length=100)
+    size = serializers.IntegerField(min_value=1)
+    filename = serializers.CharField(max_length=100, required=False, default='')
+
+    def validate(self, data):
+        if data['kind'] == PRESENTATION_VIDEO_UPLOAD:
+            media_type, media_name = 'video/', 'a video'
+            max_size = settings.PRESENTATION_VIDEO_UPLOAD_MAX_SIZE
+        else:
+            media_type, media_name = 'image/', 'an image'
+            max_size = settings.AVATAR_UPLOAD_MAX_SIZE
+        if not data['content_type'].startswith(media_type):
+            error = {'content_type': [f'File must be {media_name}.']}
+            raise serializers.ValidationError(error)
+        if data['size'] > max_size:
+            raise serializers.ValidationError({'size': ['File is too big.']})
+        data['extension'] = (
+            os.path.splitext(data['filename'])[1]
+            or mimetypes.guess_extension(data['content_type'])
+            or ''
+        ).lower()
+        return data
+
+    def get_storage_key(self, talent):
+        if self.validated_data['kind'] == PRESENTATION_VIDEO_UPLOAD:
+            return presentation_video_upload_location(talent.id, self.validated_data['extension'])
+        return avatar_upload_location(talent.user_id, self.validated_data['extension'])
+
+
 class TalentInfoSerializer(serializers.ModelSerializer):
     user_id = serializers.IntegerField(read_only=True)
     email = serializers.CharField()
@@ -65,6 +112,9 @@ class TalentInfoSerializer(serializers.ModelSerializer):
     last_name = serializers.CharField(max_length=100, allow_blank=True)
     avatar = serializers.ImageField(required=False)
     presentation_video = serializers.FileField(required=False)
+    # Arquivos enviados direto para o storage, finalizados depois pelo celery
+    presentation_video_upload_key = serializers.CharField(required=False, write_only=True)
+    avatar_upload_key = serializers.CharField(required=False, write_only=True)
     categories = CategorySerializer(many=True, required=False)
 
     class Meta:
@@ -84,7 +134,9 @@ class TalentInfoSerializer(serializers.ModelSerializer):
             'presentation_video',
             'available',
             'avatar',
-            'categories'
+            'categories',
+            'presentation_video_upload_key',
+            'avatar_upload_key',
         ]
 
     def __init__(self, *args, **kwargs):
@@ -147,9 +199,18 @@ class TalentInfoSerializer(serializers.ModelSerializer):
             categories = Category.objects.filter(slug__in=instance.categories_data)
             instance.categories.set(categories)
 
+    def _finish_upload(self, instance, validated_data, field_name, purpose):
+        upload_key = validated_data.get(field_name)
+        if not upload_key:
+            return None
+        try:
+            return finish_upload(upload_key, purpose, instance.user_id)
+        except DirectUploadError as error:
+            raise serializers.ValidationError({field_name: [str(error)]})
+
     def _validate_avatar_field(self, validated_data, instance):
         if not validated_data.get('avatar'):
-            if instance.user.customer.avatar:
+            if instance.user.customer.avatar or validated_data.get('avatar_upload_key'):
                 validated_data['avatar'] = instance.user.customer.avatar
             else:
                 error = {'avatar': ['No file was submitted.']}
@@ -159,6 +220,18 @@ class TalentInfoSerializer(serializers.ModelSerializer):
         email = instance.user.email
         if not instance.email == validated_data['email']:
             raise Exception("Não é possível alterar o endereço de email")
+        uploaded_presentation_video_key = self._finish_upload(
+            instance,
+            validated_data,
+            'presentation_video_upload_key',
+            PRESENTATION_VIDEO_UPLOAD,
+        )
+        uploaded_avatar_key = self._finish_upload(
+            instance,
+            validated_data,
+            'avatar_upload_key',
+            AVATAR_UPLOAD,
+        )
         with transaction.atomic():
             uploaded_presentation_video = validated_data.get('presentation_video')
             if uploaded_presentation_video:
@@ -168,6 +241,13 @@ class TalentInfoSerializer(serializers.ModelSerializer):
             self._validate_avatar_field(validated_data, instance)
             self._update_customer(email, validated_data)
             self._update_categories(instance)
+        # Os arquivos enviados ao storage são finalizados fora da transação e do request
+        if uploaded_presentation_video_key:
+            finalize_presentation_video.delay(instance.id, uploaded_presentation_video_key)
+        if uploaded_avatar_key:
+            finalize_avatar.delay(instance.user_id, uploaded_avatar_key)
+        # Os updates por queryset não disparam os signals de post_save
+        invalidate_catalogue_cache()
         instance.refresh_from_db()
         instance.first_name = validated_data['first_name']
         instance.last_name = validated_data['last_name']
@@ -213,7 +293,13 @@ class ShoutoutSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = ShoutoutVideo
-        fields = ['shoutout_hash', 'file']
+        fields = [
+            'shoutout_hash',
+            'file',
+            'preview_file',
+            'poster_file',
+            'thumbnails_file',
+        ]
 
     def to_representation(self, instance):
         reprensetation = super().to_representation(instance)
@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from categories.models import Category
+from customers.models import Customer
+from .catalogue import add_to_stored_shuffles, invalidate_catalogue_cache
+from .models import PresentationVideo, Talent
+
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=Talent)
+@receiver([post_save, post_delete], sender=PresentationVideo)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Category)
+@receiver(m2m_changed, sender=Talent.categories.through)
+def invalidate_catalogue(sender, **kwargs):
+    invalidate_catalogue_cache()
+
+
+@receiver(post_save, sender=User)
+def invalidate_catalogue_on_user_change(sender, update_fields=None, **kwargs):
+    # Todo login atualiza o last_login e isso não muda o catálogo
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidate_catalogue_cache()
+
+
+@receiver(post_save, sender=Talent)
+def add_new_talent_to_catalogue(sender, instance, created, **kwargs):
+    if created:
+        add_to_stored_shuffles(instance.id)
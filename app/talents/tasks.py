@@ -0,0 +1,78 @@
+import io
+
+from celery.exceptions import TimeLimitExceeded
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from customers.models import Customer
+from project_configuration.celery import app
+from transcoder.models import TranscodeJob
+from transcoder.transcoders import transcode, TranscodeError
+from .catalogue import store_catalogue_shuffles
+from .models import PresentationVideo
+
+
+AVATAR_QUALITY = 85
+
+
+def resize_avatar(image_file, max_size):
+    """Avatar as a JPEG of at most max_size x max_size, upright as the phone shot it"""
+    image = ImageOps.exif_transpose(Image.open(image_file))
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    resized_avatar = io.BytesIO()
+    image.convert('RGB').save(resized_avatar, format='JPEG', quality=AVATAR_QUALITY, optimize=True)
+    return ContentFile(resized_avatar.getvalue())
+
+
+@app.task(
+    bind=True,
+    max_retries=10,
+    autoretry_for=(TranscodeError, TimeLimitExceeded),
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def finalize_presentation_video(self, talent_id, uploaded_file):
+    """Replace the presentation video of the talent by the one uploaded to the storage and
+    transcode it. The video is played on the talent profile, so it gets neither the
+    watermark nor the attachment disposition of the shoutouts"""
+    presentation_video, _ = PresentationVideo.objects.get_or_create(
+        talent_id=talent_id,
+        defaults={'file': uploaded_file},
+    )
+    job = TranscodeJob.objects.for_upload(presentation_video, uploaded_file)
+    if job.reached(TranscodeJob.DISPOSITION_PATCHED):
+        return
+    if not job.claim():
+        raise self.retry(countdown=job.lease_remaining())
+    try:
+        former_file = presentation_video.file.name
+        if job.step == TranscodeJob.PENDING and former_file != uploaded_file:
+            presentation_video.file = uploaded_file
+            presentation_video.save()
+            default_storage.delete(former_file)
+        transcode(presentation_video, 'mp4', watermark=False, attachment=False)
+    finally:
+        job.release()
+
+
+@app.task(max_retries=3, autoretry_for=(IOError,), acks_late=True)
+def finalize_avatar(user_id, uploaded_file):
+    """Resize the avatar uploaded to the storage and replace the former one with it"""
+    if not default_storage.exists(uploaded_file):
+        # Entrega duplicada de um avatar já finalizado
+        return
+    customer = Customer.objects.get(user_id=user_id)
+    former_avatar = customer.avatar.name
+    with default_storage.open(uploaded_file, 'rb') as image_file:
+        avatar = resize_avatar(image_file, settings.AVATAR_MAX_SIZE)
+    customer.avatar.save('avatar.jpg', avatar, save=True)
+    default_storage.delete(uploaded_file)
+    if former_avatar and former_avatar != customer.avatar.name:
+        default_storage.delete(former_avatar)
+
+
+@app.task
+def reshuffle_catalogue():
+    store_catalogue_shuffles()
@@ -1,12 +1,23 @@
+import csv
+import io
+import json
 import os
+import subprocess
 import tempfile
 import uuid
-from datetime import datetime, timezone, timedelta
-from unittest import mock
+from datetime import date, datetime, timezone, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
+from celery.exceptions import Retry
 from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import override_settings
+from django.db import connection
+from django.test import override_settings, TestCase
 from django.urls import reverse
 from PIL import Image
 from rest_framework import status
@@ -15,10 +26,36 @@ from rest_framework.test import APITestCase
 
 from categories.models import Category
 from customers.models import Customer
-from orders.models import Charge, Order
+from orders.models import AgencyProfit, Charge, Order, TalentProfit
 from request_shoutout.domain.models import Charge as DomainCharge
 from shoutouts.models import ShoutoutVideo
-from talents.models import Talent, PresentationVideo
+from transcoder.models import TranscodeJob
+from transcoder.transcoders import VideoInfo
+from talents.catalogue import (
+    catalogue_cache,
+    get_current_shuffle_seed,
+    get_stored_shuffle_seeds,
+    store_catalogue_shuffles,
+)
+from talents.tasks import finalize_avatar, finalize_presentation_video, reshuffle_catalogue
+from talents.management.services.payment import (
+    AGENCY_PAYMENT_CSV_HEADER,
+    AGENCY_PAYOUT,
+    get_talents_to_be_paid_in_the_month,
+    TALENT_PAYMENT_CSV_HEADER,
+    TALENT_PAYOUT,
+    write_talent_payment_csv,
+)
+from talents.management.services.payouts import apply_payouts, reconcile_payouts
+from talents.models import (
+    Agency,
+    AgencyBankAccount,
+    CatalogueEntry,
+    PresentationVideo,
+    Talent,
+    TalentBankAccount,
+    TalentProfitsPaymentLog,
+)
 
 
 User = get_user_model()
@@ -268,6 +305,107 @@ class UpdateTalentTest(APITestCase):
         self.assertIn('my-presentation-video', response.data['presentation_video'])
         self.assertIn('.mp4', response.data['presentation_video'])
 
+    def upload(self, kind, content, content_type, filename):
+        response = self.client.post(
+            reverse('talents:upload'),
+            {'kind': kind, 'content_type': content_type, 'size': len(content), 'filename': filename},
+            format='json',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        upload_key = response.data['upload_key']
+        response = self.client.put(
+            response.data['upload_url'],
+            content,
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-{len(content) - 1}/{len(content)}',
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return upload_key
+
+    @mock.patch('talents.serializers.finalize_avatar')
+    @mock.patch('talents.serializers.finalize_presentation_video')
+    def test_updating_talent_with_files_uploaded_straight_to_the_storage(
+        self, mocked_finalize_presentation_video, mocked_finalize_avatar
+    ):
+        avatar = io.BytesIO()
+        Image.new('RGB', (100, 100)).save(avatar, format='JPEG')
+        presentation_video_key = self.upload(
+            'presentation_video', b'filecontentstring', 'video/quicktime', 'IMG_0042.MOV'
+        )
+        avatar_key = self.upload('avatar', avatar.getvalue(), 'image/jpeg', 'eu.jpg')
+        data = {
+            'email': 'talent1@viggio.com.br',
+            'first_name': 'Novo Nome',
+            'last_name': '',
+            'avatar': '',
+            'presentation_video': '',
+            'presentation_video_upload_key': presentation_video_key,
+            'avatar_upload_key': avatar_key,
+            'price': 150,
+            'description': 'Uma descrição boladona.',
+            'available': True,
+            'area_code': 12,
+            'phone_number': 987654321,
+            'main_social_media': 'Instagram',
+            'social_media_username': 'talent1',
+            'number_of_followers': 1000,
+        }
+
+        response = self.client.put(reverse('talents:update'), data=data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('avatar_upload_key', response.data)
+        uploaded_presentation_video = mocked_finalize_presentation_video.delay.call_args[0][1]
+        self.assertIn(f'presentation-video/talent-{self.talent.id}/upload-', uploaded_presentation_video)
+        self.assertTrue(uploaded_presentation_video.endswith('.mov'))
+        mocked_finalize_presentation_video.delay.assert_called_once_with(
+            self.talent.id,
+            uploaded_presentation_video,
+        )
+        uploaded_avatar = mocked_finalize_avatar.delay.call_args[0][1]
+        self.assertIn(f'avatar/user-{self.user.id}/upload-', uploaded_avatar)
+        mocked_finalize_avatar.delay.assert_called_once_with(self.user.id, uploaded_avatar)
+
+    def test_upload_key_of_a_file_not_uploaded_is_refused(self):
+        response = self.client.post(
+            reverse('talents:upload'),
+            {'kind': 'presentation_video', 'content_type': 'video/mp4', 'size': 10},
+            format='json',
+        )
+        data = {
+            'email': 'talent1@viggio.com.br',
+            'first_name': 'Novo Nome',
+            'last_name': '',
+            'avatar': '',
+            'presentation_video_upload_key': response.data['upload_key'],
+            'price': 150,
+            'description': 'Uma descrição boladona.',
+            'available': True,
+            'area_code': 12,
+            'phone_number': 987654321,
+            'main_social_media': 'Instagram',
+            'social_media_username': 'talent1',
+            'number_of_followers': 1000,
+        }
+
+        response = self.client.put(reverse('talents:update'), data=data, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.data['presentation_video_upload_key'],
+            ['File was not uploaded.'],
+        )
+
+    def test_avatar_upload_should_be_an_image(self):
+        response = self.client.post(
+            reverse('talents:upload'),
+            {'kind': 'avatar', 'content_type': 'video/mp4', 'size': 10},
+            format='json',
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['content_type'], ['File must be an image.'])
+
     def test_updating_talent_attaching_new_categories(self):
         data = {
             'email': 'talent1@viggio.com.br',
@@ -426,6 +564,123 @@ class UpdateTalentTest(APITestCase):
         self.assertEqual(self.talent.categories.count(), 0)
 
 
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(prefix='talents_tests_'),
+    TRANSCODING_WORK_DIR=tempfile.mkdtemp(prefix='talents_transcodes_'),
+    AVATAR_MAX_SIZE=64,
+)
+class FinalizeDirectUploadsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(email='talent1@viggio.com.br')
+        self.customer = Customer.objects.create(user=self.user)
+        self.talent = Talent.objects.create(
+            user=self.user,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+
+    def test_avatar_should_be_resized_and_replace_the_former_one(self):
+        self.customer.avatar = SimpleUploadedFile('former.jpg', b'filecontentstring')
+        self.customer.save()
+        former_avatar = self.customer.avatar.name
+        uploaded_avatar = io.BytesIO()
+        Image.new('RGBA', (300, 150)).save(uploaded_avatar, format='PNG')
+        key = default_storage.save(f'avatar/user-{self.user.id}/upload-1.png', uploaded_avatar)
+
+        finalize_avatar(self.user.id, key)
+        finalize_avatar(self.user.id, key)
+
+        self.customer.refresh_from_db()
+        self.assertTrue(self.customer.avatar.name.endswith('.jpg'))
+        with Image.open(self.customer.avatar.path) as avatar:
+            self.assertEqual(avatar.size, (64, 32))
+            self.assertEqual(avatar.format, 'JPEG')
+        self.assertFalse(default_storage.exists(key))
+        self.assertFalse(default_storage.exists(former_avatar))
+
+    @mock.patch('talents.tasks.transcode')
+    def test_presentation_video_should_be_replaced_and_transcoded(self, mocked_transcode):
+        presentation_video = PresentationVideo.objects.create(
+            talent=self.talent,
+            file=SimpleUploadedFile('former.mp4', b'filecontentstring'),
+        )
+        former_video = presentation_video.file.name
+        TranscodeJob.objects.for_video(presentation_video).checkpoint(
+            TranscodeJob.DISPOSITION_PATCHED
+        )
+        key = default_storage.save(
+            f'presentation-video/talent-{self.talent.id}/upload-1.mov',
+            ContentFile(b'video'),
+        )
+
+        finalize_presentation_video(self.talent.id, key)
+
+        presentation_video.refresh_from_db()
+        self.assertEqual(presentation_video.file.name, key)
+        self.assertFalse(default_storage.exists(former_video))
+        mocked_transcode.assert_called_once_with(
+            presentation_video, 'mp4', watermark=False, attachment=False
+        )
+        job = TranscodeJob.objects.get()
+        self.assertEqual(job.original_file, key)
+        self.assertEqual(job.step, TranscodeJob.PENDING)
+        self.assertIsNone(job.locked_until)
+
+    @mock.patch('transcoder.transcoders.check_container', mock.Mock())
+    @mock.patch(
+        'transcoder.transcoders.probe_video', mock.Mock(return_value=VideoInfo(720, 1280, 15.0))
+    )
+    @mock.patch('transcoder.transcoders.subprocess.run')
+    def test_presentation_video_should_be_transcoded_without_watermark(self, mocked_run):
+        def fake_ffmpeg(command, **kwargs):
+            for index, option in enumerate(command):
+                if option == '-threads':
+                    with open(command[index + 2], 'wb') as output_file:
+                        output_file.write(b'video')
+            progress = b'frame=450\nout_time_us=15000000\nprogress=end\n'
+            return subprocess.CompletedProcess(command, 0, stdout=progress, stderr=b'')
+
+        mocked_run.side_effect = fake_ffmpeg
+        key = default_storage.save(
+            f'presentation-video/talent-{self.talent.id}/upload-1.mov',
+            ContentFile(b'video'),
+        )
+
+        finalize_presentation_video(self.talent.id, key)
+
+        command = mocked_run.call_args[0][0]
+        self.assertEqual(command.count('-i'), 1)
+        self.assertNotIn('overlay', command[command.index('-filter_complex') + 1])
+        job = TranscodeJob.objects.get()
+        self.assertEqual(job.step, TranscodeJob.DISPOSITION_PATCHED)
+
+    @mock.patch('talents.tasks.transcode')
+    def test_presentation_video_delivery_should_wait_for_the_one_transcoding_it(
+        self, mocked_transcode
+    ):
+        presentation_video = PresentationVideo.objects.create(
+            talent=self.talent,
+            file=SimpleUploadedFile('former.mp4', b'filecontentstring'),
+        )
+        key = default_storage.save(
+            f'presentation-video/talent-{self.talent.id}/upload-1.mov',
+            ContentFile(b'video'),
+        )
+        job = TranscodeJob.objects.for_upload(presentation_video, key)
+        self.assertTrue(job.claim())
+
+        with self.assertRaises(Retry):
+            finalize_presentation_video(self.talent.id, key)
+
+        mocked_transcode.assert_not_called()
+        presentation_video.refresh_from_db()
+        self.assertNotEqual(presentation_video.file.name, key)
+
+
 class RetrieveTalentTest(APITestCase):
 
     def setUp(self):
@@ -580,6 +835,118 @@ class TalentListTest(APITestCase):
         self.assertIn(talent_2_data, response.data)
 
 
+class TalentCatalogueTest(APITestCase):
+
+    def setUp(self):
+        catalogue_cache.clear()
+        category = Category.objects.create(name='Youtubers', slug='youtubers')
+        self.talents = []
+        for index in range(5):
+            user = User.objects.create(email=f'talent{index}@viggio.com.br', first_name='Nome')
+            Customer.objects.create(user=user)
+            talent = Talent.objects.create(
+                user=user,
+                phone_number=1,
+                area_code=1,
+                main_social_media='',
+                social_media_username='',
+                number_of_followers=1,
+                available=True,
+            )
+            talent.categories.add(category)
+            self.talents.append(talent)
+        self.talents[4].available = False
+        self.talents[4].save()
+        store_catalogue_shuffles()
+
+    def _get_all_pages(self, url):
+        talents_ids = []
+        while url:
+            response = self.client.get(url, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            talents_ids.extend(talent['talent_id'] for talent in response.data['results'])
+            url = response.data['next']
+        return talents_ids
+
+    @mock.patch('talents.catalogue.CataloguePagination.page_size', 2)
+    def test_pages_should_list_every_available_talent_once_in_the_shuffle_order(self):
+        url = reverse('talents:catalogue')
+        talents_ids = self._get_all_pages(url)
+
+        self.assertEqual(sorted(talents_ids), [talent.id for talent in self.talents[:4]])
+        self.assertEqual(self._get_all_pages(url), talents_ids)
+
+    def test_page_should_be_loaded_with_a_constant_number_of_queries(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('talents:catalogue'), format='json')
+
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(
+            response.data['results'][0]['categories'],
+            [{'name': 'Youtubers', 'slug': 'youtubers'}],
+        )
+
+    @override_settings(CATALOGUE_CACHE_TTL=60)
+    def test_cached_page_should_be_invalidated_when_a_talent_is_updated(self):
+        url = reverse('talents:catalogue')
+        self.client.get(url, format='json')
+        with self.assertNumQueries(0):
+            self.client.get(url, format='json')
+
+        self.talents[0].description = 'nova descrição'
+        self.talents[0].save()
+        response = self.client.get(url, format='json')
+
+        descriptions = {talent['description'] for talent in response.data['results']}
+        self.assertIn('nova descrição', descriptions)
+
+    @override_settings(CATALOGUE_CACHE_TTL=60)
+    def test_pages_of_seeds_chosen_by_the_client_should_not_be_cached(self):
+        url = reverse('talents:catalogue') + f'?seed={get_current_shuffle_seed() - 1}'
+        self.client.get(url, format='json')
+        with self.assertNumQueries(2):
+            self.client.get(url, format='json')
+
+    @mock.patch('talents.catalogue.CataloguePagination.page_size', 2)
+    def test_seed_whose_shuffle_is_not_stored_should_be_replaced_by_the_current_one(self):
+        response = self.client.get(reverse('talents:catalogue') + '?seed=7', format='json')
+
+        self.assertIn(f'seed={get_current_shuffle_seed()}', response.data['next'])
+
+    def test_reshuffle_should_keep_only_the_former_current_and_next_shuffles(self):
+        expired_seed = get_current_shuffle_seed() - 2
+        CatalogueEntry.objects.create(shuffle=expired_seed, talent=self.talents[0], position=1)
+
+        reshuffle_catalogue()
+        reshuffle_catalogue()
+
+        shuffles = CatalogueEntry.objects.values_list('shuffle', flat=True)
+        self.assertEqual(sorted(set(shuffles)), get_stored_shuffle_seeds())
+        self.assertEqual(len(shuffles), 3 * len(self.talents))
+
+    def test_new_talent_should_be_listed_before_the_next_reshuffle(self):
+        user = User.objects.create(email='talent5@viggio.com.br')
+        Customer.objects.create(user=user)
+        talent = Talent.objects.create(
+            user=user,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+            available=True,
+        )
+
+        self.assertIn(talent.id, self._get_all_pages(reverse('talents:catalogue')))
+
+    def test_first_page_should_write_the_shuffle_the_task_did_not_store_yet(self):
+        CatalogueEntry.objects.all().delete()
+
+        response = self.client.get(reverse('talents:catalogue'), format='json')
+
+        self.assertEqual(len(response.data['results']), 4)
+
+
 @override_settings(
     task_eager_propagates=True,
     task_always_eager=True,
@@ -709,10 +1076,16 @@ class TalentShoutoutListTest(APITestCase):
             {
                 'shoutout_hash': str(SHOUTOUT_1_HASH),
                 'file': f'http://testserver{self.shoutout_1.file.url}',
+                'preview_file': None,
+                'poster_file': None,
+                'thumbnails_file': None,
             },
             {
                 'shoutout_hash': str(SHOUTOUT_2_HASH),
                 'file': f'http://testserver{self.shoutout_2.file.url}',
+                'preview_file': None,
+                'poster_file': None,
+                'thumbnails_file': None,
             },
         ]
         response = self.client.get(
@@ -729,3 +1102,323 @@ class TalentShoutoutListTest(APITestCase):
         )
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.json(), [])
+
+
+class TalentPaymentCSVTest(TestCase):
+
+    def _create_talent_to_be_paid(self, email, fullname, profit):
+        user = User.objects.create(email=email, first_name='Nome', last_name='Sobrenome')
+        talent = Talent.objects.create(
+            user=user,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        TalentBankAccount.objects.create(
+            talent=talent,
+            fullname=fullname,
+            tax_document='12345678910',
+            bank='Banco do Brasil',
+            bank_transit_number='001',
+            bank_branch_number='1234',
+            account_number=str(talent.id),
+            account_control_digit='0',
+        )
+        order = Order.objects.create(
+            talent_id=talent.id,
+            video_is_for='someone_else',
+            is_from='MJ',
+            is_to='Peter',
+            instruction="Go Get 'em, Tiger",
+            email='mary.jane.watson@spiderman.com',
+            is_public=True,
+            expiration_datetime=datetime.now(timezone.utc) + timedelta(days=4),
+        )
+        TalentProfit.objects.create(
+            talent=talent,
+            order=order,
+            shoutout_price=profit,
+            profit_percentage='1.00',
+            profit=profit,
+            paid=False,
+        )
+        return talent
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self._create_talent_to_be_paid('talent1@viggio.com.br', 'Parker, Peter', '100.00')
+        self._create_talent_to_be_paid('talent2@viggio.com.br', 'Mary "MJ" Watson', '50.00')
+        self.today = date.today()
+
+    def test_payment_csv_should_be_written_to_storage_with_escaped_fields(self):
+        with override_settings(MEDIA_ROOT=self.media_root.name):
+            talents = get_talents_to_be_paid_in_the_month(self.today.month, self.today.year)
+            with self.assertNumQueries(1):
+                path = write_talent_payment_csv(talents, self.today.month, self.today.year)
+            with default_storage.open(path, 'r') as csv_file:
+                rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], TALENT_PAYMENT_CSV_HEADER)
+        rows_by_email = {row[0]: row for row in rows[1:]}
+        self.assertEqual(len(rows_by_email), 2)
+        talent_1_row = rows_by_email['talent1@viggio.com.br']
+        self.assertEqual(talent_1_row[1], '1')
+        self.assertEqual(Decimal(talent_1_row[2]), Decimal('100.00'))
+        self.assertEqual(talent_1_row[3], 'Parker, Peter')
+        self.assertEqual(rows_by_email['talent2@viggio.com.br'][3], 'Mary "MJ" Watson')
+        self.assertEqual(
+            rows_by_email['talent2@viggio.com.br'][5:],
+            ['0', '1234', '12345678910', '001 - Banco do Brasil', ''],
+        )
+
+    def test_payment_csv_should_be_written_when_spooled_to_disk(self):
+        with override_settings(MEDIA_ROOT=self.media_root.name), \
+                mock.patch('utils.csv_writer.CSV_MAX_MEMORY_SIZE', 1):
+            talents = get_talents_to_be_paid_in_the_month(self.today.month, self.today.year)
+            path = write_talent_payment_csv(talents, self.today.month, self.today.year)
+            with default_storage.open(path, 'rb') as csv_file:
+                rows = list(csv.reader(io.StringIO(csv_file.read().decode('utf-8'))))
+        self.assertEqual(rows[0], TALENT_PAYMENT_CSV_HEADER)
+        self.assertEqual(
+            sorted(row[3] for row in rows[1:]),
+            ['Mary "MJ" Watson', 'Parker, Peter'],
+        )
+
+    def _write_paid_csv(self, rows):
+        csv_path = os.path.join(self.media_root.name, 'paid.csv')
+        with open(csv_path, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(TALENT_PAYMENT_CSV_HEADER)
+            for email, num_profits, total, paid in rows:
+                writer.writerow([email, num_profits, total, '', '', '', '', '', '', paid])
+        return csv_path
+
+    def test_reconciliation_should_report_mismatches_in_a_single_query(self):
+        csv_path = self._write_paid_csv([
+            ('talent1@viggio.com.br', 1, '100.00', 'sim'),
+            ('talent2@viggio.com.br', 1, '40.00', 'sim'),
+            ('unknown@viggio.com.br', 1, '10.00', 'sim'),
+        ])
+        report_path = os.path.join(self.media_root.name, 'report.json')
+        out = StringIO()
+        with self.assertNumQueries(1):
+            call_command(
+                'update_paid_talents_in_the_month_from_csv',
+                '--csv', csv_path,
+                '--month', str(self.today.month),
+                '--year', str(self.today.year),
+                '--report', report_path,
+                '--dry-run',
+                stdout=out,
+            )
+        self.assertIn('talent1@viggio.com.br would be processed...', out.getvalue())
+        self.assertIn('1 payments would be processed (100.00), 2 issues', out.getvalue())
+        self.assertNotIn('talent1@viggio.com.br processed...', out.getvalue())
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(
+            report['paid'],
+            [{'payee': 'talent1@viggio.com.br', 'num_profits': 1, 'total_paid': '100.00'}],
+        )
+        self.assertEqual(
+            [(mismatch['payee'], mismatch['reason']) for mismatch in report['mismatches']],
+            [('talent2@viggio.com.br', 'total_paid'), ('unknown@viggio.com.br', 'no_profits_to_be_paid')],
+        )
+        self.assertEqual(report['mismatches'][0]['database']['num_profits'], 1)
+        self.assertEqual(report['missing_from_csv'], [])
+        self.assertFalse(TalentProfit.objects.filter(paid=True).exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'TalentProfitsPaymentLog uses an ArrayField')
+    def test_reconciliation_should_pay_valid_rows_in_bulk(self):
+        csv_path = self._write_paid_csv([
+            ('talent1@viggio.com.br', 1, '100.00', 'sim'),
+            ('talent2@viggio.com.br', 1, '50.00', ''),
+        ])
+        call_command(
+            'update_paid_talents_in_the_month_from_csv',
+            '--csv', csv_path,
+            '--month', str(self.today.month),
+            '--year', str(self.today.year),
+            stdout=StringIO(),
+        )
+        paid_profit = TalentProfit.objects.get(paid=True)
+        self.assertEqual(paid_profit.talent.user.email, 'talent1@viggio.com.br')
+        payment_log = TalentProfitsPaymentLog.objects.get()
+        self.assertEqual(payment_log.paid_profits_ids_array, [paid_profit.id])
+        self.assertEqual(payment_log.reference_month, date(self.today.year, self.today.month, 1))
+
+    @mock.patch('talents.management.services.payouts.PAID_PROFITS_UPDATE_BATCH_SIZE', 1)
+    def test_reconciliation_should_pay_valid_rows_in_batches(self):
+        talent = Talent.objects.get(user__email='talent1@viggio.com.br')
+        order = Order.objects.create(
+            talent_id=talent.id,
+            video_is_for='someone_else',
+            is_from='MJ',
+            is_to='Peter',
+            instruction="Go Get 'em, Tiger",
+            email='mary.jane.watson@spiderman.com',
+            is_public=True,
+            expiration_datetime=datetime.now(timezone.utc) + timedelta(days=4),
+        )
+        TalentProfit.objects.create(
+            talent=talent,
+            order=order,
+            shoutout_price='25.00',
+            profit_percentage='1.00',
+            profit='25.00',
+            paid=False,
+        )
+        csv_path = self._write_paid_csv([
+            ('talent1@viggio.com.br', 2, '125.00', 'sim'),
+            ('talent2@viggio.com.br', 1, '50.00', ''),
+        ])
+        # O log guarda os ids num ArrayField, que o sqlite dos testes não grava
+        with mock.patch.object(TalentProfitsPaymentLog.objects, 'bulk_create') as bulk_create:
+            call_command(
+                'update_paid_talents_in_the_month_from_csv',
+                '--csv', csv_path,
+                '--month', str(self.today.month),
+                '--year', str(self.today.year),
+                stdout=StringIO(),
+            )
+        paid_profits = TalentProfit.objects.filter(paid=True).order_by('id')
+        self.assertEqual(
+            [profit.talent_id for profit in paid_profits],
+            [talent.id, talent.id],
+        )
+        self.assertFalse(
+            TalentProfit.objects.filter(talent__user__email='talent2@viggio.com.br', paid=True)
+        )
+        payment_logs = list(bulk_create.call_args[0][0])
+        self.assertEqual(len(payment_logs), 1)
+        self.assertEqual(payment_logs[0].talent_id, talent.id)
+        self.assertEqual(payment_logs[0].num_viggios, 2)
+        self.assertEqual(payment_logs[0].amount_paid, Decimal('125.00'))
+        self.assertEqual(payment_logs[0].reference_month, date(self.today.year, self.today.month, 1))
+        self.assertEqual(
+            sorted(payment_logs[0].paid_profits_ids_array),
+            [profit.id for profit in paid_profits],
+        )
+
+    def test_payment_whose_profits_were_paid_meanwhile_should_be_reported(self):
+        reconciliation = reconcile_payouts(
+            TALENT_PAYOUT,
+            [
+                {'payee': 'talent1@viggio.com.br', 'num_profits': 1,
+                 'total_paid': Decimal('100.00'), 'paid': True},
+                {'payee': 'talent2@viggio.com.br', 'num_profits': 1,
+                 'total_paid': Decimal('50.00'), 'paid': True},
+            ],
+            self.today.month,
+            self.today.year,
+        )
+        # Pago por outra execução entre a conciliação e a gravação
+        TalentProfit.objects.filter(talent__user__email='talent2@viggio.com.br').update(paid=True)
+        with mock.patch.object(TalentProfitsPaymentLog.objects, 'bulk_create') as bulk_create:
+            apply_payouts(TALENT_PAYOUT, reconciliation)
+
+        self.assertEqual(
+            [payment['payee'] for payment in reconciliation.payments],
+            ['talent1@viggio.com.br'],
+        )
+        self.assertEqual(
+            [(mismatch['payee'], mismatch['reason']) for mismatch in reconciliation.mismatches],
+            [('talent2@viggio.com.br', 'already_paid')],
+        )
+        self.assertTrue(TalentProfit.objects.get(talent__user__email='talent1@viggio.com.br').paid)
+        payment_logs = list(bulk_create.call_args[0][0])
+        self.assertEqual([log.talent.user.email for log in payment_logs], ['talent1@viggio.com.br'])
+
+
+class AgencyPaymentCSVTest(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_root.cleanup)
+        self.today = date.today()
+        self.agency = Agency.objects.create(name='Agência, Talentos & Cia')
+        AgencyBankAccount.objects.create(
+            agency=self.agency,
+            fullname='Agência Talentos LTDA',
+            tax_document='12345678000190',
+            bank='Banco do Brasil',
+            bank_transit_number='001',
+            bank_branch_number='1234',
+            account_number='98765',
+            account_control_digit='0',
+        )
+        user = User.objects.create(email='talent1@viggio.com.br', first_name='Nome', last_name='Sobrenome')
+        talent = Talent.objects.create(
+            user=user,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+            agency=self.agency,
+        )
+        for profit in ('5.00', '7.50'):
+            order = Order.objects.create(
+                talent_id=talent.id,
+                video_is_for='someone_else',
+                is_from='MJ',
+                is_to='Peter',
+                instruction="Go Get 'em, Tiger",
+                email='mary.jane.watson@spiderman.com',
+                is_public=True,
+                expiration_datetime=datetime.now(timezone.utc) + timedelta(days=4),
+            )
+            AgencyProfit.objects.create(
+                agency=self.agency,
+                order=order,
+                shoutout_price='100.00',
+                profit_percentage='0.05',
+                profit=profit,
+                paid=False,
+            )
+
+    def test_agency_payment_csv_should_be_written_with_one_query(self):
+        out = StringIO()
+        with override_settings(MEDIA_ROOT=self.media_root.name), self.assertNumQueries(1):
+            call_command(
+                'write_csv_to_pay_agencies',
+                '--month', str(self.today.month),
+                '--year', str(self.today.year),
+                stdout=out,
+            )
+        path = AGENCY_PAYOUT.csv_path(self.today.month, self.today.year)
+        with open(os.path.join(self.media_root.name, path)) as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], AGENCY_PAYMENT_CSV_HEADER)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][:3], [str(self.agency.id), 'Agência, Talentos & Cia', '2'])
+        self.assertEqual(Decimal(rows[1][3]), Decimal('12.50'))
+        self.assertEqual(rows[1][4:], [
+            'Agência Talentos LTDA', '98765', '0', '1234', '12345678000190', '001 - Banco do Brasil', '',
+        ])
+
+    def test_agency_reconciliation_should_report_paid_agencies(self):
+        csv_path = os.path.join(self.media_root.name, 'paid.csv')
+        with open(csv_path, 'w') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(AGENCY_PAYMENT_CSV_HEADER)
+            writer.writerow([self.agency.id, self.agency.name, 2, '12.50', '', '', '', '', '', '', 'sim'])
+        report_path = os.path.join(self.media_root.name, 'report.json')
+        call_command(
+            'update_paid_agencies_in_the_month_from_csv',
+            '--csv', csv_path,
+            '--month', str(self.today.month),
+            '--year', str(self.today.year),
+            '--report', report_path,
+            '--dry-run',
+            stdout=StringIO(),
+        )
+        with open(report_path) as report_file:
+            report = json.load(report_file)
+        self.assertEqual(
+            report['paid'],
+            [{'payee': str(self.agency.id), 'num_profits': 2, 'total_paid': '12.50'}],
+        )
+        self.assertEqual(report['mismatches'], [])
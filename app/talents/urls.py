@@ -7,6 +7,7 @@ app_name = 'talents'
 
 urlpatterns = [
     path('', views.TalentListAPIView.as_view(), name='list'),
+    path('catalogue/', views.TalentCatalogueAPIView.as_view(), name='catalogue'),
     path('<int:talent_id>/', views.RetrieveTalentAPIView.as_view(), name='retrieve'),
     path(
         '<int:talent_id>/shoutouts/',
@@ -14,5 +15,6 @@ urlpatterns = [
         name='shoutouts'
     ),
     path('update/', views.RetrieveUpdateTalentAPIView.as_view(), name='update'),
+    path('uploads/', views.TalentUploadAPIView.as_view(), name='upload'),
     path('enroll/', views.EnrollAPIView.as_view(), name='enroll'),
 ]
@@ -1,6 +1,7 @@
 import os
 
 from django.shortcuts import get_object_or_404
+from rest_framework import status
 from rest_framework.generics import (
     CreateAPIView,
     ListAPIView,
@@ -10,14 +11,25 @@ from rest_framework.generics import (
 from rest_framework.parsers import FileUploadParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from direct_uploads.uploaders import start_upload
 from post_office.mailgun import async_mailgun_carrier
 from request_shoutout.domain.emails.templates import MailRequest
 from request_shoutout.domain.emails.template_builders import enroll_talent_template_builder
 from shoutouts.models import ShoutoutVideo
+from .catalogue import (
+    catalogue_cache,
+    catalogue_page_key,
+    catalogue_queryset,
+    CataloguePagination,
+    get_current_shuffle_seed,
+    store_missing_shuffle,
+)
 from .models import Talent
 from .permissions import TalentAccessPermission
 from .serializers import (
+    DirectUploadSerializer,
     EnrollSerializer,
     ShoutoutSerializer,
     TalentDetailSerializer,
@@ -53,7 +65,44 @@ class RetrieveTalentAPIView(RetrieveAPIView):
 
 class TalentListAPIView(ListAPIView):
     serializer_class = TalentDetailSerializer
-    queryset = Talent.objects.filter(available=True).order_by('?')
+    queryset = (
+        Talent.objects
+        .filter(available=True)
+        .select_related('user', 'user__customer', 'presentation_video')
+        .prefetch_related('categories')
+        .order_by('?')
+    )
+
+
+class TalentCatalogueAPIView(ListAPIView):
+    """Talentos disponíveis embaralhados, paginados por cursor e cacheados por página"""
+    serializer_class = TalentDetailSerializer
+    pagination_class = CataloguePagination
+
+    def get_queryset(self):
+        return catalogue_queryset(self.paginator.get_seed(self.request))
+
+    def _load_page(self, request):
+        page = super().list(request).data
+        is_first_page = not request.query_params.get(self.paginator.cursor_query_param)
+        if not page['results'] and is_first_page:
+            # O embaralhamento ainda não foi gravado pela task, só acontece depois de um deploy
+            if store_missing_shuffle(self.paginator.get_seed(request)):
+                page = super().list(request).data
+        return page
+
+    def list(self, request, *args, **kwargs):
+        seed = self.paginator.get_seed(request)
+        # Só o embaralhamento atual é cacheado, senão cada seed escolhida pelo cliente
+        # ocuparia novas entradas no cache
+        if seed != get_current_shuffle_seed():
+            return Response(self._load_page(request))
+        key = catalogue_page_key(
+            request.get_host(),
+            seed,
+            request.query_params.get(self.paginator.cursor_query_param),
+        )
+        return Response(catalogue_cache.get_or_load(key, lambda: self._load_page(request)))
 
 
 class RetrieveUpdateTalentAPIView(RetrieveUpdateAPIView):
@@ -67,6 +116,26 @@ class RetrieveUpdateTalentAPIView(RetrieveUpdateAPIView):
         return get_object_or_404(Talent, user_id=self.request.user.id)
 
 
+class TalentUploadAPIView(APIView):
+    """Inicia o upload do vídeo de apresentação ou do avatar direto para o storage. O
+    upload_key retornado é enviado no update no lugar do arquivo"""
+    permission_classes = (IsAuthenticated, TalentAccessPermission)
+    http_method_names = ['post']
+
+    def post(self, request, *args, **kwargs):
+        talent = get_object_or_404(Talent, user_id=request.user.id)
+        serializer = DirectUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_upload(
+            request,
+            serializer.get_storage_key(talent),
+            serializer.validated_data['kind'],
+            serializer.validated_data['content_type'],
+            serializer.validated_data['size'],
+        )
+        return Response(upload, status.HTTP_201_CREATED)
+
+
 class TalentShoutoutListAPIView(ListAPIView):
     serializer_class = ShoutoutSerializer
 
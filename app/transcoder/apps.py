@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class TranscoderConfig(AppConfig):
     name = 'transcoder'
+
+    def ready(self):
+        from celery.signals import worker_ready
+        from .watermarks import prerender_watermarks
+        worker_ready.connect(prerender_watermarks, weak=False)
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.7 on 2026-10-18 11:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TranscodeJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('step', models.CharField(choices=[('pending', 'pending'), ('downloaded', 'downloaded'), ('encoded', 'encoded'), ('uploaded', 'uploaded'), ('original_deleted', 'original_deleted'), ('disposition_patched', 'disposition_patched'), ('notified', 'notified')], default='pending', max_length=20)),
+                ('original_file', models.CharField(max_length=140)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('content_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='contenttypes.ContentType')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='transcodejob',
+            constraint=models.UniqueConstraint(fields=('content_type', 'object_id'), name='unique_transcode_job_per_video'),
+        ),
+    ]
@@ -0,0 +1,118 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models import F, Q
+from django.utils import timezone
+
+from utils.base_models import BaseModel
+
+
+class TranscodeJobManager(models.Manager):
+
+    def for_video(self, video_model):
+        job, _ = self.get_or_create(
+            content_type=ContentType.objects.get_for_model(video_model),
+            object_id=video_model.pk,
+            defaults={'original_file': video_model.file.name},
+        )
+        return job
+
+    def for_upload(self, video_model, original_file):
+        """Job of the video uploaded as original_file. Videos replaced by a new upload, like
+        the presentation videos, start over the job of the former one"""
+        job, created = self.get_or_create(
+            content_type=ContentType.objects.get_for_model(video_model),
+            object_id=video_model.pk,
+            defaults={'original_file': original_file},
+        )
+        if not created and job.original_file != original_file:
+            job.original_file = original_file
+            job.step = TranscodeJob.PENDING
+            job.attempts = 0
+            job.save(update_fields=['original_file', 'step', 'attempts', 'updated_at'])
+        return job
+
+
+class TranscodeJob(BaseModel):
+    """Checkpoints of the transcode of a video, so a retry resumes from the last finished
+    step and a duplicated delivery of the task is recognised"""
+    PENDING = 'pending'
+    DOWNLOADED = 'downloaded'
+    ENCODED = 'encoded'
+    UPLOADED = 'uploaded'
+    ORIGINAL_DELETED = 'original_deleted'
+    DISPOSITION_PATCHED = 'disposition_patched'
+    NOTIFIED = 'notified'
+    STEPS = (
+        PENDING,
+        DOWNLOADED,
+        ENCODED,
+        UPLOADED,
+        ORIGINAL_DELETED,
+        DISPOSITION_PATCHED,
+        NOTIFIED,
+    )
+    STEP_CHOICES = [(step, step) for step in STEPS]
+
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveIntegerField()
+    video = GenericForeignKey('content_type', 'object_id')
+    step = models.CharField(max_length=20, choices=STEP_CHOICES, default=PENDING)
+    # Nome do vídeo enviado pelo talento, o file do modelo muda para o transcodado no upload
+    original_file = models.CharField(max_length=140)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    locked_until = models.DateTimeField(blank=True, null=True)
+
+    objects = TranscodeJobManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['content_type', 'object_id'],
+                name='unique_transcode_job_per_video',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.content_type.model} {self.object_id}: {self.step}'
+
+    @property
+    def working_directory(self):
+        """Survives the retries on the same node, so the download and encode are reused"""
+        return os.path.join(settings.TRANSCODING_WORK_DIR, f'job-{self.id}')
+
+    def reached(self, step):
+        return self.STEPS.index(self.step) >= self.STEPS.index(step)
+
+    def checkpoint(self, step):
+        self.step = step
+        self.save(update_fields=['step', 'updated_at'])
+
+    def claim(self):
+        """Lock the job for TRANSCODING_JOB_LEASE seconds, False when another delivery of the
+        task holds it. The lease expires, so a worker killed mid-transcode doesn't block it"""
+        now = timezone.now()
+        claimed = (
+            TranscodeJob.objects
+            .filter(id=self.id)
+            .filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now))
+            .update(
+                locked_until=now + timedelta(seconds=settings.TRANSCODING_JOB_LEASE),
+                attempts=F('attempts') + 1,
+            )
+        )
+        self.refresh_from_db()
+        return bool(claimed)
+
+    def release(self):
+        TranscodeJob.objects.filter(id=self.id).update(locked_until=None)
+        self.locked_until = None
+
+    def lease_remaining(self):
+        if not self.locked_until:
+            return 0
+        return max(0, (self.locked_until - timezone.now()).total_seconds())
@@ -0,0 +1,155 @@
+from django.conf import settings
+
+
+def scaled_size(video_size, max_resolution):
+    """Video size with its shorter side capped to max_resolution, keeping the aspect ratio"""
+    width, height = video_size
+    shorter_side = min(width, height)
+    if not max_resolution or shorter_side <= max_resolution:
+        return width, height
+    scale = max_resolution / shorter_side
+    # Dimensões pares, exigidas pelo libx264
+    return round(width * scale / 2) * 2, round(height * scale / 2) * 2
+
+
+class TranscodingProfile:
+    """Encoder settings of one rendition of the transcoded video.
+
+    max_resolution caps the shorter side of the video (1080 is 1080p on landscape and
+    portrait videos) and faststart moves the mp4 index to the beginning of the file, so
+    players start before the download ends.
+    """
+
+    is_video = True
+
+    def __init__(
+        self,
+        name,
+        video_codec='libx264',
+        crf=23,
+        preset='medium',
+        max_resolution=None,
+        max_bitrate=None,
+        audio_codec='aac',
+        audio_bitrate='128k',
+        faststart=True,
+    ):
+        self.name = name
+        self.video_codec = video_codec
+        self.crf = crf
+        self.preset = preset
+        self.max_resolution = max_resolution
+        self.max_bitrate = max_bitrate
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.faststart = faststart
+
+    def output_size(self, video_size):
+        return scaled_size(video_size, self.max_resolution)
+
+    def video_filter(self, video):
+        output_size = self.output_size(video.size)
+        if output_size == tuple(video.size):
+            return 'null'
+        return 'scale={}:{}'.format(*output_size)
+
+    def output_options(self):
+        options = [
+            '-c:v', self.video_codec,
+            '-preset', self.preset,
+            '-crf', str(self.crf),
+            '-pix_fmt', 'yuv420p',
+        ]
+        if self.max_bitrate:
+            options += ['-maxrate', self.max_bitrate, '-bufsize', self.max_bitrate]
+        options += ['-c:a', self.audio_codec, '-b:a', self.audio_bitrate]
+        if self.faststart:
+            options += ['-movflags', '+faststart']
+        return options
+
+
+class PosterFrame:
+    """Still frame shown by the players before the video is loaded"""
+    is_video = False
+    extension = 'jpg'
+
+    def __init__(self, name='poster', time=1.0, max_resolution=720, quality=3):
+        self.name = name
+        self.time = time
+        self.max_resolution = max_resolution
+        self.quality = quality
+
+    def output_size(self, video_size):
+        return scaled_size(video_size, self.max_resolution)
+
+    def video_filter(self, video):
+        # Vídeos mais curtos que o time usam o frame do meio
+        start = min(self.time, video.duration / 2)
+        output_size = self.output_size(video.size)
+        return f'trim=start={start:.3f},setpts=PTS-STARTPTS,scale={output_size[0]}:{output_size[1]}'
+
+    def output_options(self):
+        return ['-frames:v', '1', '-q:v', str(self.quality)]
+
+
+class ThumbnailStrip:
+    """Frames taken evenly along the video, side by side in a single image, so the pages
+    preview the video without loading it"""
+    is_video = False
+    extension = 'webp'
+
+    def __init__(self, name='thumbnails', count=10, height=90, quality=60):
+        self.name = name
+        self.count = count
+        self.height = height
+        self.quality = quality
+
+    def video_filter(self, video):
+        frame_rate = self.count / max(video.duration, 1)
+        return f'fps={frame_rate:.6f},scale=-2:{self.height},tile={self.count}x1'
+
+    def output_options(self):
+        return ['-frames:v', '1', '-c:v', 'libwebp', '-quality', str(self.quality)]
+
+
+DEFAULT_PROFILES = {
+    # Vídeo que o cliente baixa, na qualidade original até 1080p
+    'download': {'crf': 21, 'preset': 'medium', 'max_resolution': 1080},
+    # Vídeo leve para assistir no site e no celular antes de baixar
+    'preview': {
+        'crf': 28,
+        'preset': 'veryfast',
+        'max_resolution': 480,
+        'max_bitrate': '800k',
+        'audio_bitrate': '64k',
+    },
+}
+
+
+def get_profile(name):
+    """Profile from the TRANSCODING_PROFILES setting, falling back to DEFAULT_PROFILES"""
+    options = dict(DEFAULT_PROFILES.get(name, {}))
+    options.update(getattr(settings, 'TRANSCODING_PROFILES', {}).get(name, {}))
+    return TranscodingProfile(name, **options)
+
+
+def get_download_profile():
+    return get_profile(settings.TRANSCODING_DOWNLOAD_PROFILE)
+
+
+def get_preview_profile():
+    """None when the preview rendition is disabled"""
+    if not settings.TRANSCODING_PREVIEW_PROFILE:
+        return None
+    return get_profile(settings.TRANSCODING_PREVIEW_PROFILE)
+
+
+def get_poster_frame():
+    return PosterFrame(time=settings.TRANSCODING_POSTER_TIME)
+
+
+def get_thumbnail_strip():
+    return ThumbnailStrip(
+        count=settings.TRANSCODING_THUMBNAILS_COUNT,
+        height=settings.TRANSCODING_THUMBNAIL_HEIGHT,
+    )
@@ -1,8 +1,10 @@
 from celery.exceptions import TimeLimitExceeded
 
+from message_bus.registry import buses, FULFILL_SHOUTOUT_REQUEST_BUS
 from project_configuration.celery import app
 from request_shoutout.domain.messages import ShoutoutSuccessfullyTranscodedEvent
 from shoutouts.models import ShoutoutVideo
+from .models import TranscodeJob
 from .transcoders import transcode, TranscodeError
 
 
@@ -10,11 +12,30 @@ def to_mp4(shoutout_hash_id):
     schedule_transcode_to_mp4.delay(shoutout_hash_id)
 
 
-@app.task(max_retries=10, autoretry_for=(TranscodeError, TimeLimitExceeded))
-def schedule_transcode_to_mp4(shoutout_hash_id):
-    from message_bus.routes import get_fulfill_shoutout_request_bus
+# acks_late: o vídeo volta para a fila se o worker morrer no meio do transcode
+@app.task(
+    bind=True,
+    max_retries=10,
+    autoretry_for=(TranscodeError, TimeLimitExceeded),
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def schedule_transcode_to_mp4(self, shoutout_hash_id):
     shoutout = ShoutoutVideo.objects.get(hash_id=shoutout_hash_id)
-    transcode(shoutout, 'mp4')
-    event = ShoutoutSuccessfullyTranscodedEvent(shoutout.order_id)
-    bus = get_fulfill_shoutout_request_bus()
-    bus.handle(event)
+    job = TranscodeJob.objects.for_video(shoutout)
+    if job.reached(TranscodeJob.NOTIFIED):
+        # Entrega duplicada de um vídeo já transcodado e enviado ao cliente
+        return
+    if not job.claim():
+        raise self.retry(countdown=job.lease_remaining())
+    try:
+        transcode(shoutout, 'mp4')
+        job.refresh_from_db()
+        if job.reached(TranscodeJob.NOTIFIED):
+            return
+        event = ShoutoutSuccessfullyTranscodedEvent(shoutout.order_id)
+        bus = buses.get(FULFILL_SHOUTOUT_REQUEST_BUS)
+        bus.handle(event)
+        job.checkpoint(TranscodeJob.NOTIFIED)
+    finally:
+        job.release()
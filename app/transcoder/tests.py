@@ -0,0 +1,474 @@
+import io
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile, File
+from celery.exceptions import Retry
+from django.test import override_settings, TestCase
+from PIL import Image
+
+from project_configuration.celery import app
+from orders.models import Order
+from shoutouts.models import ShoutoutVideo
+from talents.models import PresentationVideo, Talent
+from .models import TranscodeJob
+from .profiles import get_profile, PosterFrame, ThumbnailStrip
+from .tasks import schedule_transcode_to_mp4
+from .watermarks import get_watermark, prerender_watermarks, render_watermark
+from .transcoders import (
+    check_container,
+    convert,
+    download_to_file,
+    probe_video,
+    should_fully_validate,
+    transcode,
+    TranscodeError,
+    upload_from_file,
+    VideoInfo,
+)
+
+
+User = get_user_model()
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix='transcoder_tests_')
+WATERMARK_CACHE_DIR = os.path.join(MEDIA_ROOT, 'watermarks')
+WORK_DIR = os.path.join(MEDIA_ROOT, 'transcodes')
+
+
+class ReadSizesSpy(io.BytesIO):
+
+    def __init__(self, content):
+        super().__init__(content)
+        self.read_sizes = []
+
+    def read(self, size=-1):
+        self.read_sizes.append(size)
+        return super().read(size)
+
+
+ENCODE_PROGRESS = b'frame=420\nout_time_us=14000000\nprogress=continue\n' \
+    b'frame=450\nout_time_us=15000000\nprogress=end\n'
+
+
+def completed_process(returncode=0, stdout=b'', stderr=b''):
+    return subprocess.CompletedProcess((), returncode, stdout=stdout, stderr=stderr)
+
+
+def probe_output(duration, codec_types=('video', 'audio')):
+    probe = {
+        'streams': [{'codec_type': codec_type} for codec_type in codec_types],
+        'format': {'duration': duration},
+    }
+    return json.dumps(probe).encode()
+
+
+VIDEO = VideoInfo(720, 1280, 15.0)
+
+
+def fake_convert(input_file, outputs, video, watermark=True):
+    for _, output_file in outputs:
+        shutil.copyfile(input_file, output_file)
+
+
+def create_shoutout():
+    user = User.objects.create(email='talent@viggio.com.br')
+    talent = Talent.objects.create(
+        user=user,
+        phone_number=1,
+        area_code=1,
+        main_social_media='',
+        social_media_username='',
+        number_of_followers=1,
+    )
+    order = Order.objects.create(
+        talent=talent,
+        video_is_for='someone_else',
+        is_from='MJ',
+        is_to='Peter',
+        instruction="Go Get 'em, Tiger",
+        email='customer@viggio.com.br',
+        is_public=True,
+        expiration_datetime=datetime.now(timezone.utc) + timedelta(days=1),
+    )
+    shoutout = ShoutoutVideo(order=order, talent=talent)
+    shoutout.file.save('video.mov', ContentFile(b'video'), save=True)
+    return shoutout
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TRANSCODING_WORK_DIR=WORK_DIR)
+class TranscodeTest(TestCase):
+
+    def setUp(self):
+        user = User.objects.create(email='talent@viggio.com.br')
+        talent = Talent.objects.create(
+            user=user,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        self.content = os.urandom(3 * 1024 * 1024 + 17)
+        self.video = PresentationVideo(talent=talent)
+        self.video.file.save('apresentacao.mov', ContentFile(self.content), save=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    @mock.patch('transcoder.transcoders.COPY_CHUNK_SIZE', 1024 * 1024)
+    def test_video_should_be_copied_to_disk_in_chunks(self):
+        stored_video = ReadSizesSpy(self.content)
+        file_path = os.path.join(MEDIA_ROOT, 'copy')
+        with mock.patch.object(self.video.file.storage, 'open', return_value=File(stored_video)):
+            download_to_file(self.video.file, file_path)
+
+        self.assertEqual(stored_video.read_sizes, [1024 * 1024] * 5)
+        with open(file_path, 'rb') as copied_file:
+            self.assertEqual(copied_file.read(), self.content)
+
+    @mock.patch('transcoder.transcoders.probe_video', mock.Mock(return_value=VIDEO))
+    @mock.patch('transcoder.transcoders.check_container', mock.Mock())
+    @mock.patch('transcoder.transcoders.convert', side_effect=fake_convert)
+    def test_transcoded_video_should_replace_the_uploaded_one(self, mocked_convert):
+        uploaded_video_path = self.video.file.path
+
+        transcode(self.video, 'mp4')
+
+        self.video.refresh_from_db()
+        self.assertTrue(self.video.file.name.endswith('transcoded_video.mp4'))
+        self.assertFalse(os.path.exists(uploaded_video_path))
+        with self.video.file.open('rb') as transcoded_video:
+            self.assertEqual(transcoded_video.read(), self.content)
+        input_file_path = mocked_convert.call_args[0][0]
+        self.assertFalse(os.path.exists(os.path.dirname(input_file_path)))
+
+
+class TranscodingWorkerTest(TestCase):
+
+    def test_transcode_task_should_be_routed_to_the_transcoding_queue(self):
+        route = app.amqp.router.route({}, 'transcoder.tasks.schedule_transcode_to_mp4')
+
+        self.assertEqual(route['queue'].name, 'transcoding')
+
+    @override_settings(TRANSCODING_FFMPEG_THREADS=3)
+    @mock.patch('transcoder.transcoders.subprocess.run')
+    def test_ffmpeg_should_run_with_the_threads_budget_of_a_job(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=ENCODE_PROGRESS)
+
+        convert('input', [(get_profile('download'), 'output.mp4')], VIDEO)
+
+        command = mocked_run.call_args[0][0]
+        self.assertEqual(command[-3:], ['-threads', '3', 'output.mp4'])
+
+
+@mock.patch('transcoder.transcoders.subprocess.run')
+class SinglePassValidationTest(TestCase):
+
+    def test_encode_progress_should_be_returned_when_ffmpeg_finishes(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=ENCODE_PROGRESS)
+
+        progress = convert('input', [(get_profile('download'), 'output.mp4')], VIDEO)
+
+        self.assertEqual(progress['frame'], '450')
+        self.assertEqual(progress['out_time_us'], '15000000')
+
+    def test_encode_that_did_not_reach_the_end_should_fail(self, mocked_run):
+        mocked_run.return_value = completed_process(
+            stdout=b'frame=420\nout_time_us=14000000\nprogress=continue\n'
+        )
+
+        with self.assertRaises(TranscodeError):
+            convert('input', [(get_profile('download'), 'output.mp4')], VIDEO)
+
+    def test_container_check_should_accept_the_encoded_duration(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=probe_output('15.023'))
+
+        check_container('output.mp4', {'out_time_us': '15000000'})
+
+        self.assertEqual(mocked_run.call_args[0][0][0], 'ffprobe')
+
+    def test_container_check_should_fail_on_truncated_video(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=probe_output('7.5'))
+
+        with self.assertRaises(TranscodeError):
+            check_container('output.mp4', {'out_time_us': '15000000'})
+
+    def test_container_check_should_fail_without_audio_stream(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=probe_output('15', ('video',)))
+
+        with self.assertRaises(TranscodeError):
+            check_container('output.mp4', {'out_time_us': '15000000'})
+
+    @override_settings(TRANSCODING_FULL_VALIDATION_SAMPLE_RATE=0)
+    def test_full_decode_should_not_run_when_sampling_is_disabled(self, mocked_run):
+        self.assertFalse(any(should_fully_validate() for _ in range(100)))
+
+    @override_settings(TRANSCODING_FULL_VALIDATION_SAMPLE_RATE=1)
+    def test_full_decode_should_run_for_every_video_with_full_sampling(self, mocked_run):
+        self.assertTrue(all(should_fully_validate() for _ in range(100)))
+
+
+class TranscodingProfilesTest(TestCase):
+
+    @mock.patch('transcoder.transcoders.subprocess.run')
+    def test_every_rendition_should_be_encoded_from_a_single_decode(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=ENCODE_PROGRESS)
+
+        convert('input', [
+            (get_profile('download'), 'download.mp4'),
+            (get_profile('preview'), 'preview.mp4'),
+        ], VideoInfo(1080, 1920, 15.0))
+
+        command = mocked_run.call_args[0][0]
+        self.assertEqual(command.count('-i'), 3)
+        filter_graph = command[command.index('-filter_complex') + 1]
+        self.assertIn('[0:v]split=2[rendition0][rendition1]', filter_graph)
+        self.assertIn('[rendition0]null[scaled0]', filter_graph)
+        self.assertIn('[rendition1]scale=480:854[scaled1]', filter_graph)
+        preview_options = command[command.index('[output1]') - 1:]
+        self.assertEqual(preview_options[-1], 'preview.mp4')
+        self.assertIn('-maxrate', preview_options)
+        self.assertEqual(preview_options[preview_options.index('-movflags') + 1], '+faststart')
+
+    @override_settings(TRANSCODING_PROFILES={'preview': {'crf': 30, 'max_resolution': 360}})
+    def test_profiles_should_be_customizable_by_settings(self):
+        profile = get_profile('preview')
+
+        self.assertEqual(profile.crf, 30)
+        self.assertEqual(profile.max_resolution, 360)
+        self.assertEqual(profile.max_bitrate, '800k')
+
+    def test_max_resolution_should_cap_the_shorter_side_of_the_video(self):
+        profile = get_profile('preview')
+
+        self.assertEqual(profile.output_size((1080, 1920)), (480, 854))
+        self.assertEqual(profile.output_size((1920, 1080)), (854, 480))
+        self.assertEqual(profile.output_size((360, 640)), (360, 640))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TRANSCODING_WORK_DIR=WORK_DIR)
+class ShoutoutRenditionsTest(TestCase):
+
+    def setUp(self):
+        self.shoutout = create_shoutout()
+
+    @mock.patch('transcoder.transcoders.probe_video', mock.Mock(return_value=VIDEO))
+    @mock.patch('transcoder.transcoders.check_container', mock.Mock())
+    @mock.patch('transcoder.transcoders.convert', side_effect=fake_convert)
+    def test_preview_should_be_stored_along_with_the_download(self, mocked_convert):
+        transcode(self.shoutout, 'mp4')
+
+        self.shoutout.refresh_from_db()
+        self.assertTrue(self.shoutout.file.name.endswith('/mp4/viggio-para-peter.mp4'))
+        self.assertTrue(self.shoutout.preview_file.name.endswith('/preview/viggio-para-peter.mp4'))
+        profiles = [profile.name for profile, _ in mocked_convert.call_args[0][1]]
+        self.assertEqual(profiles, ['download', 'preview', 'poster', 'thumbnails'])
+        self.assertTrue(self.shoutout.poster_file.name.endswith('/poster/viggio-para-peter.jpg'))
+        self.assertTrue(
+            self.shoutout.thumbnails_file.name.endswith('/thumbnails/viggio-para-peter.webp')
+        )
+
+    @override_settings(TRANSCODING_PREVIEW_PROFILE='')
+    @mock.patch('transcoder.transcoders.probe_video', mock.Mock(return_value=VIDEO))
+    @mock.patch('transcoder.transcoders.check_container', mock.Mock())
+    @mock.patch('transcoder.transcoders.convert', side_effect=fake_convert)
+    def test_preview_should_not_be_encoded_when_disabled(self, mocked_convert):
+        transcode(self.shoutout, 'mp4')
+
+        self.shoutout.refresh_from_db()
+        self.assertFalse(self.shoutout.preview_file)
+        self.assertEqual(len(mocked_convert.call_args[0][1]), 3)
+
+
+@override_settings(TRANSCODING_WATERMARK_CACHE_DIR=WATERMARK_CACHE_DIR)
+class WatermarkCacheTest(TestCase):
+
+    def tearDown(self):
+        shutil.rmtree(WATERMARK_CACHE_DIR, ignore_errors=True)
+
+    def test_watermark_should_be_rendered_to_a_third_of_the_video_width(self):
+        with Image.open(get_watermark((720, 1280))) as watermark:
+            self.assertEqual(watermark.mode, 'RGBA')
+            self.assertEqual(watermark.size, (240, 66))
+            _, max_alpha = watermark.getchannel('A').getextrema()
+        self.assertEqual(max_alpha, int(255 * 0.7))
+
+    def test_watermark_should_be_rendered_only_once_per_resolution(self):
+        with mock.patch('transcoder.watermarks.render_watermark', wraps=render_watermark) as mocked:
+            first_path = get_watermark((720, 1280))
+            second_path = get_watermark((720, 1280))
+            get_watermark((480, 854))
+
+        self.assertEqual(first_path, second_path)
+        self.assertEqual(mocked.call_count, 2)
+
+    def test_common_resolutions_should_be_prerendered(self):
+        prerender_watermarks()
+
+        # Larguras 720, 1080, 1280 e 1920 do download e 480 e 854 do preview
+        self.assertEqual(len(os.listdir(WATERMARK_CACHE_DIR)), 6)
+
+    @mock.patch('transcoder.transcoders.subprocess.run')
+    def test_ffmpeg_should_only_overlay_the_prerendered_watermark(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=ENCODE_PROGRESS)
+
+        convert('input', [(get_profile('download'), 'output.mp4')], VIDEO)
+
+        command = mocked_run.call_args[0][0]
+        self.assertEqual(command[command.index('input') + 2], get_watermark((720, 1280)))
+        filter_graph = command[command.index('-filter_complex') + 1]
+        self.assertNotIn('scale2ref', filter_graph)
+        self.assertNotIn('colorchannelmixer', filter_graph)
+
+    @mock.patch('transcoder.transcoders.subprocess.run')
+    def test_rotated_phone_video_size_should_be_the_displayed_one(self, mocked_run):
+        probe = {
+            'streams': [{'width': 1920, 'height': 1080, 'tags': {'rotate': '90'}}],
+            'format': {'duration': '15.000000'},
+        }
+        mocked_run.return_value = completed_process(stdout=json.dumps(probe).encode())
+
+        self.assertEqual(probe_video('input'), VideoInfo(1080, 1920, 15.0))
+
+
+class StillsExtractionTest(TestCase):
+
+    @mock.patch('transcoder.transcoders.subprocess.run')
+    def test_stills_should_be_extracted_in_the_same_run_without_watermark(self, mocked_run):
+        mocked_run.return_value = completed_process(stdout=ENCODE_PROGRESS)
+
+        convert('input', [
+            (get_profile('download'), 'download.mp4'),
+            (PosterFrame(), 'poster.jpg'),
+            (ThumbnailStrip(count=10, height=90), 'thumbnails.webp'),
+        ], VIDEO)
+
+        command = mocked_run.call_args[0][0]
+        self.assertEqual(command.count('-i'), 2)
+        filter_graph = command[command.index('-filter_complex') + 1]
+        self.assertIn('[0:v]split=3[rendition0][rendition1][rendition2]', filter_graph)
+        self.assertIn(
+            '[rendition1]trim=start=1.000,setpts=PTS-STARTPTS,scale=720:1280[output1]',
+            filter_graph,
+        )
+        self.assertIn('[rendition2]fps=0.666667,scale=-2:90,tile=10x1[output2]', filter_graph)
+        poster_options = command[command.index('[output1]') + 1:command.index('poster.jpg')]
+        self.assertNotIn('0:a:0?', poster_options)
+        self.assertEqual(poster_options[:2], ['-frames:v', '1'])
+
+    def test_poster_of_a_short_video_should_be_its_middle_frame(self):
+        video_filter = PosterFrame(time=1.0).video_filter(VideoInfo(720, 1280, 1.5))
+
+        self.assertTrue(video_filter.startswith('trim=start=0.750,'))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, TRANSCODING_WORK_DIR=WORK_DIR)
+@mock.patch('transcoder.transcoders.probe_video', mock.Mock(return_value=VIDEO))
+@mock.patch('transcoder.transcoders.check_container', mock.Mock())
+class ResumableTranscodeTest(TestCase):
+
+    def setUp(self):
+        self.shoutout = create_shoutout()
+        self.uploaded_video_path = self.shoutout.file.path
+
+    @mock.patch('transcoder.transcoders.download_to_file', wraps=download_to_file)
+    @mock.patch('transcoder.transcoders.convert', side_effect=fake_convert)
+    def test_retry_should_upload_the_video_encoded_by_the_failed_attempt(
+        self, mocked_convert, mocked_download
+    ):
+        with mock.patch('transcoder.transcoders.upload_from_file', side_effect=IOError):
+            with self.assertRaises(IOError):
+                transcode(self.shoutout, 'mp4')
+        self.assertEqual(TranscodeJob.objects.get().step, TranscodeJob.ENCODED)
+
+        transcode(self.shoutout, 'mp4')
+
+        self.assertEqual(mocked_download.call_count, 1)
+        self.assertEqual(mocked_convert.call_count, 1)
+        self.shoutout.refresh_from_db()
+        self.assertTrue(self.shoutout.file.name.endswith('/mp4/viggio-para-peter.mp4'))
+        self.assertFalse(os.path.exists(self.uploaded_video_path))
+        self.assertFalse(os.path.exists(TranscodeJob.objects.get().working_directory))
+
+    @mock.patch('transcoder.transcoders.upload_from_file', wraps=upload_from_file)
+    @mock.patch('transcoder.transcoders.convert', side_effect=fake_convert)
+    def test_retry_should_resume_after_the_uploaded_renditions(self, mocked_convert, mocked_upload):
+        with mock.patch('transcoder.transcoders.default_storage.delete', side_effect=IOError):
+            with self.assertRaises(IOError):
+                transcode(self.shoutout, 'mp4')
+        uploads = mocked_upload.call_count
+
+        job = transcode(self.shoutout, 'mp4')
+
+        self.assertEqual(job.step, TranscodeJob.DISPOSITION_PATCHED)
+        self.assertEqual(mocked_convert.call_count, 1)
+        self.assertEqual(mocked_upload.call_count, uploads)
+        self.assertFalse(os.path.exists(self.uploaded_video_path))
+
+    @mock.patch('transcoder.transcoders.convert', side_effect=fake_convert)
+    def test_retry_should_replace_the_renditions_uploaded_by_the_failed_attempt(
+        self, mocked_convert
+    ):
+        uploads = []
+
+        def upload_two_renditions_then_fail(field_file, name, file_path):
+            if len(uploads) == 2:
+                raise IOError
+            uploads.append(name)
+            upload_from_file(field_file, name, file_path)
+
+        with mock.patch(
+            'transcoder.transcoders.upload_from_file',
+            side_effect=upload_two_renditions_then_fail,
+        ):
+            with self.assertRaises(IOError):
+                transcode(self.shoutout, 'mp4')
+        transcode(self.shoutout, 'mp4')
+
+        self.shoutout.refresh_from_db()
+        stored_files = {
+            os.path.join(directory, name)
+            for directory, _, names in os.walk(os.path.dirname(self.uploaded_video_path))
+            for name in names
+        }
+        renditions = {
+            self.shoutout.file.path,
+            self.shoutout.preview_file.path,
+            self.shoutout.poster_file.path,
+            self.shoutout.thumbnails_file.path,
+        }
+        self.assertEqual(stored_files, renditions)
+
+    @mock.patch('transcoder.tasks.buses')
+    @mock.patch('transcoder.tasks.transcode')
+    def test_duplicated_delivery_should_be_skipped(self, mocked_transcode, mocked_buses):
+        schedule_transcode_to_mp4(self.shoutout.hash_id)
+        schedule_transcode_to_mp4(self.shoutout.hash_id)
+
+        mocked_transcode.assert_called_once_with(self.shoutout, 'mp4')
+        self.assertEqual(mocked_buses.get.return_value.handle.call_count, 1)
+        job = TranscodeJob.objects.get()
+        self.assertEqual(job.step, TranscodeJob.NOTIFIED)
+        self.assertIsNone(job.locked_until)
+
+    @mock.patch('transcoder.tasks.transcode')
+    def test_delivery_should_wait_for_the_one_holding_the_job(self, mocked_transcode):
+        job = TranscodeJob.objects.for_video(self.shoutout)
+        self.assertTrue(job.claim())
+        self.assertFalse(TranscodeJob.objects.for_video(self.shoutout).claim())
+
+        with self.assertRaises(Retry):
+            schedule_transcode_to_mp4(self.shoutout.hash_id)
+
+        mocked_transcode.assert_not_called()
+        job.release()
+        self.assertTrue(job.claim())
+        self.assertEqual(job.attempts, 2)
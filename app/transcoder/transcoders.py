@@ -1,51 +1,209 @@
-import asyncio
+import json
 import os
-import subprocess
+import random
 import shutil
-import tempfile
-from contextlib import contextmanager
+import subprocess
+from collections import namedtuple
+
 from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import default_storage
+from django.db.models.fields.files import FieldFile
+
+from .models import TranscodeJob
+from .profiles import (
+    get_download_profile,
+    get_poster_frame,
+    get_preview_profile,
+    get_thumbnail_strip,
+)
+from .watermarks import get_watermark
 
 
 TRANSCODED_VIDEO_GENERIC_NAME = 'transcoded_video'
+PREVIEW_VIDEO_GENERIC_NAME = 'preview_video'
+POSTER_GENERIC_NAME = 'poster_frame'
+THUMBNAILS_GENERIC_NAME = 'thumbnails_strip'
+
+# Vídeos são copiados entre o storage e o disco em pedaços desse tamanho
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+# Tolerância entre a duração encodada e a duração lida do container do vídeo transcodado
+CONTAINER_DURATION_TOLERANCE = 1.0
 
 
 class TranscodeError(Exception):
     pass
 
 
-@contextmanager
-def tempfilename(extension):
-    dir = tempfile.mkdtemp()
-    yield os.path.join(dir, 'tempoutput' + extension)
-    shutil.rmtree(dir)
+class VideoInfo(namedtuple('VideoInfo', ['width', 'height', 'duration'])):
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+
+def download_to_file(field_file, file_path):
+    """Copy the stored video to file_path in chunks, never holding the whole video in memory"""
+    storage_file = field_file.storage.open(field_file.name, 'rb')
+    try:
+        blob = getattr(storage_file, 'blob', None)
+        if blob is not None:
+            # Baixa do bucket direto para o disco, sem passar pelo SpooledTemporaryFile do storage
+            blob.chunk_size = getattr(settings, 'GS_BLOB_CHUNK_SIZE', None)
+            blob.download_to_filename(file_path)
+        else:
+            with open(file_path, 'wb') as destination:
+                for chunk in storage_file.chunks(COPY_CHUNK_SIZE):
+                    destination.write(chunk)
+    finally:
+        storage_file.close()
+
+
+def upload_from_file(field_file, name, file_path):
+    """The storage reads the open file in chunks (resumable uploads of GS_BLOB_CHUNK_SIZE on GCS)"""
+    with open(file_path, 'rb') as transcoded_video:
+        field_file.save(name, File(transcoded_video), save=True)
 
 
-async def convert(input_file, output_file):
-    # TODO: figure out a way to dinamicaly get water mark. Using open() was causing
-    # tempfilename issue, so hardcode the path was the easy way to solve it
+def parse_progress(output):
+    """Last values of the key=value lines written by ffmpeg -progress"""
+    progress = {}
+    for line in output.decode(errors='replace').splitlines():
+        key, _, value = line.partition('=')
+        progress[key.strip()] = value.strip()
+    return progress
+
+
+def probe_video(file_path):
+    """Size of the frames ffmpeg decodes (already rotated like phones record) and duration"""
     command = (
-        'ffmpeg '
-        f'-i {input_file} '
-        f'-i /usr/src/app/transcoder/media/logo-white.png '
-        '-filter_complex '
-        '"[1][0]scale2ref=h=ow/mdar:w=iw/3[#A logo][viggio];'
-        '[#A logo]format=argb,colorchannelmixer=aa=0.7[#B logo transparent];'
-        '[viggio][#B logo transparent]overlay=(main_w-w)-(main_w*0.005):(main_h-h)-(main_h*0.005)"'
-        f' {output_file} '
-        f'&& rm {input_file}'
+        'ffprobe',
+        '-v',
+        'error',
+        '-select_streams',
+        'v:0',
+        '-show_entries',
+        'stream=width,height:stream_tags=rotate:stream_side_data=rotation:format=duration',
+        '-of',
+        'json',
+        file_path,
+    )
+    completed_process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed_process.returncode:
+        raise TranscodeError(completed_process.stderr)
+    probe = json.loads(completed_process.stdout.decode())
+    if not probe.get('streams'):
+        raise TranscodeError(f'No video stream in {file_path}')
+    stream = probe['streams'][0]
+    duration = float(probe.get('format', {}).get('duration') or 0)
+    rotation = stream.get('tags', {}).get('rotate') or 0
+    for side_data in stream.get('side_data_list', []):
+        rotation = side_data.get('rotation', rotation)
+    if int(float(rotation)) % 180:
+        return VideoInfo(stream['height'], stream['width'], duration)
+    return VideoInfo(stream['width'], stream['height'], duration)
+
+
+def build_filter_graph(profiles, video, watermark=True):
+    """Split the decoded video into one stream per profile. With watermark, the video
+    renditions are overlaid by the watermark pre-rendered to their size, which is the
+    input index + 1 of the ffmpeg command, in the order of the video profiles"""
+    graph = f'[0:v]split={len(profiles)}'
+    graph += ''.join(f'[rendition{index}]' for index in range(len(profiles)))
+    watermark_input = 1
+    for index, profile in enumerate(profiles):
+        if not profile.is_video or not watermark:
+            graph += f';[rendition{index}]{profile.video_filter(video)}[output{index}]'
+            continue
+        graph += (
+            f';[rendition{index}]{profile.video_filter(video)}[scaled{index}];'
+            f'[scaled{index}][{watermark_input}:v]'
+            'overlay=(main_w-w)-(main_w*0.005):(main_h-h)-(main_h*0.005)'
+            f'[output{index}]'
+        )
+        watermark_input += 1
+    return graph
+
+
+def convert(input_file, outputs, video, watermark=True):
+    """Encode every (profile, output_file) of outputs, videos and stills, from a single
+    decode of the input and return the ffmpeg progress at the end of the encode.
+
+    The progress replaces the second decode of the output: ffmpeg only reports
+    progress=end when every frame was encoded and the output files were finalized.
+    """
+    profiles = [profile for profile, _ in outputs]
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-nostats',
+        '-loglevel',
+        'error',
+        '-progress',
+        'pipe:1',
+        '-i',
+        input_file,
+    ]
+    for profile in profiles:
+        if profile.is_video and watermark:
+            command += ['-i', get_watermark(profile.output_size(video.size))]
+    command += ['-filter_complex', build_filter_graph(profiles, video, watermark)]
+    for index, (profile, output_file) in enumerate(outputs):
+        command += ['-map', f'[output{index}]']
+        if profile.is_video:
+            command += ['-map', '0:a:0?']
+        command += profile.output_options()
+        command += ['-threads', str(settings.TRANSCODING_FFMPEG_THREADS), output_file]
+    completed_process = subprocess.run(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
     )
-    proc = await asyncio.create_subprocess_shell(
-        cmd=command,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+    if completed_process.returncode:
+        raise TranscodeError(completed_process.stderr)
+    progress = parse_progress(completed_process.stdout)
+    if progress.get('progress') != 'end' or not int(progress.get('frame') or 0):
+        raise TranscodeError(f'Incomplete encode: {progress}', completed_process.stderr)
+    return progress
+
+
+def encoded_duration(progress):
+    # out_time_ms também é em microssegundos, só o nome que está errado no ffmpeg
+    out_time = progress.get('out_time_us') or progress.get('out_time_ms') or 0
+    return int(out_time) / 1000000
+
+
+def check_container(file_path, progress):
+    """Cheap check of the transcoded file: ffprobe only reads the container headers"""
+    command = (
+        'ffprobe',
+        '-v',
+        'error',
+        '-show_entries',
+        'format=duration:stream=codec_type',
+        '-of',
+        'json',
+        file_path,
     )
-    stdout, stderr = await proc.communicate()
-    return stdout, stderr
+    completed_process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed_process.returncode or completed_process.stderr:
+        raise TranscodeError(completed_process.stderr)
+    probe = json.loads(completed_process.stdout.decode())
+    codec_types = [stream.get('codec_type') for stream in probe.get('streams', [])]
+    # O validate exigia o stream 0:1, o áudio dos vídeos gravados pelos talentos
+    if 'video' not in codec_types or 'audio' not in codec_types:
+        raise TranscodeError(f'Missing video or audio stream: {codec_types}')
+    duration = float(probe.get('format', {}).get('duration') or 0)
+    if abs(duration - encoded_duration(progress)) > CONTAINER_DURATION_TOLERANCE:
+        raise TranscodeError(
+            f'Container duration {duration}s differs from the encoded {encoded_duration(progress)}s'
+        )
 
 
 def validate(file_path):
+    """Decode the whole file again, it costs about as much CPU as the encode"""
     command = (
         'ffmpeg',
         '-v',
@@ -63,27 +221,105 @@ def validate(file_path):
         raise TranscodeError(completed_process.stderr)
 
 
-def transcode(video_model, extension):
-    video_uploaded_url = video_model.file.url
-    with tempfilename(f'.{extension}') as output_file_path:
-        temp_input_file, input_file_path = tempfile.mkstemp()
-        with open(temp_input_file, 'wb') as container_file:
-            container_file.write(video_model.file.file.read())
-            container_file.seek(0)
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(convert(input_file_path, output_file_path))
-        validate(output_file_path)
-        with open(output_file_path, 'rb') as transcoded_video:
-            video_model.file.save(
-                f'{TRANSCODED_VIDEO_GENERIC_NAME}.{extension}',
-                transcoded_video,
-                save=True,
-            )
-    # Delete original file in Storage
-    default_storage.delete(video_uploaded_url[len(settings.MEDIA_URL):])
-    # Add "Content-Disposition: attachment" response header to trigger the download file on browser
-    file = default_storage.open(video_model.file.url[len(settings.MEDIA_URL):], 'r')
-    if hasattr(file, 'blob'):
-        file.blob.content_disposition = "attachment"
-        file.blob.patch()
-    file.close()
+def should_fully_validate():
+    return random.random() < settings.TRANSCODING_FULL_VALIDATION_SAMPLE_RATE
+
+
+def get_renditions(video_model, extension):
+    """(field file, file name, profile) of every rendition the video model stores, the
+    download video first"""
+    renditions = [
+        (video_model.file, f'{TRANSCODED_VIDEO_GENERIC_NAME}.{extension}', get_download_profile())
+    ]
+    preview_profile = get_preview_profile()
+    if preview_profile and hasattr(video_model, 'preview_file'):
+        renditions.append(
+            (video_model.preview_file, f'{PREVIEW_VIDEO_GENERIC_NAME}.{extension}', preview_profile)
+        )
+    if hasattr(video_model, 'poster_file'):
+        poster_frame = get_poster_frame()
+        renditions.append(
+            (video_model.poster_file, f'{POSTER_GENERIC_NAME}.{poster_frame.extension}', poster_frame)
+        )
+    if hasattr(video_model, 'thumbnails_file'):
+        thumbnail_strip = get_thumbnail_strip()
+        renditions.append((
+            video_model.thumbnails_file,
+            f'{THUMBNAILS_GENERIC_NAME}.{thumbnail_strip.extension}',
+            thumbnail_strip,
+        ))
+    return renditions
+
+
+def encode(job, video_model, outputs, watermark):
+    input_file_path = os.path.join(job.working_directory, 'input')
+    if not job.reached(TranscodeJob.DOWNLOADED) or not os.path.exists(input_file_path):
+        # O file do modelo já pode apontar para um vídeo transcodado num upload interrompido
+        original_file = FieldFile(video_model, video_model.file.field, job.original_file)
+        download_to_file(original_file, input_file_path)
+        job.checkpoint(TranscodeJob.DOWNLOADED)
+    progress = convert(input_file_path, outputs, probe_video(input_file_path), watermark)
+    for profile, output_file_path in outputs:
+        if profile.is_video:
+            check_container(output_file_path, progress)
+    if should_fully_validate():
+        validate(outputs[0][1])
+    job.checkpoint(TranscodeJob.ENCODED)
+    os.remove(input_file_path)
+
+
+def upload(job, renditions, outputs):
+    """A rendition already uploaded by an interrupted attempt is deleted before the upload,
+    the storage would save the new one under a de-duplicated name and orphan the former"""
+    for (field_file, name, profile), (_, output_file_path) in zip(renditions, outputs):
+        is_empty = not os.path.exists(output_file_path) or not os.path.getsize(output_file_path)
+        if not profile.is_video and is_empty:
+            # Um still que falhou não impede a entrega do vídeo
+            continue
+        if field_file.name and field_file.name != job.original_file:
+            field_file.storage.delete(field_file.name)
+        upload_from_file(field_file, name, output_file_path)
+
+
+def transcode(video_model, extension, watermark=True, attachment=True):
+    """The video goes storage -> disk -> ffmpeg -> disk -> storage, streamed in chunks.
+
+    ffmpeg needs a seekable input (the moov atom of mp4/mov files usually is at the end of
+    the file), so the upload is copied to disk instead of being piped into its stdin. The
+    same ffmpeg run encodes the video renditions and extracts the stills.
+
+    The shoutouts delivered to the customers are watermarked and served as downloads,
+    watermark=False and attachment=False turn both off for the other videos.
+
+    Every finished step is checkpointed in the TranscodeJob of the video, so a retry
+    resumes from where the former attempt stopped.
+    """
+    job = TranscodeJob.objects.for_video(video_model)
+    renditions = get_renditions(video_model, extension)
+    outputs = [
+        (profile, os.path.join(job.working_directory, name))
+        for _, name, profile in renditions
+    ]
+    if not job.reached(TranscodeJob.UPLOADED):
+        os.makedirs(job.working_directory, exist_ok=True)
+        encoded_videos = [path for profile, path in outputs if profile.is_video]
+        if not job.reached(TranscodeJob.ENCODED) or not all(map(os.path.exists, encoded_videos)):
+            encode(job, video_model, outputs, watermark)
+        upload(job, renditions, outputs)
+        job.checkpoint(TranscodeJob.UPLOADED)
+    if not job.reached(TranscodeJob.ORIGINAL_DELETED):
+        # Delete original file in Storage
+        default_storage.delete(job.original_file)
+        job.checkpoint(TranscodeJob.ORIGINAL_DELETED)
+    if not job.reached(TranscodeJob.DISPOSITION_PATCHED):
+        if attachment:
+            # Add "Content-Disposition: attachment" response header to trigger the download
+            # file on browser
+            file = default_storage.open(video_model.file.name, 'r')
+            if hasattr(file, 'blob'):
+                file.blob.content_disposition = "attachment"
+                file.blob.patch()
+            file.close()
+        job.checkpoint(TranscodeJob.DISPOSITION_PATCHED)
+    shutil.rmtree(job.working_directory, ignore_errors=True)
+    return job
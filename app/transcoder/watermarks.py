@@ -0,0 +1,62 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from PIL import Image
+
+from .profiles import get_download_profile, get_preview_profile
+
+
+# Mesma transparência do antigo colorchannelmixer=aa=0.7 do filtro do ffmpeg
+WATERMARK_OPACITY = 0.7
+# O logo ocupa um terço da largura do vídeo
+WATERMARK_WIDTH_RATIO = 3
+
+
+def _source_version(source):
+    """Changes when the watermark file is replaced, so old renders are not used"""
+    stat = os.stat(source)
+    return hashlib.md5(f'{source}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()[:12]
+
+
+def render_watermark(source, video_width, destination):
+    logo = Image.open(source).convert('RGBA')
+    width = max(1, video_width // WATERMARK_WIDTH_RATIO)
+    height = max(1, round(width * logo.height / logo.width))
+    logo = logo.resize((width, height), Image.LANCZOS)
+    alpha = logo.getchannel('A').point(lambda value: int(value * WATERMARK_OPACITY))
+    logo.putalpha(alpha)
+    # Grava num arquivo temporário e renomeia, pois vários workers podem renderizar juntos
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        suffix='.png',
+        dir=os.path.dirname(destination),
+    )
+    with os.fdopen(file_descriptor, 'wb') as temporary_file:
+        logo.save(temporary_file, format='PNG')
+    os.replace(temporary_path, destination)
+
+
+def get_watermark(video_size):
+    """Path of the semi-transparent watermark already scaled to a video of video_size.
+
+    Renders are kept on disk by video width, so ffmpeg only overlays them on the frames.
+    """
+    video_width, _ = video_size
+    source = settings.TRANSCODING_WATERMARK_PATH
+    cache_directory = settings.TRANSCODING_WATERMARK_CACHE_DIR
+    path = os.path.join(cache_directory, f'{_source_version(source)}-{video_width}.png')
+    if not os.path.exists(path):
+        os.makedirs(cache_directory, exist_ok=True)
+        render_watermark(source, video_width, path)
+    return path
+
+
+def prerender_watermarks(**kwargs):
+    """Render the watermarks of the common output resolutions of every profile (connected
+    to the celery worker_ready signal)"""
+    profiles = [get_download_profile(), get_preview_profile()]
+    for video_size in settings.TRANSCODING_WATERMARK_PRERENDER_SIZES:
+        for profile in profiles:
+            if profile is not None:
+                get_watermark(profile.output_size(video_size))
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+MISSING = object()
+
+
+class LocalMemoryBackend:
+    """Per process backend, other processes only see a change when the entry expires.
+
+    Holds at most max_entries: when it's full the expired entries are swept and, if that
+    isn't enough, the least recently used one is dropped.
+    """
+
+    def __init__(self, max_entries=1024):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._set(key, value, ttl)
+
+    def add(self, key, value, ttl):
+        """Set the key only when it's missing, True when it was set"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self._set(key, value, ttl)
+            return True
+
+    def _set(self, key, value, ttl):
+        self._entries.pop(key, None)
+        if len(self._entries) >= self.max_entries:
+            self._sweep()
+        while len(self._entries) >= self.max_entries:
+            self._entries.popitem(last=False)
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+    def _sweep(self):
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._entries.items() if expires_at < now]
+        for key in expired:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisBackend:
+    """Backend shared by every process, so invalidations are seen everywhere at once"""
+
+    def __init__(self, url, prefix):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._prefix = prefix
+
+    def get(self, key):
+        value = self._client.get(self._prefix + key)
+        if value is None:
+            return MISSING
+        return value.decode()
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, value, ex=ttl)
+
+    def add(self, key, value, ttl):
+        """Set the key only when it's missing, True when it was set"""
+        return bool(self._client.set(self._prefix + key, value, ex=ttl, nx=True))
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self._prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+class TTLCache:
+    """Cache JSON serializable values (None included) for ttl seconds.
+
+    backend and ttl may be callables, so they are resolved from settings only when the
+    cache is used. A ttl lower than 1 disables the cache.
+    """
+
+    def __init__(self, backend, ttl):
+        self._backend = backend
+        self._ttl = ttl
+
+    @property
+    def backend(self):
+        if callable(self._backend):
+            self._backend = self._backend()
+        return self._backend
+
+    @property
+    def ttl(self):
+        return self._ttl() if callable(self._ttl) else self._ttl
+
+    def get_or_load(self, key, loader):
+        ttl = self.ttl
+        if ttl < 1:
+            return loader()
+        value = self.backend.get(key)
+        if value is not MISSING:
+            return json.loads(value)
+        value = loader()
+        self.backend.set(key, json.dumps(value), ttl)
+        return value
+
+    def add(self, key, value):
+        """Cache the value only when the key is missing, True when it was cached. Always True
+        when the cache is disabled"""
+        ttl = self.ttl
+        if ttl < 1:
+            return True
+        return self.backend.add(key, json.dumps(value), ttl)
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
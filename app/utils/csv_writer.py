@@ -0,0 +1,30 @@
+import csv
+import io
+import itertools
+from tempfile import SpooledTemporaryFile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+
+# Up to this size the CSV is kept in memory, bigger ones are spooled to a temporary file
+CSV_MAX_MEMORY_SIZE = 1024 * 1024
+
+
+def write_csv_to_storage(path, header, rows, storage=None):
+    """Stream rows through csv.writer into the storage without keeping the whole CSV
+    in memory, the storage uploads it in chunks (see GS_BLOB_CHUNK_SIZE).
+    """
+    storage = storage or default_storage
+    # Cada linha é codificada à parte: antes do Python 3.11 o SpooledTemporaryFile não
+    # pode ser embrulhado num TextIOWrapper
+    line = io.StringIO()
+    writer = csv.writer(line, lineterminator='\n')
+    with SpooledTemporaryFile(max_size=CSV_MAX_MEMORY_SIZE) as content:
+        for row in itertools.chain([header], rows):
+            writer.writerow(row)
+            content.write(line.getvalue().encode('utf-8'))
+            line.seek(0)
+            line.truncate()
+        content.seek(0)
+        return storage.save(path, File(content, name=path))
@@ -1,9 +1,15 @@
 from django.contrib import admin
-from .models import WirecardTransactionData
+from .models import PaymentNotification, WirecardTransactionData
 
 
 class WirecardTransactionDataAdmin(admin.ModelAdmin):
     search_fields = ['order__hash_id']
 
 
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    list_display = ['wirecard_payment_hash', 'status', 'payment_updated_at', 'applied_at']
+    search_fields = ['wirecard_payment_hash']
+
+
 admin.site.register(WirecardTransactionData, WirecardTransactionDataAdmin)
+admin.site.register(PaymentNotification, PaymentNotificationAdmin)
@@ -0,0 +1,129 @@
+"""Queue of the payments to be captured once their orders are fulfilled.
+
+Fulfilling an order only enqueues its capture, so the talent gets the upload confirmed
+without waiting on Wirecard. A worker drains the queue in batches of concurrent requests
+on the shared client, tries the failed captures again with backoff and sends a single
+alert with the ones that kept failing.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from sentry_sdk import capture_exception
+
+from utils.telegram import send_high_priority_notification
+from .client import get_rate_limiter
+from .models import PaymentCapture
+from .services import CapturePaymentApi
+
+
+class CaptureQueue:
+
+    def __init__(self, scheduler=None):
+        self.scheduler = scheduler
+
+    def enqueue(self, transaction_data):
+        """Enqueue the capture of the payment once and schedule a drain for it"""
+        _, created = PaymentCapture.objects.get_or_create(transaction=transaction_data)
+        if created and self.scheduler:
+            self.scheduler()
+
+
+def claim_due_captures(limit):
+    """Lock up to limit due captures for WIRECARD_CAPTURE_LEASE seconds, the ones locked by
+    another drain are skipped. The lease expires, so a worker killed mid-batch doesn't
+    hold them"""
+    now = timezone.now()
+    unlocked = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    due = (
+        PaymentCapture.objects
+        .filter(unlocked, status=PaymentCapture.PENDING, next_attempt_at__lte=now)
+        .order_by('next_attempt_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    claimed = []
+    for capture_id in due:
+        locked = (
+            PaymentCapture.objects
+            .filter(unlocked, id=capture_id)
+            .update(locked_until=now + timedelta(seconds=settings.WIRECARD_CAPTURE_LEASE))
+        )
+        if locked:
+            claimed.append(capture_id)
+    return list(
+        PaymentCapture.objects
+        .select_related('transaction')
+        .filter(id__in=claimed)
+        .order_by('next_attempt_at')
+    )
+
+
+def _capture(capture_api, rate_limiter, capture):
+    """Runs in the threads of the batch, so it only talks to Wirecard, never to the database"""
+    rate_limiter.acquire()
+    try:
+        capture_api.capture(capture.transaction.wirecard_payment_hash)
+    except Exception as e:
+        capture_exception()
+        return e
+    return None
+
+
+def _record(capture, error):
+    capture.attempts += 1
+    capture.locked_until = None
+    if error is None:
+        capture.status = PaymentCapture.CAPTURED
+        capture.last_error = ''
+    elif capture.attempts >= settings.WIRECARD_CAPTURE_MAX_ATTEMPTS:
+        capture.status = PaymentCapture.FAILED
+        capture.last_error = str(error)
+    else:
+        backoff = settings.WIRECARD_CAPTURE_RETRY_DELAY * 2 ** (capture.attempts - 1)
+        capture.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+        capture.last_error = str(error)
+    capture.save()
+
+
+def drain_captures(capture_api=None, rate_limiter=None):
+    """Capture the due payments until none is left, returns how many were attempted"""
+    capture_api = capture_api or CapturePaymentApi()
+    rate_limiter = rate_limiter or get_rate_limiter()
+    attempted = 0
+    with ThreadPoolExecutor(max_workers=settings.WIRECARD_BACKGROUND_CONCURRENCY) as executor:
+        while True:
+            batch = claim_due_captures(settings.WIRECARD_CAPTURE_BATCH_SIZE)
+            if not batch:
+                break
+            errors = list(executor.map(partial(_capture, capture_api, rate_limiter), batch))
+            for capture, error in zip(batch, errors):
+                _record(capture, error)
+            attempted += len(batch)
+    alert_failed_captures()
+    return attempted
+
+
+def alert_failed_captures():
+    failed = list(
+        PaymentCapture.objects
+        .select_related('transaction')
+        .filter(status=PaymentCapture.FAILED, alerted_at__isnull=True)
+    )
+    if not failed:
+        return
+    payments = ', '.join(capture.transaction.wirecard_payment_hash for capture in failed)
+    message = (
+        f'{len(failed)} PAGAMENTO(S) NÃO FORAM CAPTURADOS APÓS '
+        f'{settings.WIRECARD_CAPTURE_MAX_ATTEMPTS} TENTATIVAS: {payments}. '
+        'Verifique o Sentry: '
+        'https://sentry.io/organizations/viggio-sandbox/issues/?project=1770932'
+    )
+    send_high_priority_notification(message)
+    (
+        PaymentCapture.objects
+        .filter(id__in=[capture.id for capture in failed])
+        .update(alerted_at=timezone.now())
+    )
@@ -0,0 +1,172 @@
+import bisect
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+
+logger = logging.getLogger(__name__)
+
+# Limites superiores, em segundos, das faixas dos histogramas de latência
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+WIRECARD_RESOURCE_ID = re.compile(r'/(ORD|PAY)-[A-Z0-9]+')
+
+
+def endpoint_name(method, url):
+    """Endpoint of url without the Wirecard ids, e.g. POST /v2/orders/{ORD}/payments"""
+    path = WIRECARD_RESOURCE_ID.sub(r'/{\1}', urlsplit(url).path)
+    return f'{method} {path}'
+
+
+class LatencyHistogram:
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the percentile"""
+        rank = fraction * self.count
+        seen = 0
+        for upper_bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return upper_bound
+        return LATENCY_BUCKETS[-1]
+
+    def __str__(self):
+        mean = self.total / self.count if self.count else 0
+        return (
+            f'{self.count} requests, mean {mean * 1000:.0f}ms, '
+            f'p50 <= {self.percentile(0.5)}s, p95 <= {self.percentile(0.95)}s, '
+            f'p99 <= {self.percentile(0.99)}s'
+        )
+
+
+class WirecardUnreachableError(requests.ConnectionError):
+    """The connection to Wirecard couldn't be opened, so the request never reached it and
+    can be sent again, even a POST"""
+    pass
+
+
+def is_connect_error(error):
+    """Failures before the request was sent. A connection aborted or reset may happen after
+    Wirecard got the request, so those aren't"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def build_session():
+    """Keep-alive connections to Wirecard reused by every request of the process. Under
+    the gevent workers the pool sockets are cooperative, so the greenlets share it"""
+    session = requests.Session()
+    # Os POSTs do Wirecard não são idempotentes, então nunca são repetidos automaticamente
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=settings.WIRECARD_POOL_SIZE,
+        max_retries=0,
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class WirecardClient:
+    """HTTP client shared by the Wirecard APIs of the process, with a pool of keep-alive
+    connections, connect and read timeouts and latency histograms by endpoint"""
+
+    def __init__(self, session=None, timeout=None):
+        self.session = session or build_session()
+        self.timeout = timeout or (
+            settings.WIRECARD_CONNECT_TIMEOUT,
+            settings.WIRECARD_READ_TIMEOUT,
+        )
+        self.latencies = {}
+
+    def get(self, url, headers=None):
+        return self.request('GET', url, headers=headers)
+
+    def post(self, url, data=None, headers=None):
+        return self.request('POST', url, data=data, headers=headers)
+
+    def request(self, method, url, **kwargs):
+        endpoint = endpoint_name(method, url)
+        started_at = time.monotonic()
+        try:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.ConnectionError as e:
+            if is_connect_error(e):
+                raise WirecardUnreachableError(*e.args, request=e.request) from e
+            raise
+        finally:
+            self.observe(endpoint, time.monotonic() - started_at)
+
+    def observe(self, endpoint, seconds):
+        histogram = self.latencies.setdefault(endpoint, LatencyHistogram())
+        histogram.observe(seconds)
+        if histogram.count % settings.WIRECARD_LATENCY_REPORT_INTERVAL == 0:
+            logger.info('Wirecard %s: %s', endpoint, histogram)
+
+
+class RateLimiter:
+    """Token bucket shared by the threads of the process: at most rate requests per second,
+    in bursts of up to burst requests"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated_at
+                self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_client = None
+_rate_limiter = None
+
+
+def get_client():
+    """Client of the process, created on its first use, so each forked worker opens its
+    own connections"""
+    global _client
+    if _client is None:
+        _client = WirecardClient()
+    return _client
+
+
+def get_rate_limiter():
+    """Limit of the background jobs of the process on Wirecard, so batches of captures and
+    status queries leave room for the checkouts"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter(
+            settings.WIRECARD_BACKGROUND_RATE_LIMIT,
+            burst=settings.WIRECARD_BACKGROUND_CONCURRENCY,
+        )
+    return _rate_limiter
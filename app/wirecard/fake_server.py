@@ -0,0 +1,208 @@
+"""Wirecard stand-in served over HTTP, so the checkout can run offline in development and
+tests through the same client, connection pool and timeouts used in production.
+
+It keeps the orders and payments in memory and answers the endpoints used by
+wirecard.services with the fields they read. Point the WIRECARD_*_URL variables to it,
+FakeWirecardServer.environ() has them, or run it standalone:
+
+    python -m wirecard.fake_server 8900
+"""
+import itertools
+import json
+import re
+import socket
+import sys
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+
+# Hash de cartão recusado pela operadora, o pagamento é criado como cancelado
+DECLINED_CREDIT_CARD_HASH = 'declined-credit-card-hash'
+# Falha que derruba a conexão sem resposta depois do Wirecard ter processado a requisição,
+# como uma conexão perdida enquanto a resposta volta
+DISCONNECT = 'disconnect'
+
+
+def unreachable_url(path=''):
+    """URL of a port nobody listens to, so the connections to it are refused"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}{path}'
+
+
+def now():
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+
+def create_order(server, body):
+    order = {
+        'id': server.new_id('ORD'),
+        'ownId': body['ownId'],
+        'status': 'CREATED',
+        'amount': {'currency': 'BRL', 'total': sum(item['price'] for item in body['items'])},
+    }
+    server.orders[order['id']] = order
+    return 201, order
+
+
+def create_payment(server, body, order_id):
+    if order_id not in server.orders:
+        return 404, {'ERROR': 'Order not found'}
+    credit_card = body['fundingInstrument']['creditCard']
+    if credit_card['hash'] == DECLINED_CREDIT_CARD_HASH:
+        payment_status = 'CANCELLED'
+    elif body.get('delayCapture'):
+        payment_status = 'PRE_AUTHORIZED'
+    else:
+        payment_status = 'AUTHORIZED'
+    payment = {
+        'id': server.new_id('PAY'),
+        'status': payment_status,
+        'delayCapture': body.get('delayCapture', False),
+        'order': order_id,
+        'updatedAt': now(),
+    }
+    server.payments[payment['id']] = payment
+    return 201, payment
+
+
+def capture_payment(server, body, payment_id):
+    payment = server.payments.get(payment_id)
+    if not payment:
+        return 404, {'ERROR': 'Payment not found'}
+    if not payment['status'] == 'PRE_AUTHORIZED':
+        return 400, {'errors': [{'code': 'PAY-999', 'description': 'Payment not authorized'}]}
+    payment['status'] = 'AUTHORIZED'
+    payment['updatedAt'] = now()
+    return 200, payment
+
+
+def get_order(server, body, order_id):
+    order = server.orders.get(order_id)
+    if not order:
+        return 404, {'ERROR': 'Order not found'}
+    payments = [payment for payment in server.payments.values() if payment['order'] == order_id]
+    return 200, dict(order, payments=payments)
+
+
+def get_payment(server, body, payment_id):
+    payment = server.payments.get(payment_id)
+    if not payment:
+        return 404, {'ERROR': 'Payment not found'}
+    return 200, payment
+
+
+ROUTES = {
+    'orders': ('POST', re.compile(r'^/v2/orders$'), create_order),
+    'order': ('GET', re.compile(r'^/v2/orders/(ORD-[A-Z0-9]+)$'), get_order),
+    'payments': ('POST', re.compile(r'^/v2/orders/(ORD-[A-Z0-9]+)/payments$'), create_payment),
+    'capture': ('POST', re.compile(r'^/v2/payments/(PAY-[A-Z0-9]+)/capture$'), capture_payment),
+    'payment': ('GET', re.compile(r'^/v2/payments/(PAY-[A-Z0-9]+)$'), get_payment),
+}
+
+
+class FakeWirecardHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.handle_route('GET')
+
+    def do_POST(self):
+        self.handle_route('POST')
+
+    def handle_route(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        for route, (route_method, pattern, view) in ROUTES.items():
+            match = pattern.match(self.path)
+            if match and route_method == method:
+                break
+        else:
+            return self.respond(404, {'ERROR': 'Not found'})
+
+        server = self.server
+        with server.lock:
+            server.requests.append((route, body))
+            failure = server.failures[route].popleft() if server.failures[route] else None
+            if failure not in (None, DISCONNECT):
+                return self.respond(failure, {'ERROR': 'Fake failure'})
+            if not self.headers.get('Authorization', '').startswith('Basic '):
+                return self.respond(401, {'ERROR': 'Token or Key are invalids'})
+            status_code, data = view(server, body, *match.groups())
+        if failure == DISCONNECT:
+            self.close_connection = True
+            return
+        self.respond(status_code, data)
+
+    def respond(self, status_code, data):
+        content = json.dumps(data).encode()
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeWirecardServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0):
+        super().__init__(('127.0.0.1', port), FakeWirecardHandler)
+        self.lock = threading.Lock()
+        self.orders = {}
+        self.payments = {}
+        self.requests = []
+        self.failures = defaultdict(deque)
+        self._ids = itertools.count(1)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_port}'
+
+    def environ(self):
+        return {
+            'WIRECARD_CREATE_ORDER_URL': f'{self.url}/v2/orders',
+            'WIRECARD_ORDER_URL': f'{self.url}/v2/orders/{{}}',
+            'WIRECARD_CREATE_PAYMENT_URL': f'{self.url}/v2/orders/{{}}/payments',
+            'WIRECARD_CAPTURE_PAYMENT_URL': f'{self.url}/v2/payments/{{}}/capture',
+            'WIRECARD_PAYMENT_URL': f'{self.url}/v2/payments/{{}}',
+        }
+
+    def new_id(self, prefix):
+        return f'{prefix}-{next(self._ids):012d}'
+
+    def fail(self, route, status_code=DISCONNECT, times=1):
+        """Answer the next requests to route ('orders', 'order', 'payments', 'capture' or
+        'payment') with status_code, or handle them and drop their connections before
+        answering"""
+        with self.lock:
+            self.failures[route].extend([status_code] * times)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == '__main__':
+    server = FakeWirecardServer(int(sys.argv[1]) if len(sys.argv) > 1 else 0)
+    for name, value in server.environ().items():
+        print(f'export {name}={value!r}')
+    server.serve_forever()
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 11:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wirecard', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wirecardtransactiondata',
+            name='wirecard_payment_hash',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
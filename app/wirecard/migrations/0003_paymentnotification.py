@@ -0,0 +1,30 @@
+# Generated by Django 2.2.7 on 2026-10-18 11:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wirecard', '0002_allow_pending_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('event_id', models.CharField(max_length=150, unique=True)),
+                ('wirecard_payment_hash', models.CharField(max_length=50)),
+                ('status', models.CharField(max_length=30)),
+                ('payment_updated_at', models.DateTimeField()),
+                ('payload', models.TextField()),
+                ('applied_at', models.DateTimeField(db_index=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.7 on 2026-10-18 11:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wirecard', '0003_paymentnotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentCapture',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('captured', 'captured'), ('failed', 'failed')], default='pending', max_length=20)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('alerted_at', models.DateTimeField(blank=True, null=True)),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='capture', to='wirecard.WirecardTransactionData')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='paymentcapture',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='wirecard_pa_status_c97c64_idx'),
+        ),
+    ]
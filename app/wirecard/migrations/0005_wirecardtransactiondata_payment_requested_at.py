@@ -0,0 +1,18 @@
+# Generated by Django 2.2.7 on 2026-10-18 12:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wirecard', '0004_paymentcapture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wirecardtransactiondata',
+            name='payment_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from orders.models import Order
 from utils.base_models import BaseModel
@@ -11,8 +12,55 @@ class WirecardTransactionData(BaseModel):
         related_name='third_party_transaction',
     )
     wirecard_order_hash = models.CharField(max_length=50)
-    wirecard_payment_hash = models.CharField(max_length=50)
+    # Vazio entre a criação do pedido e a do pagamento no Wirecard, uma nova tentativa da
+    # cobrança reaproveita o pedido já criado
+    wirecard_payment_hash = models.CharField(max_length=50, blank=True)
+    # Marcado antes do pedido de pagamento ser enviado: se a resposta se perder, a próxima
+    # tentativa procura o pagamento no pedido do Wirecard em vez de criar outro
+    payment_requested_at = models.DateTimeField(null=True, blank=True)
     payment_event_last_timestamp = models.DateTimeField(null=True)
 
     def __str__(self):
         return str(self.order.hash_id)
+
+
+class PaymentNotification(BaseModel):
+    """Payment notification received by the webhook, kept as it arrived. Rows are only
+    stamped with applied_at once their state reaches the charge"""
+    event_id = models.CharField(max_length=150, unique=True)
+    wirecard_payment_hash = models.CharField(max_length=50)
+    status = models.CharField(max_length=30)
+    payment_updated_at = models.DateTimeField()
+    payload = models.TextField()
+    applied_at = models.DateTimeField(null=True, db_index=True)
+
+    def __str__(self):
+        return self.event_id
+
+
+class PaymentCapture(BaseModel):
+    """Capture of a fulfilled order payment, waiting in the queue drained by
+    wirecard.captures. Failed attempts are tried again later with backoff"""
+    PENDING = 'pending'
+    CAPTURED = 'captured'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(status, status) for status in (PENDING, CAPTURED, FAILED)]
+
+    transaction = models.OneToOneField(
+        WirecardTransactionData,
+        on_delete=models.CASCADE,
+        related_name='capture',
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    # Capturas que falharam de vez são avisadas uma vez só, em um alerta agregado
+    alerted_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f'{self.transaction.wirecard_payment_hash}: {self.status}'
@@ -0,0 +1,225 @@
+"""Ingestion of the payment notifications sent by Wirecard to the webhook.
+
+Notifications are stored as they arrive, keyed by their event, so the retries of Wirecard
+are dropped on arrival. A batch later collapses the pending notifications to the latest
+state of each payment and applies them all in a couple of bulk UPDATEs.
+"""
+import json
+
+from dateutil.parser import parse
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, CharField, DateTimeField, Q, Value, When
+from django.utils import timezone
+from sentry_sdk import capture_message
+
+from orders.models import Charge
+from utils.caches import LocalMemoryBackend, RedisBackend, TTLCache
+from request_shoutout.domain.models import Charge as DomainCharge
+from .models import PaymentNotification, WirecardTransactionData
+
+
+CROSS_SYSTEMS_STATUS_MAPPING = {
+    'WAITING': DomainCharge.PROCESSING,
+    'IN_ANALYSIS': DomainCharge.PROCESSING,
+    'PRE_AUTHORIZED': DomainCharge.PRE_AUTHORIZED,
+    'AUTHORIZED': DomainCharge.PAID,
+    'CANCELLED': DomainCharge.CANCELLED,
+    'REFUNDED': DomainCharge.CANCELLED,
+    'REVERSED': DomainCharge.CANCELLED,
+    'SETTLED': DomainCharge.PAID,
+}
+
+
+class InvalidPaymentNotificationError(Exception):
+    pass
+
+
+def store_payment_notification(notification):
+    """Store the notification, False when it's a retry of one already received"""
+    try:
+        event = notification['event']
+        payment = notification['resource']['payment']
+        payment_updated_at = parse(payment['updatedAt'])
+        event_id = f'{event}:{payment["id"]}:{payment["updatedAt"]}'
+    except (KeyError, TypeError, ValueError) as e:
+        raise InvalidPaymentNotificationError(e)
+    _, created = PaymentNotification.objects.get_or_create(
+        event_id=event_id,
+        defaults={
+            'wirecard_payment_hash': payment['id'],
+            'status': payment['status'],
+            'payment_updated_at': payment_updated_at,
+            'payload': json.dumps(notification),
+        },
+    )
+    return created
+
+
+def _get_backend():
+    redis_url = getattr(settings, 'WIRECARD_NOTIFICATION_BATCH_REDIS_URL', None)
+    if redis_url:
+        return RedisBackend(redis_url, prefix='payment_notifications:')
+    return LocalMemoryBackend()
+
+
+def _get_batch_delay():
+    return settings.WIRECARD_NOTIFICATION_BATCH_DELAY
+
+
+batch_schedules = TTLCache(backend=_get_backend, ttl=_get_batch_delay)
+
+BATCH_SCHEDULE_KEY = 'batch'
+
+
+def should_schedule_batch():
+    """A burst of notifications is applied by a single batch, scheduled by the first one.
+    The key lives as long as the countdown of the batch, so the notifications stored before
+    the batch runs are applied by it and the first one stored after schedules the next"""
+    return batch_schedules.add(BATCH_SCHEDULE_KEY, True)
+
+
+def latest_payment_states(notifications):
+    """Latest notification of each payment, the ones delayed by Wirecard are overridden"""
+    latest = {}
+    for notification in notifications:
+        current = latest.get(notification.wirecard_payment_hash)
+        if current is None or notification.payment_updated_at >= current.payment_updated_at:
+            latest[notification.wirecard_payment_hash] = notification
+    return list(latest.values())
+
+
+def _values(rows):
+    placeholders = ', '.join(['(%s, %s, %s)'] * len(rows))
+    params = []
+    for notification in rows:
+        params.extend([
+            notification.wirecard_payment_hash,
+            connection.ops.adapt_datetimefield_value(notification.payment_updated_at),
+            CROSS_SYSTEMS_STATUS_MAPPING[notification.status],
+        ])
+    return f'(VALUES {placeholders}) AS payment', params
+
+
+def bulk_apply_payment_states(notifications):
+    """Update the charges and event timestamps of the payments in one statement each. Both
+    are guarded by the last event timestamp, so an older state never overrides a newer one
+    and applying the same batch twice changes nothing"""
+    # UPDATE ... FROM só existe no SQLite a partir da 3.33, a imagem python:3.6-alpine3.10
+    # dos testes vem com a 3.28
+    if connection.vendor == 'postgresql':
+        _update_from_values(notifications)
+    else:
+        _update_with_cases(notifications)
+
+
+def _update_from_values(notifications):
+    values, params = _values(notifications)
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    charge_table = connection.ops.quote_name(Charge._meta.db_table)
+    transaction_table = connection.ops.quote_name(WirecardTransactionData._meta.db_table)
+    # Colunas do VALUES: column1 = pagamento, column2 = updatedAt, column3 = status da cobrança
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {charge_table} SET status = payment.column3, updated_at = %s '
+            f'FROM {transaction_table} AS wirecard, {values} '
+            f'WHERE wirecard.wirecard_payment_hash = payment.column1 '
+            f'AND {charge_table}.order_id = wirecard.order_id '
+            f'AND (wirecard.payment_event_last_timestamp IS NULL '
+            f'OR wirecard.payment_event_last_timestamp <= payment.column2)',
+            [now] + params,
+        )
+        cursor.execute(
+            f'UPDATE {transaction_table} SET payment_event_last_timestamp = payment.column2, '
+            f'updated_at = %s '
+            f'FROM {values} '
+            f'WHERE {transaction_table}.wirecard_payment_hash = payment.column1 '
+            f'AND ({transaction_table}.payment_event_last_timestamp IS NULL '
+            f'OR {transaction_table}.payment_event_last_timestamp <= payment.column2)',
+            [now] + params,
+        )
+
+
+def _update_with_cases(notifications):
+    # Os pagamentos ficam travados até o fim do lote, o guarda não muda antes dos UPDATEs
+    newer_states = Q()
+    for notification in notifications:
+        newer_states |= Q(wirecard_payment_hash=notification.wirecard_payment_hash) & (
+            Q(payment_event_last_timestamp__isnull=True)
+            | Q(payment_event_last_timestamp__lte=notification.payment_updated_at)
+        )
+    payments = dict(
+        WirecardTransactionData.objects
+        .select_for_update()
+        .filter(newer_states)
+        .values_list('order_id', 'wirecard_payment_hash')
+    )
+    if not payments:
+        return
+    states = {notification.wirecard_payment_hash: notification for notification in notifications}
+    charge_status = {
+        payment: CROSS_SYSTEMS_STATUS_MAPPING[notification.status]
+        for payment, notification in states.items()
+    }
+    now = timezone.now()
+    Charge.objects.filter(order_id__in=payments).update(
+        status=Case(
+            *[
+                When(order_id=order_id, then=Value(charge_status[payment]))
+                for order_id, payment in payments.items()
+            ],
+            output_field=CharField(),
+        ),
+        updated_at=now,
+    )
+    WirecardTransactionData.objects.filter(order_id__in=payments).update(
+        payment_event_last_timestamp=Case(
+            *[
+                When(order_id=order_id, then=Value(states[payment].payment_updated_at))
+                for order_id, payment in payments.items()
+            ],
+            output_field=DateTimeField(),
+        ),
+        updated_at=now,
+    )
+
+
+def apply_pending_notifications():
+    """Apply the pending notifications in batches of WIRECARD_NOTIFICATION_BATCH_SIZE until
+    none is left, returns how many were applied"""
+    applied = 0
+    while True:
+        with transaction.atomic():
+            pending = list(
+                PaymentNotification.objects
+                .filter(applied_at__isnull=True)
+                .order_by('id')[:settings.WIRECARD_NOTIFICATION_BATCH_SIZE]
+            )
+            if not pending:
+                return applied
+            states = [
+                notification for notification in latest_payment_states(pending)
+                if notification.status in CROSS_SYSTEMS_STATUS_MAPPING
+            ]
+            if states:
+                _report_unknown_payments(states)
+                bulk_apply_payment_states(states)
+            (
+                PaymentNotification.objects
+                .filter(id__in=[notification.id for notification in pending])
+                .update(applied_at=timezone.now())
+            )
+        applied += len(pending)
+
+
+def _report_unknown_payments(states):
+    payment_hashes = {notification.wirecard_payment_hash for notification in states}
+    known = set(
+        WirecardTransactionData.objects
+        .filter(wirecard_payment_hash__in=payment_hashes)
+        .values_list('wirecard_payment_hash', flat=True)
+    )
+    # Algumas vezes chegam notificações de pagamentos desconhecidos, como não sabemos se é
+    # devido à falhas na sandbox da wirecard, elas são só enviadas para o sentry
+    if payment_hashes - known:
+        capture_message(f'Notifications of unknown payments: {sorted(payment_hashes - known)}')
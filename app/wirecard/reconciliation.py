@@ -0,0 +1,144 @@
+"""Reconciliation of the charges stuck in processing with their payments on Wirecard.
+
+Charges leave processing through the payment notifications, so a notification lost by
+the webhook leaves the order out of the talent's list. A periodic sweep queries the
+payments of the charges processing for longer than WIRECARD_RECONCILIATION_THRESHOLD and
+applies their states as notifications, through the same batch of the webhook.
+
+Charges that never got the answer of their payment request, unconfirmed or left charging
+by a worker killed mid-charge, have no payment to query. The sweep charges them again in
+background, which looks up the payment on their Wirecard order before sending another.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from sentry_sdk import capture_exception
+
+from orders.models import Charge
+from request_shoutout.domain.models import Charge as DomainCharge
+from .client import get_rate_limiter
+from .models import WirecardTransactionData
+from .notifications import (
+    apply_pending_notifications,
+    CROSS_SYSTEMS_STATUS_MAPPING,
+    store_payment_notification,
+)
+from .services import PaymentStatusApi
+
+
+logger = logging.getLogger(__name__)
+
+
+def stuck_payments(limit):
+    """Payments of the charges processing for too long, the longest stuck first"""
+    threshold = timezone.now() - timedelta(seconds=settings.WIRECARD_RECONCILIATION_THRESHOLD)
+    return list(
+        WirecardTransactionData.objects
+        .filter(
+            order__charge__status=DomainCharge.PROCESSING,
+            order__charge__updated_at__lt=threshold,
+        )
+        .exclude(wirecard_payment_hash='')
+        .order_by('order__charge__updated_at')
+        .values_list('wirecard_payment_hash', flat=True)[:limit]
+    )
+
+
+def _query(payment_api, rate_limiter, wirecard_payment_hash):
+    """Runs in the threads of the sweep, so it only talks to Wirecard, never to the database"""
+    rate_limiter.acquire()
+    try:
+        return payment_api.get(wirecard_payment_hash)
+    except Exception:
+        capture_exception()
+        return None
+
+
+def as_notification(payment):
+    return {
+        'event': f'RECONCILIATION.{payment.status}',
+        'resource': {
+            'payment': {
+                'id': payment.id,
+                'status': payment.status,
+                'updatedAt': payment.updated_at,
+            }
+        }
+    }
+
+
+def sweep_stuck_charges(payment_api=None, rate_limiter=None):
+    """Reconcile up to WIRECARD_RECONCILIATION_MAX_PAYMENTS stuck charges, returns how many
+    of their payments Wirecard reported out of processing"""
+    payment_api = payment_api or PaymentStatusApi()
+    rate_limiter = rate_limiter or get_rate_limiter()
+    payment_hashes = stuck_payments(settings.WIRECARD_RECONCILIATION_MAX_PAYMENTS)
+    if not payment_hashes:
+        return 0
+    with ThreadPoolExecutor(max_workers=settings.WIRECARD_BACKGROUND_CONCURRENCY) as executor:
+        payments = list(executor.map(partial(_query, payment_api, rate_limiter), payment_hashes))
+    payments = [payment for payment in payments if payment]
+    for payment in payments:
+        store_payment_notification(as_notification(payment))
+    apply_pending_notifications()
+    # As cobranças que continuam em processamento só são consultadas de novo depois de outro
+    # período, para não ocuparem a vez das outras nas próximas varreduras
+    (
+        Charge.objects
+        .filter(
+            order__third_party_transaction__wirecard_payment_hash__in=payment_hashes,
+            status=DomainCharge.PROCESSING,
+        )
+        .update(updated_at=timezone.now())
+    )
+    reconciled = [
+        payment for payment in payments
+        if CROSS_SYSTEMS_STATUS_MAPPING.get(payment.status, DomainCharge.PROCESSING)
+        != DomainCharge.PROCESSING
+    ]
+    logger.info(
+        'Reconciled %s of %s charges stuck in processing',
+        len(reconciled),
+        len(payment_hashes),
+    )
+    return len(reconciled)
+
+
+def stranded_charges(limit):
+    """Orders of the charges unconfirmed for too long or charging past their lease, the
+    longest stranded first"""
+    now = timezone.now()
+    threshold = now - timedelta(seconds=settings.WIRECARD_RECONCILIATION_THRESHOLD)
+    expired = now - timedelta(seconds=settings.CHECKOUT_CHARGE_LEASE)
+    return list(
+        Charge.objects
+        .filter(
+            Q(status=DomainCharge.UNCONFIRMED, updated_at__lt=threshold)
+            | Q(status=DomainCharge.CHARGING, updated_at__lt=expired)
+        )
+        .order_by('updated_at')
+        .values_list('order__hash_id', flat=True)[:limit]
+    )
+
+
+def resume_stranded_charges(charger):
+    """Charge again up to WIRECARD_RECONCILIATION_MAX_PAYMENTS stranded charges, returns how
+    many were scheduled"""
+    order_hashes = stranded_charges(settings.WIRECARD_RECONCILIATION_MAX_PAYMENTS)
+    for order_hash in order_hashes:
+        charger(order_hash)
+    # Uma cobrança que continua sem confirmação só é cobrada de novo depois de outro período.
+    # As que estão cobrando não são tocadas, o updated_at delas é o prazo da reserva
+    (
+        Charge.objects
+        .filter(order__hash_id__in=order_hashes, status=DomainCharge.UNCONFIRMED)
+        .update(updated_at=timezone.now())
+    )
+    if order_hashes:
+        logger.info('Charging again %s stranded charges', len(order_hashes))
+    return len(order_hashes)
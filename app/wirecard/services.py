@@ -1,17 +1,27 @@
 import base64
 import json
 import os
-import requests
 from collections import namedtuple
+from functools import lru_cache
+
+import requests
+from django.utils import timezone
 
+from .client import get_client, WirecardUnreachableError
 from .models import WirecardTransactionData
 
 
 WirecardOrder = namedtuple('WirecardOrder', 'id status')
 WirecardPayment = namedtuple('WirecardPayment', 'id status')
+WirecardPaymentStatus = namedtuple('WirecardPaymentStatus', 'id status updated_at')
 
+# Pagamentos criados nesses estados não foram autorizados, a cobrança falha
+FAILED_PAYMENT_STATUSES = ('CANCELLED', 'REFUNDED', 'REVERSED')
 
+
+@lru_cache(maxsize=None)
 def _get_headers():
+    # As credenciais não mudam durante o processo, o digest é calculado uma vez só
     secret = f'{os.environ["WIRECARD_TOKEN"]}:{os.environ["WIRECARD_API_KEY"]}'
     digest = base64.b64encode(bytes(secret, 'utf-8'))
     headers = {
@@ -25,18 +35,32 @@ class WirecardCreateOrderApiError(Exception):
     pass
 
 
+class WirecardOrderApiError(Exception):
+    pass
+
+
 class WirecardCreatePaymentApiError(Exception):
     pass
 
 
+class WirecardPaymentUnconfirmedError(Exception):
+    """The payment request reached Wirecard but its answer was lost, so the payment may
+    have been created"""
+    pass
+
+
 class WirecardCapturePaymentApiError(Exception):
     pass
 
 
+class WirecardPaymentStatusApiError(Exception):
+    pass
+
+
 class OrderApi:
 
     def __init__(self, http_handler=None):
-        self.http_handler = http_handler or requests
+        self.http_handler = http_handler or get_client()
 
     def create(self, order_data):
         payload = {
@@ -97,11 +121,25 @@ class OrderApi:
             )
         return WirecardOrder(id=data['id'], status=data['status'])
 
+    def get_payments(self, wirecard_order_hash):
+        response = self.http_handler.get(
+            url=os.environ['WIRECARD_ORDER_URL'].format(wirecard_order_hash),
+            headers=_get_headers(),
+        )
+        if not response.status_code == 200:
+            raise WirecardOrderApiError(
+                f'{response.status_code} - {response.content.decode("utf-8")}'
+            )
+        return [
+            WirecardPayment(id=payment['id'], status=payment['status'])
+            for payment in response.json().get('payments', [])
+        ]
+
 
 class PaymentApi:
 
     def __init__(self, http_handler=None):
-        self.http_handler = http_handler or requests
+        self.http_handler = http_handler or get_client()
 
     def create(self, order_data, wirecard_order_hash, delay_capture=False):
         payload = {
@@ -139,7 +177,7 @@ class PaymentApi:
                 f'{response.status_code} - {response.content.decode("utf-8")}'
             )
         data = response.json()
-        if data['status'] in ('CANCELLED', 'REFUNDED', 'REVERSED'):
+        if data['status'] in FAILED_PAYMENT_STATUSES:
             raise WirecardCreatePaymentApiError(
                 f'{response.status_code} - {response.content.decode("utf-8")}'
             )
@@ -149,7 +187,7 @@ class PaymentApi:
 class CapturePaymentApi:
 
     def __init__(self, http_handler=None):
-        self.http_handler = http_handler or requests
+        self.http_handler = http_handler or get_client()
 
     def capture(self, wirecard_payment_hash):
         response = self.http_handler.post(
@@ -164,30 +202,94 @@ class CapturePaymentApi:
         return WirecardPayment(id=data['id'], status=data['status'])
 
 
+class PaymentStatusApi:
+
+    def __init__(self, http_handler=None):
+        self.http_handler = http_handler or get_client()
+
+    def get(self, wirecard_payment_hash):
+        response = self.http_handler.get(
+            url=os.environ['WIRECARD_PAYMENT_URL'].format(wirecard_payment_hash),
+            headers=_get_headers(),
+        )
+        if not response.status_code == 200:
+            raise WirecardPaymentStatusApiError(
+                f'{response.status_code} - {response.content.decode("utf-8")}'
+            )
+        data = response.json()
+        return WirecardPaymentStatus(
+            id=data['id'],
+            status=data['status'],
+            updated_at=data['updatedAt'],
+        )
+
+
 class WirecardOrderApi:
+    """The ids of the Wirecard order and payment are checkpointed as soon as they are
+    created, so a new attempt to charge the same order resumes from them instead of
+    creating them again.
+
+    Wirecard has no idempotency key, so the payment request is checkpointed before being
+    sent too: when its answer is lost the next attempt looks the payment up by the order.
+    """
 
     def __init__(self, order_api, payment_api):
         self.order_api = order_api
         self.payment_api = payment_api
 
+    def _checkpoint(self, order_data):
+        return WirecardTransactionData.objects.filter(order_id=order_data.id).first()
+
     def create_order(self, order_data):
-        return self.order_api.create(order_data)
+        checkpoint = self._checkpoint(order_data)
+        if checkpoint:
+            return WirecardOrder(id=checkpoint.wirecard_order_hash, status='CREATED')
+        wirecard_order = self.order_api.create(order_data)
+        WirecardTransactionData.objects.create(
+            order_id=order_data.id,
+            wirecard_order_hash=wirecard_order.id,
+        )
+        return wirecard_order
+
+    def _find_payment(self, wirecard_order_hash):
+        try:
+            payments = self.order_api.get_payments(wirecard_order_hash)
+        except WirecardUnreachableError:
+            raise
+        except Exception as e:
+            raise WirecardPaymentUnconfirmedError(e) from e
+        if not payments:
+            return None
+        payment = payments[-1]
+        if payment.status in FAILED_PAYMENT_STATUSES:
+            raise WirecardCreatePaymentApiError(f'{payment.id} - {payment.status}')
+        return payment
 
     def create_payment(self, order_data, wirecard_order_hash, delay_capture):
-        return self.payment_api.create(order_data, wirecard_order_hash, delay_capture)
+        checkpoint = self._checkpoint(order_data)
+        if checkpoint and checkpoint.wirecard_payment_hash:
+            return WirecardPayment(id=checkpoint.wirecard_payment_hash, status='WAITING')
+        if checkpoint and checkpoint.payment_requested_at:
+            payment = self._find_payment(wirecard_order_hash)
+            if payment:
+                return payment
+        (
+            WirecardTransactionData.objects
+            .filter(order_id=order_data.id)
+            .update(payment_requested_at=timezone.now())
+        )
+        try:
+            return self.payment_api.create(order_data, wirecard_order_hash, delay_capture)
+        except WirecardUnreachableError:
+            raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise WirecardPaymentUnconfirmedError(e) from e
 
     def persist_transaction_data(self, order, wirecard_order_hash, wirecard_payment_hash):
-        WirecardTransactionData.objects.create(
+        WirecardTransactionData.objects.update_or_create(
             order_id=order.id,
-            wirecard_order_hash=wirecard_order_hash,
-            wirecard_payment_hash=wirecard_payment_hash,
+            defaults={
+                'wirecard_order_hash': wirecard_order_hash,
+                'wirecard_payment_hash': wirecard_payment_hash,
+            },
         )
-
-
-class WirecardPaymentApi:
-
-    def __init__(self, capture_payment_api):
-        self.capture_payment_api = capture_payment_api
-
-    def capture_payment(self, wirecard_payment_hash):
-        return self.capture_payment_api.capture(wirecard_payment_hash)
@@ -1,58 +1,43 @@
+from django.conf import settings
 from sentry_sdk import capture_exception
-from dateutil.parser import parse
 
 from project_configuration.celery import app
-from orders.models import Charge
-from request_shoutout.domain.models import Charge as DomainCharge
+from request_shoutout.tasks import charge_in_background
+from .captures import drain_captures
+from .notifications import (
+    apply_pending_notifications,
+    InvalidPaymentNotificationError,
+    store_payment_notification,
+)
+from .reconciliation import resume_stranded_charges, sweep_stuck_charges
 
-from .models import WirecardTransactionData
 
-
-CROSS_SYSTEMS_STATUS_MAPPING = {
-    'WAITING': DomainCharge.PROCESSING,
-    'IN_ANALYSIS': DomainCharge.PROCESSING,
-    'PRE_AUTHORIZED': DomainCharge.PRE_AUTHORIZED,
-    'AUTHORIZED': DomainCharge.PAID,
-    'CANCELLED': DomainCharge.CANCELLED,
-    'REFUNDED': DomainCharge.CANCELLED,
-    'REVERSED': DomainCharge.CANCELLED,
-    'SETTLED': DomainCharge.PAID,
-}
+@app.task
+def apply_payment_notifications():
+    return apply_pending_notifications()
 
 
-def _update_status(wirecard_status, wirecard_payment_hash):
-    (
-        Charge.objects
-        .filter(order__third_party_transaction__wirecard_payment_hash=wirecard_payment_hash)
-        .update(status=CROSS_SYSTEMS_STATUS_MAPPING[wirecard_status])
-    )
+# Notificações enfileiradas antes das notificações passarem a ser guardadas pelo webhook
+@app.task
+def update_payment_status(notification):
+    try:
+        store_payment_notification(notification)
+    except InvalidPaymentNotificationError:
+        capture_exception()
+    else:
+        apply_pending_notifications()
 
 
-def _update_payment_event_timestamp(wirecard_transaction, payment_event_timestamp):
-    wirecard_transaction.payment_event_last_timestamp = payment_event_timestamp
-    wirecard_transaction.save()
+def schedule_capture_drain():
+    drain_capture_queue.apply_async(countdown=settings.WIRECARD_CAPTURE_BATCH_DELAY)
 
 
-def _is_a_delayied_notification(payment_event_timestamp, wirecard_transaction):
-    if wirecard_transaction.payment_event_last_timestamp:
-        return payment_event_timestamp < wirecard_transaction.payment_event_last_timestamp
-    return False
+@app.task
+def drain_capture_queue():
+    return drain_captures()
 
 
 @app.task
-def update_payment_status(notification):
-    payment_event_timestamp = parse(notification['resource']['payment']['updatedAt'])
-    payment_status = notification['resource']['payment']['status']
-    wirecard_payment_hash = notification['resource']['payment']['id']
-    try:
-        wirecard_transaction = (
-            WirecardTransactionData.objects.get(wirecard_payment_hash=wirecard_payment_hash)
-        )
-    # Algumas vezes tem subido essa exceção, como não sabemos se é devido à falhas na sandbox
-    # da wirecard, estamos evitando quebrar a aplicação e enviando a exceção para o sentry
-    except WirecardTransactionData.DoesNotExist:
-        capture_exception()
-    else:
-        if not _is_a_delayied_notification(payment_event_timestamp, wirecard_transaction):
-            _update_status(payment_status, wirecard_payment_hash)
-            _update_payment_event_timestamp(wirecard_transaction, payment_event_timestamp)
+def reconcile_stuck_charges():
+    resume_stranded_charges(charger=charge_in_background)
+    return sweep_stuck_charges()
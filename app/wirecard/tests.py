@@ -6,6 +6,8 @@ from datetime import date, datetime, timezone, timedelta
 from dateutil.parser import parse
 from unittest import mock
 
+import requests
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.test import override_settings, TestCase
 from django.urls import reverse
@@ -20,7 +22,16 @@ from request_shoutout.domain.models import (
     Order as DomainOrder,
 )
 from talents.models import Talent
-from .models import WirecardTransactionData
+from .captures import CaptureQueue, drain_captures
+from .client import build_session, RateLimiter, WirecardClient, WirecardUnreachableError
+from .fake_server import FakeWirecardServer, unreachable_url
+from .models import PaymentCapture, PaymentNotification, WirecardTransactionData
+from .notifications import (
+    apply_pending_notifications,
+    batch_schedules,
+    store_payment_notification,
+)
+from .reconciliation import resume_stranded_charges, sweep_stuck_charges
 from .services import (
     _get_headers,
     CapturePaymentApi,
@@ -428,6 +439,7 @@ class WebhookPaymentTest(APITestCase):
             wirecard_order_hash=FAKE_WIRECARD_ORDER_HASH,
             wirecard_payment_hash=FAKE_WIRECARD_PAYMENT_HASH,
         )
+        batch_schedules.clear()
 
     @override_settings(
         task_eager_propagates=True,
@@ -590,3 +602,475 @@ class WebhookPaymentTest(APITestCase):
         )
         self.charge.refresh_from_db()
         self.assertEqual(self.charge.status, DomainCharge.PRE_AUTHORIZED)
+
+
+def payment_notification(payment_hash, wirecard_status, updated_at):
+    return {
+        'event': f'PAYMENT.{wirecard_status}',
+        'resource': {
+            'payment': {
+                'id': payment_hash,
+                'status': wirecard_status,
+                'updatedAt': updated_at,
+            }
+        }
+    }
+
+
+class PaymentNotificationBatchTest(APITestCase):
+
+    def setUp(self):
+        user = User.objects.create(email='talent@youtuber.com')
+        talent = Talent.objects.create(
+            user=user,
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        self.charges = []
+        for index in range(3):
+            order = Order.objects.create(
+                hash_id=uuid.uuid4(),
+                talent=talent,
+                video_is_for='someone_else',
+                is_from='MJ',
+                is_to='Parker',
+                instruction="Go Get 'em, Tiger",
+                email='mary.jane.watson@spiderman.com',
+                is_public=True,
+                expiration_datetime=datetime.now(timezone.utc) + timedelta(days=5)
+            )
+            self.charges.append(Charge.objects.create(
+                order=order,
+                status=DomainCharge.PROCESSING,
+                amount_paid='150',
+                payment_method='credit_card',
+                payment_date=datetime.now(timezone.utc),
+            ))
+            WirecardTransactionData.objects.create(
+                order=order,
+                wirecard_order_hash=f'ORD-{index}',
+                wirecard_payment_hash=f'PAY-{index}',
+            )
+
+        batch_schedules.clear()
+
+    def statuses(self):
+        return [Charge.objects.get(id=charge.id).status for charge in self.charges]
+
+    @mock.patch('wirecard.views.apply_payment_notifications')
+    def test_burst_of_notifications_should_schedule_a_single_batch(self, mocked_task):
+        notification = payment_notification('PAY-0', 'PRE_AUTHORIZED', '2017-10-23T15:08:39.718-02')
+        self.client.credentials(HTTP_AUTHORIZATION=os.environ['WIRECARD_PAYMENT_WEBHOOK_TOKEN'])
+
+        for _ in range(3):
+            self.client.post(reverse('wirecard:webhook_payment'), notification, format='json')
+        self.client.post(
+            reverse('wirecard:webhook_payment'),
+            payment_notification('PAY-1', 'PRE_AUTHORIZED', '2017-10-23T15:08:39.718-02'),
+            format='json',
+        )
+
+        self.assertEqual(mocked_task.apply_async.call_count, 1)
+        self.assertEqual(PaymentNotification.objects.count(), 2)
+        self.assertEqual(self.statuses(), [DomainCharge.PROCESSING] * 3)
+
+    @mock.patch('wirecard.views.apply_payment_notifications')
+    def test_notification_stored_along_with_others_should_schedule_a_batch(self, mocked_task):
+        # Outro webhook guardou a notificação dele ao mesmo tempo, mas não agendou o lote
+        store_payment_notification(
+            payment_notification('PAY-1', 'PRE_AUTHORIZED', '2017-10-23T15:08:39.718-02')
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=os.environ['WIRECARD_PAYMENT_WEBHOOK_TOKEN'])
+
+        self.client.post(
+            reverse('wirecard:webhook_payment'),
+            payment_notification('PAY-0', 'PRE_AUTHORIZED', '2017-10-23T15:08:39.718-02'),
+            format='json',
+        )
+
+        mocked_task.apply_async.assert_called_once_with(
+            countdown=settings.WIRECARD_NOTIFICATION_BATCH_DELAY,
+        )
+
+    def test_latest_state_of_each_payment_should_be_applied(self):
+        notifications = [
+            payment_notification('PAY-0', 'AUTHORIZED', '2017-10-23T15:10:00.000-02'),
+            payment_notification('PAY-0', 'PRE_AUTHORIZED', '2017-10-23T15:08:39.718-02'),
+            payment_notification('PAY-1', 'IN_ANALYSIS', '2017-10-23T15:08:39.717-02'),
+            payment_notification('PAY-1', 'PRE_AUTHORIZED', '2017-10-23T15:08:39.718-02'),
+            payment_notification('PAY-2', 'CANCELLED', '2017-10-23T15:08:39.718-02'),
+        ]
+        for notification in notifications:
+            store_payment_notification(notification)
+
+        self.assertEqual(apply_pending_notifications(), 5)
+
+        self.assertEqual(self.statuses(), [
+            DomainCharge.PAID,
+            DomainCharge.PRE_AUTHORIZED,
+            DomainCharge.CANCELLED,
+        ])
+        transaction_data = WirecardTransactionData.objects.get(wirecard_payment_hash='PAY-0')
+        self.assertEqual(
+            transaction_data.payment_event_last_timestamp,
+            parse('2017-10-23T15:10:00.000-02'),
+        )
+        self.assertFalse(PaymentNotification.objects.filter(applied_at__isnull=True).exists())
+
+    @override_settings(WIRECARD_NOTIFICATION_BATCH_SIZE=1)
+    def test_state_delayed_to_a_later_batch_should_not_override_a_newer_one(self):
+        store_payment_notification(
+            payment_notification('PAY-0', 'AUTHORIZED', '2017-10-23T15:10:00.000-02')
+        )
+        store_payment_notification(
+            payment_notification('PAY-0', 'IN_ANALYSIS', '2017-10-23T15:08:39.717-02')
+        )
+
+        self.assertEqual(apply_pending_notifications(), 2)
+
+        self.assertEqual(self.statuses()[0], DomainCharge.PAID)
+
+
+class CaptureQueueTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.wirecard = FakeWirecardServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.wirecard.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.wirecard.payments.clear()
+        self.wirecard.failures.clear()
+        environ = mock.patch.dict(os.environ, self.wirecard.environ())
+        environ.start()
+        self.addCleanup(environ.stop)
+        talent = Talent.objects.create(
+            user=User.objects.create(email='talent@youtuber.com'),
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        self.transactions = []
+        for index in range(3):
+            order = Order.objects.create(
+                hash_id=uuid.uuid4(),
+                talent=talent,
+                video_is_for='someone_else',
+                is_from='MJ',
+                is_to='Parker',
+                instruction="Go Get 'em, Tiger",
+                email='mary.jane.watson@spiderman.com',
+                is_public=True,
+                expiration_datetime=datetime.now(timezone.utc) + timedelta(days=5)
+            )
+            payment_hash = self.wirecard.new_id('PAY')
+            self.wirecard.payments[payment_hash] = {'id': payment_hash, 'status': 'PRE_AUTHORIZED'}
+            self.transactions.append(WirecardTransactionData.objects.create(
+                order=order,
+                wirecard_order_hash=self.wirecard.new_id('ORD'),
+                wirecard_payment_hash=payment_hash,
+            ))
+        self.rate_limiter = RateLimiter(rate=1000, burst=3)
+
+    def enqueue_all(self):
+        scheduler = mock.Mock()
+        queue = CaptureQueue(scheduler)
+        for transaction_data in self.transactions + self.transactions:
+            queue.enqueue(transaction_data)
+        self.assertEqual(scheduler.call_count, 3)
+
+    def test_queued_payments_should_be_captured_in_a_batch(self):
+        self.enqueue_all()
+
+        self.assertEqual(drain_captures(rate_limiter=self.rate_limiter), 3)
+
+        self.assertEqual(
+            [payment['status'] for payment in self.wirecard.payments.values()],
+            ['AUTHORIZED'] * 3,
+        )
+        self.assertEqual(
+            PaymentCapture.objects.filter(status=PaymentCapture.CAPTURED).count(),
+            3,
+        )
+
+    @mock.patch('wirecard.captures.send_high_priority_notification')
+    def test_failed_capture_should_be_tried_again_later(self, mocked_notification):
+        self.enqueue_all()
+        self.wirecard.fail('capture', 503)
+
+        self.assertEqual(drain_captures(rate_limiter=self.rate_limiter), 3)
+        self.assertEqual(drain_captures(rate_limiter=self.rate_limiter), 0)
+        capture = PaymentCapture.objects.get(status=PaymentCapture.PENDING)
+        self.assertEqual(capture.attempts, 1)
+        self.assertGreater(capture.next_attempt_at, datetime.now(timezone.utc))
+
+        PaymentCapture.objects.update(next_attempt_at=datetime.now(timezone.utc))
+        self.assertEqual(drain_captures(rate_limiter=self.rate_limiter), 1)
+
+        self.assertEqual(
+            PaymentCapture.objects.filter(status=PaymentCapture.CAPTURED).count(),
+            3,
+        )
+        mocked_notification.assert_not_called()
+
+    @override_settings(WIRECARD_CAPTURE_MAX_ATTEMPTS=2)
+    @mock.patch('wirecard.captures.send_high_priority_notification')
+    def test_captures_that_keep_failing_should_be_alerted_together(self, mocked_notification):
+        self.enqueue_all()
+        self.wirecard.fail('capture', 503, times=6)
+
+        drain_captures(rate_limiter=self.rate_limiter)
+        PaymentCapture.objects.update(next_attempt_at=datetime.now(timezone.utc))
+        drain_captures(rate_limiter=self.rate_limiter)
+        drain_captures(rate_limiter=self.rate_limiter)
+
+        self.assertEqual(
+            PaymentCapture.objects.filter(status=PaymentCapture.FAILED).count(),
+            3,
+        )
+        self.assertEqual(mocked_notification.call_count, 1)
+        message = mocked_notification.call_args[0][0]
+        self.assertIn('3 PAGAMENTO(S)', message)
+        for transaction_data in self.transactions:
+            self.assertIn(transaction_data.wirecard_payment_hash, message)
+
+    def test_capture_locked_by_another_drain_should_be_skipped(self):
+        self.enqueue_all()
+        PaymentCapture.objects.filter(transaction=self.transactions[0]).update(
+            locked_until=datetime.now(timezone.utc) + timedelta(minutes=1),
+        )
+
+        self.assertEqual(drain_captures(rate_limiter=self.rate_limiter), 2)
+
+
+class RateLimiterTest(TestCase):
+
+    @mock.patch('wirecard.client.time')
+    def test_requests_beyond_the_burst_should_wait_for_the_rate(self, mocked_time):
+        clock = [0.0]
+        mocked_time.monotonic.side_effect = lambda: clock[0]
+        mocked_time.sleep.side_effect = lambda seconds: clock.__setitem__(0, clock[0] + seconds)
+        rate_limiter = RateLimiter(rate=2, burst=2)
+
+        for _ in range(6):
+            rate_limiter.acquire()
+
+        self.assertAlmostEqual(clock[0], 2.0)
+
+
+class ChargeReconciliationTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.wirecard = FakeWirecardServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.wirecard.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.wirecard.payments.clear()
+        self.wirecard.failures.clear()
+        del self.wirecard.requests[:]
+        environ = mock.patch.dict(os.environ, self.wirecard.environ())
+        environ.start()
+        self.addCleanup(environ.stop)
+        self.talent = Talent.objects.create(
+            user=User.objects.create(email='talent@youtuber.com'),
+            phone_number=1,
+            area_code=1,
+            main_social_media='',
+            social_media_username='',
+            number_of_followers=1,
+        )
+        self.rate_limiter = RateLimiter(rate=1000, burst=3)
+
+    def create_charge(self, wirecard_status, stuck_for):
+        order = Order.objects.create(
+            hash_id=uuid.uuid4(),
+            talent=self.talent,
+            video_is_for='someone_else',
+            is_from='MJ',
+            is_to='Parker',
+            instruction="Go Get 'em, Tiger",
+            email='mary.jane.watson@spiderman.com',
+            is_public=True,
+            expiration_datetime=datetime.now(timezone.utc) + timedelta(days=5)
+        )
+        charge = Charge.objects.create(
+            order=order,
+            status=DomainCharge.PROCESSING,
+            amount_paid='150',
+            payment_method='credit_card',
+            payment_date=datetime.now(timezone.utc),
+        )
+        Charge.objects.filter(id=charge.id).update(
+            updated_at=datetime.now(timezone.utc) - stuck_for,
+        )
+        payment_hash = self.wirecard.new_id('PAY')
+        self.wirecard.payments[payment_hash] = {
+            'id': payment_hash,
+            'status': wirecard_status,
+            'updatedAt': '2017-10-23T15:08:39.718-02',
+        }
+        WirecardTransactionData.objects.create(
+            order=order,
+            wirecard_order_hash=self.wirecard.new_id('ORD'),
+            wirecard_payment_hash=payment_hash,
+        )
+        return charge
+
+    def status(self, charge):
+        return Charge.objects.get(id=charge.id).status
+
+    def payment_queries(self):
+        return [route for route, _ in self.wirecard.requests if route == 'payment']
+
+    def test_stuck_charges_should_get_the_status_of_their_payments(self):
+        pre_authorized = self.create_charge('PRE_AUTHORIZED', timedelta(hours=2))
+        paid = self.create_charge('AUTHORIZED', timedelta(hours=1))
+        waiting = self.create_charge('WAITING', timedelta(hours=1))
+        recent = self.create_charge('PRE_AUTHORIZED', timedelta(minutes=1))
+
+        self.assertEqual(sweep_stuck_charges(rate_limiter=self.rate_limiter), 2)
+
+        self.assertEqual(self.status(pre_authorized), DomainCharge.PRE_AUTHORIZED)
+        self.assertEqual(self.status(paid), DomainCharge.PAID)
+        self.assertEqual(self.status(waiting), DomainCharge.PROCESSING)
+        self.assertEqual(self.status(recent), DomainCharge.PROCESSING)
+        self.assertEqual(len(self.payment_queries()), 3)
+
+    def test_charge_still_processing_should_wait_another_threshold(self):
+        self.create_charge('WAITING', timedelta(hours=1))
+
+        sweep_stuck_charges(rate_limiter=self.rate_limiter)
+        sweep_stuck_charges(rate_limiter=self.rate_limiter)
+
+        self.assertEqual(len(self.payment_queries()), 1)
+
+    @override_settings(WIRECARD_RECONCILIATION_MAX_PAYMENTS=2)
+    def test_sweep_should_query_up_to_the_max_payments_longest_stuck_first(self):
+        charges = [
+            self.create_charge('PRE_AUTHORIZED', timedelta(hours=hours)) for hours in (1, 3, 2)
+        ]
+
+        sweep_stuck_charges(rate_limiter=self.rate_limiter)
+
+        self.assertEqual([self.status(charge) for charge in charges], [
+            DomainCharge.PROCESSING,
+            DomainCharge.PRE_AUTHORIZED,
+            DomainCharge.PRE_AUTHORIZED,
+        ])
+
+    def test_failed_query_should_not_stop_the_sweep(self):
+        charges = [self.create_charge('PRE_AUTHORIZED', timedelta(hours=1)) for _ in range(3)]
+        self.wirecard.fail('payment', 503)
+
+        self.assertEqual(sweep_stuck_charges(rate_limiter=self.rate_limiter), 2)
+
+        statuses = sorted(self.status(charge) for charge in charges)
+        self.assertEqual(statuses, [
+            DomainCharge.PRE_AUTHORIZED,
+            DomainCharge.PRE_AUTHORIZED,
+            DomainCharge.PROCESSING,
+        ])
+
+
+    @override_settings(CHECKOUT_CHARGE_LEASE=60)
+    def test_unconfirmed_and_abandoned_charges_should_be_charged_again(self):
+        unconfirmed = self.create_charge('PRE_AUTHORIZED', timedelta(hours=1))
+        abandoned = self.create_charge('PRE_AUTHORIZED', timedelta(minutes=2))
+        charging = self.create_charge('PRE_AUTHORIZED', timedelta(seconds=10))
+        recent = self.create_charge('PRE_AUTHORIZED', timedelta(minutes=1))
+        Charge.objects.filter(id__in=[unconfirmed.id, recent.id]).update(
+            status=DomainCharge.UNCONFIRMED
+        )
+        Charge.objects.filter(id__in=[abandoned.id, charging.id]).update(
+            status=DomainCharge.CHARGING
+        )
+        charger = mock.Mock()
+
+        self.assertEqual(resume_stranded_charges(charger), 2)
+        self.assertEqual(resume_stranded_charges(charger), 1)
+
+        self.assertEqual(charger.call_args_list, [
+            mock.call(unconfirmed.order.hash_id),
+            mock.call(abandoned.order.hash_id),
+            mock.call(abandoned.order.hash_id),
+        ])
+        self.assertEqual(self.payment_queries(), [])
+
+class WirecardClientTest(TestCase):
+
+    def test_requests_should_share_the_session_with_timeouts(self):
+        session = mock.Mock()
+        client = WirecardClient(session=session, timeout=(1, 2))
+
+        client.post(url='https://sandbox.moip.com.br/v2/orders', data='{}', headers={'a': 'b'})
+        client.post(url='https://sandbox.moip.com.br/v2/orders', data='{}', headers={'a': 'b'})
+
+        expected_call = mock.call(
+            'POST',
+            'https://sandbox.moip.com.br/v2/orders',
+            timeout=(1, 2),
+            data='{}',
+            headers={'a': 'b'},
+        )
+        self.assertEqual(session.request.mock_calls, [expected_call, expected_call])
+
+    @override_settings(WIRECARD_POOL_SIZE=7)
+    def test_session_should_keep_a_pool_of_connections(self):
+        adapter = build_session().get_adapter('https://sandbox.moip.com.br/v2/orders')
+
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 0)
+
+    @override_settings(WIRECARD_LATENCY_REPORT_INTERVAL=2)
+    def test_latencies_should_be_reported_by_endpoint(self):
+        client = WirecardClient(session=mock.Mock(), timeout=(1, 2))
+        payment_urls = [
+            f'https://sandbox.moip.com.br/v2/orders/ORD-{order}/payments' for order in ('A1', 'B2')
+        ]
+
+        with self.assertLogs('wirecard.client', 'INFO') as logs:
+            for url in payment_urls:
+                client.post(url=url)
+            client.post(url='https://sandbox.moip.com.br/v2/orders')
+
+        self.assertEqual(list(client.latencies), [
+            'POST /v2/orders/{ORD}/payments',
+            'POST /v2/orders',
+        ])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('POST /v2/orders/{ORD}/payments: 2 requests', logs.output[0])
+
+    def test_refused_connection_should_be_told_apart_from_a_dropped_one(self):
+        client = WirecardClient(timeout=(1, 2))
+
+        with self.assertRaises(WirecardUnreachableError):
+            client.post(url=unreachable_url('/v2/orders'), data='{}')
+        with FakeWirecardServer() as wirecard:
+            wirecard.fail('orders')
+            with self.assertRaises(requests.ConnectionError) as raised:
+                client.post(
+                    url=f'{wirecard.url}/v2/orders',
+                    data='{"ownId": "1", "items": []}',
+                    headers=_get_headers(),
+                )
+        self.assertEqual(len(wirecard.orders), 1)
+        self.assertNotIsInstance(raised.exception, WirecardUnreachableError)
+
+    def test_auth_headers_should_be_built_once(self):
+        self.assertIs(_get_headers(), _get_headers())
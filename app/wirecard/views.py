@@ -1,11 +1,17 @@
 import os
 
+from django.conf import settings
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from sentry_sdk import capture_message
+from sentry_sdk import capture_exception, capture_message
 
-from .tasks import update_payment_status
+from .notifications import (
+    InvalidPaymentNotificationError,
+    should_schedule_batch,
+    store_payment_notification,
+)
+from .tasks import apply_payment_notifications
 
 
 class WebhookPaymentAPIView(APIView):
@@ -13,7 +19,15 @@ class WebhookPaymentAPIView(APIView):
 
     def post(self, request, *args, **kwargs):
         if request.META['HTTP_AUTHORIZATION'] == os.environ['WIRECARD_PAYMENT_WEBHOOK_TOKEN']:
-            update_payment_status.delay(request.data)
+            try:
+                created = store_payment_notification(request.data)
+            except InvalidPaymentNotificationError:
+                capture_exception()
+            else:
+                if created and should_schedule_batch():
+                    apply_payment_notifications.apply_async(
+                        countdown=settings.WIRECARD_NOTIFICATION_BATCH_DELAY,
+                    )
         else:
             capture_message(f'UNAUTHORIZED REQUEST | META: {request.META} | DATA: {request.data}')
         return Response({}, status.HTTP_200_OK)